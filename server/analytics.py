@@ -0,0 +1,222 @@
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import case, func, select, union
+from models import Course, Event, Attendance, CourseProgress
+from dashboard import user_course_ids
+from dialects import day_of, day_number, week_start
+from insights import DEADLINE_TYPES, DEFAULT_WEEKS, week_of, week_window
+from pagination import parse_date
+from recurrence import occurrences, parse_rule
+from serialization import isoformat
+
+# Aggregates for the charts: attendance rates by course or week, the
+# distribution of course progress, deadlines per week and study streaks.
+#
+# Everything is grouped in SQL (window functions supply running totals and
+# the streaks' gaps-and-islands), so a response holds one entry per bucket
+# however many rows sit behind it. Recurring deadlines are the exception:
+# their occurrences are expanded in Python, as in the calendar. Weeks start
+# on Monday on both backends. Buckets without rows are omitted, except the
+# fixed progress buckets. Responses go through the per-user response cache,
+# which every write already invalidates.
+#
+#   GET /api/analytics/attendance?by=week&weeks=12
+
+MAX_WEEKS = 104
+ATTENDANCE_GROUPS = ('course', 'week')
+PROGRESS_BUCKETS = tuple(range(0, 101, 10))
+
+def _rate(present, total):
+    # Rounded like the dashboard's insight rows
+    return round(present * 100 / total) if total else None
+
+def _present(status_column):
+    return func.coalesce(func.sum(case((status_column == 'present', 1), else_=0)), 0)
+
+# Attendance
+
+def attendance_by_course_statement(user_id):
+    present = _present(Attendance.status)
+    total = func.count(Attendance.id)
+    return (
+        select(Course.id, Course.title, total.label('total'), present.label('present'))
+        .outerjoin(Attendance, Attendance.course_id == Course.id)
+        .where(Course.user_id == user_id)
+        .group_by(Course.id, Course.title)
+        .order_by(Course.id)
+    )
+
+def attendance_by_week_statement(dialect_name, user_id, weeks=DEFAULT_WEEKS):
+    first, last = week_window(weeks)
+    week = week_start(Attendance.date, dialect_name)
+    weekly = (
+        select(week.label('week'), func.count().label('total'), _present(Attendance.status).label('present'))
+        .where(Attendance.course_id.in_(user_course_ids(user_id)),
+               Attendance.date.between(first, last + timedelta(days=6)))
+        .group_by(week)
+        .subquery()
+    )
+    return (
+        select(weekly.c.week, weekly.c.total, weekly.c.present,
+               func.sum(weekly.c.present).over(order_by=weekly.c.week).label('running_present'),
+               func.sum(weekly.c.total).over(order_by=weekly.c.week).label('running_total'))
+        .order_by(weekly.c.week)
+    )
+
+def assemble_attendance(group, rows):
+    if group == 'course':
+        return [{
+            'courseId': row.id,
+            'title': row.title,
+            'present': row.present,
+            'total': row.total,
+            'rate': _rate(row.present, row.total),
+        } for row in rows]
+    return [{
+        'weekStarting': isoformat(row.week),
+        'present': row.present,
+        'total': row.total,
+        'rate': _rate(row.present, row.total),
+        'runningRate': _rate(row.running_present, row.running_total),
+    } for row in rows]
+
+# Progress
+
+def progress_statement(user_id):
+    # Courses per 10% bucket (100 is its own bucket), with the totals across
+    # all buckets repeated on every row
+    completed = func.coalesce(Course.completed_sections, 0)
+    percent = case((Course.total_sections > 0, completed * 100 // Course.total_sections),
+                   else_=func.coalesce(Course.progress, 0))
+    courses = (
+        select(percent.label('percent'), completed.label('completed'),
+               func.coalesce(Course.total_sections, 0).label('sections'))
+        .where(Course.user_id == user_id)
+        .subquery()
+    )
+    bucket = case((courses.c.percent >= 100, 100), (courses.c.percent < 0, 0), else_=courses.c.percent // 10 * 10)
+    buckets = (
+        select(bucket.label('bucket'), courses.c.percent, courses.c.completed, courses.c.sections)
+        .subquery()
+    )
+    return (
+        select(buckets.c.bucket, func.count().label('courses'),
+               func.sum(func.count()).over().label('total_courses'),
+               func.sum(func.sum(buckets.c.percent)).over().label('total_percent'),
+               func.sum(func.sum(buckets.c.completed)).over().label('completed_sections'),
+               func.sum(func.sum(buckets.c.sections)).over().label('total_sections'))
+        .group_by(buckets.c.bucket)
+        .order_by(buckets.c.bucket)
+    )
+
+def assemble_progress(rows):
+    rows = list(rows)
+    counts = {row.bucket: row.courses for row in rows}
+    totals = rows[0] if rows else None
+    courses = int(totals.total_courses) if totals else 0
+    completed = int(totals.completed_sections) if totals else 0
+    sections = int(totals.total_sections) if totals else 0
+    return {
+        'buckets': [{'from': start, 'to': min(start + 9, 100), 'courses': counts.get(start, 0)}
+                    for start in PROGRESS_BUCKETS],
+        'courses': courses,
+        'averageProgress': round(totals.total_percent / courses) if courses else None,
+        'completedSections': completed,
+        'totalSections': sections,
+        'overallProgress': round(completed * 100 / sections) if sections else 0,
+    }
+
+# Deadlines
+
+def deadline_window(args, today=None):
+    # Monday of the week containing `from` (default: this week), `weeks` on
+    first = week_of(parse_date(args['from'], 'from') if args.get('from') else today or date.today())
+    return first, first + timedelta(weeks=parse_weeks(args), days=-1)
+
+def deadline_statements(dialect_name, user_id, first, last):
+    # (one-off deadlines counted per week and type, series still running)
+    course_ids = user_course_ids(user_id)
+    week = week_start(Event.date, dialect_name)
+    single = (
+        select(week.label('week'), Event.type, func.count().label('count'))
+        .where(Event.course_id.in_(course_ids), Event.type.in_(DEADLINE_TYPES),
+               Event.series_end.is_(None), Event.date.between(first, last))
+        .group_by(week, Event.type)
+    )
+    series = (
+        select(Event.date, Event.type, Event.recurrence)
+        .where(Event.course_id.in_(course_ids), Event.type.in_(DEADLINE_TYPES), Event.series_end >= first)
+    )
+    return single, series
+
+def assemble_deadlines(single_rows, series_rows, first, last):
+    weeks = defaultdict(lambda: dict.fromkeys(DEADLINE_TYPES, 0))
+    for row in single_rows:
+        weeks[row.week][row.type] += row.count
+    for row in series_rows:
+        for day in occurrences(row.date, parse_rule(row.recurrence), first, last):
+            weeks[week_of(day)][row.type] += 1
+    return [
+        {'weekStarting': isoformat(week), 'total': sum(counts.values()), **counts}
+        for week, counts in sorted(weeks.items())
+    ]
+
+# Streaks
+
+def streak_statement(dialect_name, user_id, today=None):
+    # Study days, up to today, are days with attendance marked present or
+    # progress logged. Consecutive days share `day number - row number`, so
+    # grouping by that gives the streaks; the latest one comes back with the
+    # overall figures.
+    today = today or date.today()
+    days = union(
+        select(Attendance.date.label('day'))
+        .where(Attendance.course_id.in_(user_course_ids(user_id)), Attendance.status == 'present',
+               Attendance.date <= today),
+        select(day_of(CourseProgress.created_at, dialect_name).label('day'))
+        .where(CourseProgress.user_id == user_id, CourseProgress.delta > 0,
+               CourseProgress.created_at < datetime.combine(today + timedelta(days=1), time.min)),
+    ).subquery()
+    numbered = select(
+        days.c.day, (day_number(days.c.day, dialect_name) - func.row_number().over(order_by=days.c.day)).label('island')
+    ).subquery()
+    streaks = (
+        select(func.min(numbered.c.day).label('first_day'), func.max(numbered.c.day).label('last_day'),
+               func.count().label('days'))
+        .group_by(numbered.c.island)
+        .subquery()
+    )
+    return (
+        select(streaks.c.first_day, streaks.c.last_day, streaks.c.days,
+               func.max(streaks.c.days).over().label('longest'),
+               func.sum(streaks.c.days).over().label('active_days'))
+        .order_by(streaks.c.last_day.desc())
+        .limit(1)
+    )
+
+def assemble_streak(row, today=None):
+    # A streak is current until a whole day passes without studying
+    today = today or date.today()
+    current = row is not None and row.last_day >= today - timedelta(days=1)
+    return {
+        'current': row.days if current else 0,
+        'currentSince': isoformat(row.first_day) if current else None,
+        'longest': row.longest if row else 0,
+        'activeDays': int(row.active_days) if row else 0,
+        'lastActive': isoformat(row.last_day) if row else None,
+    }
+
+# Query parameters
+
+def parse_weeks(args):
+    try:
+        weeks = int(args.get('weeks', DEFAULT_WEEKS))
+    except ValueError:
+        raise ValueError("weeks must be an integer")
+    return min(max(weeks, 1), MAX_WEEKS)
+
+def parse_attendance_group(args):
+    group = args.get('by', 'course')
+    if group not in ATTENDANCE_GROUPS:
+        raise ValueError(f"by must be one of {', '.join(ATTENDANCE_GROUPS)}")
+    return group
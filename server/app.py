@@ -1,40 +1,94 @@
-from flask import Flask, request, jsonify, session
+from flask import Blueprint, Flask, current_app, g, redirect, request, jsonify, Response, send_file, session, url_for
 from flask_cors import CORS
-from models import db, User, Course, Event, Attendance, Recommendation, Insight
-import os
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import configure_mappers
+from sqlalchemy.orm.exc import StaleDataError
+from models import db, User, Course, Event, Attendance, Recommendation, Job
+from bulk import BulkError, parse_payload, import_rows, export_response, mark_attendance
+from auth import auth, login_required, throttled, start_session, end_session, claims_user, REFRESH
+from cache import cache
+from notify import notifier
+from jobs import enqueue, deliver
+from dashboard import build_dashboard, parse_sections, parse_fields, user_course_ids
+from migrations import upgrade, schema_cli
+from insights import (DEFAULT_WEEKS, weekly_insights, record_progress, record_event,
+                      record_attendance, record_attendance_status)
+from recommendations import refresh_courses
+from pagination import (parse_date, parse_time, parse_int, filter_query, paginate, paginated_response,
+                        NEXT_CURSOR_HEADER)
+from serialization import row_query, serialize_rows, json_response, list_response, stream_response, dumps
+from recurrence import CALENDAR_BATCH_SIZE, parse_window, calendar_selects, expand, series_end, normalize_rule
+from sync import changes, record_deletions
+from search import reindex, unindex, parse_search, search_statement, assemble_results
+from analytics import (attendance_by_course_statement, attendance_by_week_statement, assemble_attendance,
+                       progress_statement, assemble_progress, deadline_window, deadline_statements,
+                       assemble_deadlines, streak_statement, assemble_streak, parse_weeks, parse_attendance_group)
+from config import load_config
+from engines import init_engines, dispose_engines
+from metrics import metrics
+from passwords import passwords
+from idempotency import idempotency
+from preconditions import etag, parse_if_match, matches, conflict_status
+from progress import progress_percent, parse_progress_update, increment_statement
+from archive import parse_archive_query, read_archive, hot_from, live_since
+from images import images, FetchError, parse_width, REDIRECT_MAX_AGE, VARIANT_MAX_AGE
 from dotenv import load_dotenv
-from functools import wraps
-import secrets
-
-# Load environment variables
-load_dotenv()
-
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', secrets.token_hex(16))
-CORS(app, supports_credentials=True)
-
-# Initialize the database
-db.init_app(app)
-
-# Create tables
-with app.app_context():
-    db.create_all()
-
-# Authentication decorator
-def login_required(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
-            return jsonify({"error": "Unauthorized"}), 401
-        return f(*args, **kwargs)
-    return decorated_function
+
+# The Flask app, built by create_app() so that importing this module touches
+# neither the environment nor the database: workers, scripts and tooling
+# import it cheaply and build the app they need. The schema is upgraded
+# explicitly with `flask schema upgrade` (or on start when
+# SCHEMA_AUTO_UPGRADE is set, as in the testing profile). wsgi.py builds the
+# app gunicorn serves; gunicorn.conf.py preloads and warms it once in the
+# master so forked workers start on shared, already-initialized state.
+#
+#   flask --app app schema upgrade && gunicorn -c gunicorn.conf.py
+
+api = Blueprint('api', __name__)
+
+# Courses and attendance records go out with their version as the ETag
+def versioned(response, version):
+    response.headers['ETag'] = etag(version)
+    return response
+
+def precondition_failed(version):
+    return versioned(jsonify({"error": "Precondition failed; fetch the latest version and retry"}), version), 412
 
 # Auth routes
-@app.route('/api/auth/register', methods=['POST'])
+def rate_limited(account=None):
+    # 429 response when the client IP or the account is over its limit
+    retry_after = auth.limiter.hit_ip(request.remote_addr)
+    if retry_after is None and account:
+        retry_after = auth.limiter.check_account(account)
+    return throttled(retry_after) if retry_after else None
+
+def authenticate_password(data):
+    # (user, None) for valid credentials, else (None, error response)
+    limited = rate_limited(data['email'])
+    if limited:
+        return None, limited
+    
+    # Find user by email
+    user = User.query.filter_by(email=data['email']).first()
+    
+    # Check if user exists and password is correct
+    if not user or not user.check_password(data['password']):
+        auth.limiter.fail_account(data['email'])
+        return None, (jsonify({"error": "Invalid email or password"}), 401)
+    
+    # Upgrade hashes made under an older hashing policy
+    if user.password_needs_rehash():
+        user.set_password(data['password'])
+        db.session.commit()
+    
+    return user, None
+
+@api.route('/api/auth/register', methods=['POST'])
 def register():
     data = request.json
+    limited = rate_limited()
+    if limited:
+        return limited
     
     # Check if user already exists
     if User.query.filter_by(email=data['email']).first():
@@ -54,54 +108,91 @@ def register():
     db.session.commit()
     
     # Auto login after registration
-    session['user_id'] = user.id
+    start_session(session, user)
     
     return jsonify(user.to_dict()), 201
 
-@app.route('/api/auth/login', methods=['POST'])
+@api.route('/api/auth/login', methods=['POST'])
 def login():
-    data = request.json
-    
-    # Find user by email
-    user = User.query.filter_by(email=data['email']).first()
-    
-    # Check if user exists and password is correct
-    if not user or not user.check_password(data['password']):
-        return jsonify({"error": "Invalid email or password"}), 401
+    user, failed = authenticate_password(request.json)
+    if failed:
+        return failed
     
     # Set session
-    session['user_id'] = user.id
+    start_session(session, user)
     
     return jsonify(user.to_dict())
 
-@app.route('/api/auth/logout', methods=['POST'])
+@api.route('/api/auth/token', methods=['POST'])
+def issue_token():
+    user, failed = authenticate_password(request.json)
+    if failed:
+        return failed
+    
+    return jsonify(auth.tokens.issue(user))
+
+@api.route('/api/auth/refresh', methods=['POST'])
+def refresh_token():
+    claims = auth.tokens.verify((request.json or {}).get('refreshToken', ''), REFRESH)
+    user = db.session.get(User, claims['sub']) if claims else None
+    if not user or user.token_version != claims['ver']:
+        return jsonify({"error": "Invalid refresh token"}), 401
+    
+    return jsonify(auth.tokens.issue(user))
+
+@api.route('/api/auth/logout', methods=['POST'])
 def logout():
-    session.pop('user_id', None)
+    # Token clients logging out revoke every refresh token they were issued
+    claims = auth.authenticate(request.headers.get('Authorization'), {})
+    if claims:
+        User.query.filter_by(id=claims['sub']).update({User.token_version: User.token_version + 1})
+        db.session.commit()
+    
+    end_session(session)
     return jsonify({"message": "Logged out successfully"})
 
-@app.route('/api/auth/user', methods=['GET'])
+@api.route('/api/auth/user', methods=['GET'])
 @login_required
 def get_current_user():
-    user = User.query.get(session['user_id'])
+    # Sessions and tokens carry the user's details, so no lookup is needed
+    if 'username' in g.user_claims:
+        return jsonify(claims_user(g.user_claims))
+    
+    user = db.session.get(User, g.user_id)
     if not user:
-        session.pop('user_id', None)
+        end_session(session)
         return jsonify({"error": "User not found"}), 404
     
+    # Sessions from before tokens existed get the claims filled in
+    start_session(session, user)
     return jsonify(user.to_dict())
 
 # Routes for Courses
-@app.route('/api/courses', methods=['GET'])
+@api.route('/api/courses', methods=['GET'])
 @login_required
+@cache.cached('courses', headers=(NEXT_CURSOR_HEADER,))
 def get_courses():
-    user_id = session.get('user_id')
-    courses = Course.query.filter_by(user_id=user_id).all()
-    return jsonify([course.to_dict() for course in courses])
+    user_id = g.user_id
+    query = row_query('courses').filter(Course.user_id == user_id)
+    try:
+        query = filter_query(query, request.args, Course.created_at)
+        courses, next_cursor = paginate(query, Course.created_at, Course.id, request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return paginated_response(serialize_rows('courses', courses), next_cursor)
 
-@app.route('/api/courses', methods=['POST'])
+@api.route('/api/courses', methods=['POST'])
 @login_required
+@idempotency.idempotent
 def add_course():
     data = request.json
-    user_id = session.get('user_id')
+    user_id = g.user_id
+    try:
+        start_date = parse_date(data['startDate'], 'startDate') if data.get('startDate') else None
+        end_date = parse_date(data['endDate'], 'endDate') if data.get('endDate') else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
     course = Course(
         title=data['title'],
@@ -110,155 +201,585 @@ def add_course():
         progress=data['progress'],
         total_sections=data['totalSections'],
         completed_sections=data['completedSections'],
-        start_date=data['startDate'],
-        end_date=data['endDate'],
+        start_date=start_date,
+        end_date=end_date,
         image_url=data['imageUrl'],
         user_id=user_id
     )
     db.session.add(course)
+    db.session.flush()
+    reindex(db.session.connection(), 'courses', Course.id == course.id)
+    refresh_courses([course.id])
     db.session.commit()
-    return jsonify(course.to_dict()), 201
+    cache.invalidate_user(user_id)
+    notifier.publish(user_id, 'courses', 'recommendations')
+    return versioned(jsonify(course.to_dict()), course.version), 201
 
-@app.route('/api/courses/<int:course_id>', methods=['PUT'])
+@api.route('/api/courses/<int:course_id>', methods=['PUT'])
 @login_required
 def update_course(course_id):
-    course = Course.query.get_or_404(course_id)
-    
-    # Check if the course belongs to the logged-in user
-    if course.user_id != session.get('user_id'):
-        return jsonify({"error": "Unauthorized"}), 403
+    user_id = g.user_id
+    try:
+        if_match = parse_if_match(request.headers.get('If-Match'))
+        completed, increment = parse_progress_update(request.json)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
-    data = request.json
+    if increment is not None:
+        # Atomic increment: concurrent requests add up
+        course = db.session.execute(increment_statement(course_id, user_id, increment, if_match)).scalar()
+        if course is None:
+            current = db.session.get(Course, course_id)
+            if current is None:
+                return jsonify({"error": "Not found"}), 404
+            if current.user_id != user_id:
+                return jsonify({"error": "Unauthorized"}), 403
+            return precondition_failed(current.version)
+        record_progress(user_id, course.id, increment)
+    else:
+        course = Course.query.get_or_404(course_id)
+        
+        # Check if the course belongs to the logged-in user
+        if course.user_id != user_id:
+            return jsonify({"error": "Unauthorized"}), 403
+        if not matches(if_match, course.version):
+            return precondition_failed(course.version)
+        
+        if completed is not None:
+            previous = course.completed_sections or 0
+            course.completed_sections = completed
+            course.progress = progress_percent(completed, course.total_sections, course.progress)
+            record_progress(user_id, course.id, completed - previous)
     
-    if 'completedSections' in data:
-        course.completed_sections = data['completedSections']
-        course.progress = round((course.completed_sections / course.total_sections) * 100)
-    
-    db.session.commit()
-    return jsonify(course.to_dict())
+    try:
+        refresh_courses([course.id])
+        db.session.commit()
+    except StaleDataError:
+        db.session.rollback()
+        return jsonify({"error": "Course was modified by another request"}), conflict_status(if_match)
+    cache.invalidate_user(user_id)
+    notifier.publish(user_id, 'courses', 'recommendations', 'insights')
+    return versioned(jsonify(course.to_dict()), course.version)
 
 # Routes for Events
-@app.route('/api/events', methods=['GET'])
+@api.route('/api/events', methods=['GET'])
 @login_required
+@cache.cached('events', headers=(NEXT_CURSOR_HEADER,))
 def get_events():
-    user_id = session.get('user_id')
-    # Get courses for this user
-    user_courses = Course.query.filter_by(user_id=user_id).all()
-    course_ids = [course.id for course in user_courses]
+    user_id = g.user_id
+    # Courses for this user, resolved inside the same query
+    course_ids = user_course_ids(user_id)
     
     # Get events for these courses
-    events = Event.query.filter(Event.course_id.in_(course_ids)).all()
-    return jsonify([event.to_dict() for event in events])
+    query = row_query('events').filter(Event.course_id.in_(course_ids))
+    try:
+        query = filter_query(query, request.args, Event.date, course_column=Event.course_id,
+                             type_column=Event.type,
+                             default_filter=live_since('events', hot_from(current_app.config)))
+        events, next_cursor = paginate(query, Event.date, Event.id, request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return paginated_response(serialize_rows('events', events), next_cursor)
 
-@app.route('/api/events', methods=['POST'])
+@api.route('/api/events', methods=['POST'])
 @login_required
+@idempotency.idempotent
 def add_event():
     data = request.json
     
     # Verify the course belongs to the user
     course = Course.query.get_or_404(data['courseId'])
-    if course.user_id != session.get('user_id'):
+    if course.user_id != g.user_id:
         return jsonify({"error": "Unauthorized"}), 403
     
+    try:
+        event_date = parse_date(data['date'], 'date')
+        event_time = parse_time(data['time'], 'time')
+        recurrence = normalize_rule(data.get('recurrence'))
+        last_date = series_end(event_date, recurrence)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
     event = Event(
         title=data['title'],
-        date=data['date'],
-        time=data['time'],
+        date=event_date,
+        time=event_time,
         type=data['type'],
         course_id=data['courseId'],
-        description=data.get('description', '')
+        description=data.get('description', ''),
+        recurrence=recurrence,
+        series_end=last_date
     )
     db.session.add(event)
+    db.session.flush()
+    reindex(db.session.connection(), 'events', Event.id == event.id)
+    record_event(course.user_id, event.date, event.type, event.recurrence)
+    refresh_courses([course.id])
     db.session.commit()
+    cache.invalidate_user(course.user_id)
+    notifier.publish(course.user_id, 'events', 'recommendations', 'insights')
     return jsonify(event.to_dict()), 201
 
-@app.route('/api/events/<int:event_id>', methods=['DELETE'])
+@api.route('/api/events/<int:event_id>', methods=['DELETE'])
 @login_required
 def delete_event(event_id):
     event = Event.query.get_or_404(event_id)
     
     # Verify the event's course belongs to the user
     course = Course.query.get_or_404(event.course_id)
-    if course.user_id != session.get('user_id'):
+    if course.user_id != g.user_id:
         return jsonify({"error": "Unauthorized"}), 403
     
     db.session.delete(event)
+    record_deletions(db.session.connection(), 'events', [(event.id, course.user_id)])
+    unindex(db.session.connection(), 'events', [event.id])
+    record_event(course.user_id, event.date, event.type, event.recurrence, sign=-1)
+    refresh_courses([course.id])
     db.session.commit()
+    cache.invalidate_user(course.user_id)
+    notifier.publish(course.user_id, 'events', 'recommendations', 'insights')
     return '', 204
 
+# Calendar: events expanded into occurrences within a date window
+@api.route('/api/calendar', methods=['GET'])
+@login_required
+def get_calendar():
+    try:
+        window_start, window_end = parse_window(request.args)
+        course_id = parse_int(request.args['courseId'], 'courseId') if request.args.get('courseId') else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    single, series = calendar_selects(user_course_ids(g.user_id), window_start, window_end,
+                                      course_id, request.args.get('type'))
+    series_rows = db.session.execute(series).all()
+    single_rows = db.session.execute(single.execution_options(yield_per=CALENDAR_BATCH_SIZE))
+    return stream_response(expand(single_rows, series_rows, window_start, window_end))
+
 # Routes for Attendance
-@app.route('/api/attendance', methods=['GET'])
+@api.route('/api/attendance', methods=['GET'])
 @login_required
+@cache.cached('attendance', headers=(NEXT_CURSOR_HEADER,))
 def get_attendance():
-    user_id = session.get('user_id')
-    # Get courses for this user
-    user_courses = Course.query.filter_by(user_id=user_id).all()
-    course_ids = [course.id for course in user_courses]
+    user_id = g.user_id
+    # Courses for this user, resolved inside the same query
+    course_ids = user_course_ids(user_id)
     
     # Get attendance records for these courses
-    attendance_records = Attendance.query.filter(Attendance.course_id.in_(course_ids)).all()
-    return jsonify([record.to_dict() for record in attendance_records])
+    query = row_query('attendance').filter(Attendance.course_id.in_(course_ids))
+    try:
+        query = filter_query(query, request.args, Attendance.date, course_column=Attendance.course_id,
+                             status_column=Attendance.status,
+                             default_filter=live_since('attendance', hot_from(current_app.config)))
+        attendance_records, next_cursor = paginate(query, Attendance.date, Attendance.id, request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return paginated_response(serialize_rows('attendance', attendance_records), next_cursor)
 
-@app.route('/api/attendance', methods=['POST'])
+@api.route('/api/attendance', methods=['POST'])
 @login_required
+@idempotency.idempotent
 def add_attendance():
     data = request.json
     
     # Verify the course belongs to the user
     course = Course.query.get_or_404(data['courseId'])
-    if course.user_id != session.get('user_id'):
+    if course.user_id != g.user_id:
         return jsonify({"error": "Unauthorized"}), 403
     
+    try:
+        attendance_date = parse_date(data['date'], 'date')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
     attendance = Attendance(
         course_id=data['courseId'],
-        date=data['date'],
+        date=attendance_date,
         status=data['status'],
         notes=data.get('notes', '')
     )
     db.session.add(attendance)
+    try:
+        db.session.flush()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"error": "Attendance already recorded for this course and date"}), 409
+    
+    reindex(db.session.connection(), 'attendance', Attendance.id == attendance.id)
+    record_attendance(course.user_id, attendance.date, attendance.status)
+    refresh_courses([course.id])
     db.session.commit()
-    return jsonify(attendance.to_dict()), 201
+    cache.invalidate_user(course.user_id)
+    notifier.publish(course.user_id, 'attendance', 'recommendations', 'insights')
+    return versioned(jsonify(attendance.to_dict()), attendance.version), 201
 
-@app.route('/api/attendance/<int:record_id>', methods=['PUT'])
+@api.route('/api/attendance/mark', methods=['POST'])
+@login_required
+@idempotency.idempotent
+def mark_attendance_batch():
+    user_id = g.user_id
+    data = request.json
+    marks = data.get('marks') if isinstance(data, dict) else data
+    if not isinstance(marks, list):
+        return jsonify({"error": "Expected a list of marks"}), 400
+    
+    try:
+        diff = mark_attendance(user_id, marks)
+    except BulkError as e:
+        return jsonify({"error": e.message, "errors": e.errors}), e.status
+    db.session.commit()
+    
+    if diff['created'] or diff['updated']:
+        cache.invalidate_user(user_id)
+        notifier.publish(user_id, 'attendance', 'recommendations', 'insights')
+    return jsonify(diff)
+
+@api.route('/api/attendance/<int:record_id>', methods=['PUT'])
 @login_required
 def update_attendance(record_id):
     record = Attendance.query.get_or_404(record_id)
     
     # Verify the attendance record's course belongs to the user
     course = Course.query.get_or_404(record.course_id)
-    if course.user_id != session.get('user_id'):
+    if course.user_id != g.user_id:
         return jsonify({"error": "Unauthorized"}), 403
     
-    data = request.json
+    if_match = parse_if_match(request.headers.get('If-Match'))
+    if not matches(if_match, record.version):
+        return precondition_failed(record.version)
     
-    if 'status' in data:
-        record.status = data['status']
-    if 'notes' in data:
-        record.notes = data['notes']
+    data = request.json
     
-    db.session.commit()
-    return jsonify(record.to_dict())
+    try:
+        if 'status' in data:
+            record_attendance_status(course.user_id, record.date, record.status, data['status'])
+            record.status = data['status']
+        if 'notes' in data:
+            record.notes = data['notes']
+            db.session.flush()
+            reindex(db.session.connection(), 'attendance', Attendance.id == record.id)
+        
+        refresh_courses([course.id])
+        db.session.commit()
+    except StaleDataError:
+        db.session.rollback()
+        return jsonify({"error": "Attendance record was modified by another request"}), conflict_status(if_match)
+    cache.invalidate_user(course.user_id)
+    notifier.publish(course.user_id, 'attendance', 'recommendations', 'insights')
+    return versioned(jsonify(record.to_dict()), record.version)
 
 # Routes for Recommendations
-@app.route('/api/recommendations', methods=['GET'])
+@api.route('/api/recommendations', methods=['GET'])
 @login_required
+@cache.cached('recommendations', headers=(NEXT_CURSOR_HEADER,))
 def get_recommendations():
-    user_id = session.get('user_id')
-    # Get courses for this user
-    user_courses = Course.query.filter_by(user_id=user_id).all()
-    course_ids = [course.id for course in user_courses]
+    user_id = g.user_id
+    # Courses for this user, resolved inside the same query
+    course_ids = user_course_ids(user_id)
     
     # Get recommendations for these courses
-    recommendations = Recommendation.query.filter(Recommendation.course_id.in_(course_ids)).all()
-    return jsonify([rec.to_dict() for rec in recommendations])
+    query = row_query('recommendations').filter(Recommendation.course_id.in_(course_ids))
+    try:
+        query = filter_query(query, request.args, Recommendation.created_at,
+                             course_column=Recommendation.course_id)
+        recommendations, next_cursor = paginate(query, Recommendation.created_at, Recommendation.id, request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return paginated_response(serialize_rows('recommendations', recommendations), next_cursor)
+
+@api.route('/api/recommendations/refresh', methods=['POST'])
+@login_required
+@idempotency.idempotent
+def refresh_recommendations():
+    job = enqueue('recommendations.refresh', user_id=g.user_id)
+    db.session.commit()
+    return job_accepted(job)
+
+# Bulk import/export
+@api.route('/api/<any(courses, events, attendance):resource>/import', methods=['POST'])
+@login_required
+@idempotency.idempotent
+def bulk_import(resource):
+    user_id = g.user_id
+    partial = request.args.get('partial', '').lower() in ('1', 'true')
+    try:
+        records = parse_payload(request.content_type, request.get_data())
+        if request.args.get('async', '').lower() in ('1', 'true'):
+            # Validate and insert in a worker; poll the job for the result
+            job = enqueue('import', {'resource': resource, 'records': records, 'partial': partial}, user_id)
+            db.session.commit()
+            return job_accepted(job)
+        result = import_rows(resource, user_id, records, partial=partial)
+    except BulkError as e:
+        return jsonify({"error": e.message, "errors": e.errors}), e.status
+    db.session.commit()
+    
+    cache.invalidate_user(user_id)
+    notifier.publish(user_id, resource, 'recommendations', 'insights')
+    return jsonify(result), 201 if result['imported'] else 200
+
+@api.route('/api/<any(courses, events, attendance):resource>/export', methods=['GET'])
+@login_required
+def bulk_export(resource):
+    try:
+        return export_response(resource, g.user_id, request.args.get('format', 'ndjson'))
+    except BulkError as e:
+        return jsonify({"error": e.message}), e.status
+
+# Dashboard snapshot: every collection in one round trip
+@api.route('/api/dashboard', methods=['GET'])
+@login_required
+@cache.cached('dashboard')
+def get_dashboard():
+    user_id = g.user_id
+    try:
+        sections = parse_sections(request.args.get('sections'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    snapshot = build_dashboard(user_id, hot_from(current_app.config), sections, parse_fields(request.args))
+    return json_response(snapshot)
+
+# Delta sync: rows changed or deleted since the client's last sync token
+@api.route('/api/sync', methods=['GET'])
+@login_required
+def get_sync():
+    # A lagging replica could hide changes from before the new token for good
+    g.use_replica = False
+    try:
+        return json_response(changes(db.session, g.user_id, request.args.get('since')))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+# Search across the user's courses, events, attendance notes and recommendations
+@api.route('/api/search', methods=['GET'])
+@login_required
+def search():
+    try:
+        terms, types, limit = parse_search(request.args)
+        statement = search_statement(db.engine.dialect.name, g.user_id, terms, types, limit)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except NotImplementedError as e:
+        return jsonify({"error": str(e)}), 501
+    
+    return json_response(assemble_results(db.session.execute(statement)))
+
+# Live updates: a server-sent event naming the resources that changed; see
+# notify.py. Each open stream holds a worker thread.
+@api.route('/api/stream', methods=['GET'])
+@login_required
+def stream():
+    # Started here rather than in create_app, so each forked worker listens
+    notifier.broker.start()
+    subscription = notifier.hub.subscribe(g.user_id, threaded=True)
+    
+    def events():
+        try:
+            yield b'retry: 5000\n\n'
+            while True:
+                resources = subscription.changes(notifier.coalesce, notifier.heartbeat)
+                if resources is None:
+                    # Keeps proxies from closing an idle stream
+                    yield b': keep-alive\n\n'
+                else:
+                    yield b'event: change\ndata: ' + dumps({'resources': resources}) + b'\n\n'
+        finally:
+            notifier.hub.unsubscribe(subscription)
+    
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 # Routes for Insights
-@app.route('/api/insights', methods=['GET'])
+@api.route('/api/insights', methods=['GET'])
 @login_required
+@cache.cached('insights')
 def get_insights():
-    # For now, return all insights (in a real app, these would be user-specific)
-    insights = Insight.query.all()
-    return jsonify([insight.to_dict() for insight in insights])
+    try:
+        weeks = min(max(int(request.args.get('weeks', DEFAULT_WEEKS)), 1), 104)
+    except ValueError:
+        return jsonify({"error": "weeks must be an integer"}), 400
+    
+    return json_response(weekly_insights(g.user_id, weeks))
+
+@api.route('/api/insights/rebuild', methods=['POST'])
+@login_required
+@idempotency.idempotent
+def rebuild_insights():
+    job = enqueue('insights.rebuild', user_id=g.user_id)
+    db.session.commit()
+    return job_accepted(job)
+
+# Analytics: aggregates computed in SQL, one entry per bucket
+@api.route('/api/analytics/attendance', methods=['GET'])
+@login_required
+@cache.cached('analytics.attendance')
+def get_attendance_analytics():
+    try:
+        group = parse_attendance_group(request.args)
+        weeks = parse_weeks(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    if group == 'course':
+        statement = attendance_by_course_statement(g.user_id)
+    else:
+        statement = attendance_by_week_statement(db.engine.dialect.name, g.user_id, weeks)
+    return json_response(assemble_attendance(group, db.session.execute(statement)))
+
+@api.route('/api/analytics/progress', methods=['GET'])
+@login_required
+@cache.cached('analytics.progress')
+def get_progress_analytics():
+    return json_response(assemble_progress(db.session.execute(progress_statement(g.user_id))))
+
+@api.route('/api/analytics/deadlines', methods=['GET'])
+@login_required
+@cache.cached('analytics.deadlines')
+def get_deadline_analytics():
+    try:
+        first, last = deadline_window(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    single, series = deadline_statements(db.engine.dialect.name, g.user_id, first, last)
+    return json_response(assemble_deadlines(db.session.execute(single), db.session.execute(series), first, last))
+
+@api.route('/api/analytics/streak', methods=['GET'])
+@login_required
+@cache.cached('analytics.streak')
+def get_streak():
+    row = db.session.execute(streak_statement(db.engine.dialect.name, g.user_id)).first()
+    return json_response(assemble_streak(row))
+
+# Archived terms of events and attendance, read back from ARCHIVE_DIR
+@api.route('/api/<any(events, attendance):resource>/archive', methods=['GET'])
+@login_required
+def get_archive(resource):
+    try:
+        course_id, first, last = parse_archive_query(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    course_ids = set(db.session.scalars(user_course_ids(g.user_id)))
+    if course_id is not None:
+        course_ids &= {course_id}
+    items = read_archive(current_app.config['ARCHIVE_DIR'], resource, course_ids, first, last) if course_ids else []
+    return list_response(items)
+
+# Course cover images: a short-lived redirect to a resized variant that is
+# named by its source's digest, so the variant itself can be cached forever
+@api.route('/api/images/<int:course_id>', methods=['GET'])
+@login_required
+def get_course_image(course_id):
+    try:
+        width = parse_width(request.args.get('w'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    course = Course.query.get_or_404(course_id)
+    if course.user_id != g.user_id:
+        return jsonify({"error": "Unauthorized"}), 403
+    if not course.image_url:
+        return jsonify({"error": "Course has no image"}), 404
+    
+    try:
+        digest = images.source_digest(course.image_url)
+    except FetchError as e:
+        return jsonify({"error": str(e)}), 502
+    name = images.variant_name(digest, width, request.headers.get('Accept', ''))
+    response = redirect(url_for('api.get_image_variant', digest=digest, name=name))
+    response.cache_control.private = True
+    response.cache_control.max_age = REDIRECT_MAX_AGE
+    response.vary.add('Accept')
+    return response
+
+@api.route('/api/images/<digest>/<name>', methods=['GET'])
+def get_image_variant(digest, name):
+    # No login: the digest is only handed out to the course's owner
+    try:
+        variant = images.variant(digest, name)
+    except FetchError as e:
+        return jsonify({"error": str(e)}), 502
+    if variant is None:
+        return jsonify({"error": "Image not found"}), 404
+    
+    path, mimetype = variant
+    response = send_file(path, mimetype=mimetype, etag=f'{digest}-{name}', max_age=VARIANT_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+# Routes for Jobs
+def job_accepted(job):
+    response = jsonify(job.to_dict())
+    response.headers['Location'] = f'/api/jobs/{job.id}'
+    return response, 202
+
+@api.route('/api/jobs', methods=['GET'])
+@login_required
+def get_jobs():
+    g.use_replica = False
+    jobs = (
+        Job.query.filter_by(user_id=g.user_id)
+        .order_by(Job.created_at.desc(), Job.id.desc())
+        .limit(50)
+        .all()
+    )
+    deliver(jobs)
+    return jsonify([job.to_dict() for job in jobs])
+
+@api.route('/api/jobs/<int:job_id>', methods=['GET'])
+@login_required
+def get_job(job_id):
+    # Polled for completion, so always read from the primary
+    g.use_replica = False
+    job = Job.query.get_or_404(job_id)
+    if job.user_id != g.user_id:
+        return jsonify({"error": "Unauthorized"}), 403
+    
+    deliver([job])
+    return jsonify(job.to_dict())
+
+def create_app(config=None):
+    if config is None:
+        load_dotenv()
+        config = load_config()
+    app = Flask(__name__)
+    app.config.from_mapping(config)
+    CORS(app, supports_credentials=True, expose_headers=[NEXT_CURSOR_HEADER])
+    
+    # Engines are created here but connect on first use
+    db.init_app(app)
+    init_engines(app, db)
+    metrics.init_app(app, db)
+    cache.init_app(app)
+    notifier.init_app(app)
+    auth.init_app(app)
+    idempotency.init_app(app)
+    images.init_app(app)
+    passwords.configure(app.config)
+    app.register_blueprint(api)
+    app.cli.add_command(schema_cli)
+    
+    if app.config['SCHEMA_AUTO_UPGRADE']:
+        with app.app_context():
+            upgrade(db.engine)
+    return app
+
+def warm_up(app):
+    # Work every worker would otherwise repeat on its first request; done once
+    # before forking, it is shared copy-on-write
+    configure_mappers()
+    app.url_map.update()
+    with app.app_context():
+        dispose_engines(db)
 
 if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        upgrade(db.engine)
     app.run(debug=True)
\ No newline at end of file
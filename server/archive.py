@@ -0,0 +1,296 @@
+import argparse
+import gzip
+import json
+import os
+from datetime import date, datetime
+from sqlalchemy import delete, func, insert, or_, select, text
+from models import db, Course, Event, Attendance, ArchiveRun
+from pagination import parse_date, parse_int
+from search import unindex
+from serialization import row_select, serialize_rows
+from sync import record_deletions
+
+# Term partitions for attendance and events, and archival of closed terms.
+#
+# A term is TERM_MONTHS long, starting in January or July. On Postgres both
+# tables are range-partitioned by date, one partition per term plus a
+# default one for dates past the last partition, so a query bounded by date
+# only reads the terms it covers; event and attendance lists and the
+# dashboard default to the ARCHIVE_HOT_TERMS latest terms (live_since). The
+# primary key is (id, date), as it must include the partition key. SQLite
+# keeps one table per resource: every query, the search index and delta
+# sync address the table by name, so the per-term split happens at archival
+# instead, and the date bound is served by the (course_id, date) indexes.
+#
+# `python archive.py archive` moves rows older than the last
+# ARCHIVE_HOT_TERMS terms out of the database into gzipped NDJSON files
+# under ARCHIVE_DIR, one file per term and run, in the list endpoints' JSON
+# shape. A recurring event is archived by the term its series ends in.
+# Archived rows get sync tombstones and leave the search index; on Postgres
+# their emptied partitions are dropped. Each run is recorded in archive_runs:
+# the weekly insight rollups before its cutoff are kept, and `insights.py
+# rebuild` and `verify` leave those weeks alone.
+# GET /api/<events|attendance>/archive reads the files back on demand.
+#
+#   python archive.py archive --before 2026-01-01
+#   python archive.py partitions
+
+TERM_MONTHS = 6
+ARCHIVE_BATCH_SIZE = 1000
+PARTITIONED = {'attendance': Attendance, 'events': Event}
+
+# Terms
+
+def term_start(day):
+    return date(day.year, (day.month - 1) // TERM_MONTHS * TERM_MONTHS + 1, 1)
+
+def next_term(start):
+    month = start.month - 1 + TERM_MONTHS
+    return date(start.year + month // 12, month % 12 + 1, 1)
+
+def terms_between(first, last):
+    # Start of every term from the one containing `first` to the one containing `last`
+    start = term_start(first)
+    while start <= last:
+        yield start
+        start = next_term(start)
+
+def archive_cutoff(today, hot_terms):
+    # First day that stays live: the start of the oldest hot term
+    start = term_start(today)
+    for _ in range(hot_terms - 1):
+        month = start.month - 1 - TERM_MONTHS
+        start = date(start.year + month // 12, month % 12 + 1, 1)
+    return start
+
+def hot_from(config):
+    # Default lower date bound of event and attendance lists: older terms are
+    # only read when a client asks for them with `from`
+    return archive_cutoff(date.today(), config['ARCHIVE_HOT_TERMS'])
+
+def live_since(resource, since):
+    # Rows still live at `since`, the complement of _closed(): a series that
+    # started earlier stays until it ends
+    if resource == 'events':
+        return or_(Event.date >= since, Event.series_end >= since)
+    return Attendance.date >= since
+
+# Postgres partitions
+
+def _partition_name(table_name, start):
+    return f'{table_name}_p{start:%Y%m}'
+
+def _partitions(connection, table_name):
+    # {term start: partition name} of the table's term partitions
+    names = connection.scalars(text(
+        'SELECT child.relname FROM pg_inherits '
+        'JOIN pg_class parent ON parent.oid = pg_inherits.inhparent '
+        'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+        'WHERE parent.relname = :table_name'
+    ), {'table_name': table_name})
+    prefix = f'{table_name}_p'
+    return {datetime.strptime(name[len(prefix):], '%Y%m').date(): name
+            for name in names if name.startswith(prefix)}
+
+def _create_partition(connection, table_name, start):
+    # Rows for the term may already sit in the default partition, which
+    # would make the new partition's bounds overlap; move them across
+    name = _partition_name(table_name, start)
+    bounds = {'start': start, 'end': next_term(start)}
+    connection.execute(text(
+        f'CREATE TEMPORARY TABLE {name}_moving ON COMMIT DROP AS '
+        f'SELECT * FROM {table_name}_default WHERE date >= :start AND date < :end'
+    ), bounds)
+    connection.execute(text(f'DELETE FROM {table_name}_default WHERE date >= :start AND date < :end'), bounds)
+    connection.execute(text(
+        f"CREATE TABLE {name} PARTITION OF {table_name} "
+        f"FOR VALUES FROM ('{bounds['start']}') TO ('{bounds['end']}')"
+    ))
+    connection.execute(text(f'INSERT INTO {table_name} SELECT * FROM {name}_moving'))
+
+def ensure_partitions(connection, through):
+    # Term partitions up to the one containing `through`, on Postgres
+    if connection.dialect.name != 'postgresql':
+        return 0
+    created = 0
+    for table_name in PARTITIONED:
+        existing = _partitions(connection, table_name)
+        first = min(existing, default=term_start(date.today()))
+        for start in terms_between(first, through):
+            if start not in existing:
+                _create_partition(connection, table_name, start)
+                created += 1
+    return created
+
+def partition_table(connection, table_name, through):
+    # Rebuilds an existing table as a partitioned one with the same columns,
+    # defaults, foreign key and indexes. The primary key of a partitioned
+    # table must include the partition key, so it becomes (id, date); the
+    # id sequence keeps ids unique on their own.
+    table = db.metadata.tables[table_name]
+    old = f'{table_name}_unpartitioned'
+    first, = connection.execute(select(func.min(table.c.date))).one()
+    sequence = connection.scalar(text(f"SELECT pg_get_serial_sequence('{table_name}', 'id')"))
+
+    connection.execute(text(f'ALTER TABLE {table_name} RENAME TO {old}'))
+    for index in table.indexes:
+        connection.execute(text(f'DROP INDEX IF EXISTS {index.name}'))
+    connection.execute(text(
+        f'CREATE TABLE {table_name} (LIKE {old} INCLUDING DEFAULTS) PARTITION BY RANGE (date)'
+    ))
+    connection.execute(text(f'CREATE TABLE {table_name}_default PARTITION OF {table_name} DEFAULT'))
+    for start in terms_between(first or through, through):
+        connection.execute(text(
+            f"CREATE TABLE {_partition_name(table_name, start)} PARTITION OF {table_name} "
+            f"FOR VALUES FROM ('{start}') TO ('{next_term(start)}')"
+        ))
+    connection.execute(text(f'INSERT INTO {table_name} SELECT * FROM {old}'))
+    connection.execute(text(f'ALTER SEQUENCE {sequence} OWNED BY {table_name}.id'))
+    connection.execute(text(f'DROP TABLE {old}'))
+
+    connection.execute(text(f'ALTER TABLE {table_name} ADD PRIMARY KEY (id, date)'))
+    connection.execute(text(
+        f'ALTER TABLE {table_name} ADD FOREIGN KEY (course_id) REFERENCES courses (id)'
+    ))
+    for index in table.indexes:
+        index.create(connection)
+
+def drop_partitions(connection, before):
+    # Drops term partitions that end on or before `before`; archival has
+    # emptied them
+    dropped = 0
+    for table_name in PARTITIONED:
+        for start, name in _partitions(connection, table_name).items():
+            if next_term(start) <= before:
+                connection.execute(text(f'DROP TABLE {name}'))
+                dropped += 1
+    return dropped
+
+# Archival
+
+def _closed(resource, before):
+    if resource == 'events':
+        # One-off events by their date, series once they have ended
+        return or_(
+            (Event.series_end.is_(None)) & (Event.date < before),
+            Event.series_end < before,
+        )
+    return Attendance.date < before
+
+def _archive_key(resource, row):
+    return row.series_end or row.date if resource == 'events' else row.date
+
+def _archive_file(directory, resource, start, stamp):
+    return os.path.join(directory, resource, f'{start}--{next_term(start)}.{stamp}.ndjson.gz')
+
+def _archive_resource(connection, directory, resource, before, stamp, batch_size):
+    model = PARTITIONED[resource]
+    extra = (Course.user_id, Event.series_end) if resource == 'events' else (Course.user_id,)
+    rows = connection.execute(
+        row_select(resource).add_columns(*extra)
+        .join(Course, Course.id == model.course_id)
+        .where(_closed(resource, before))
+        .order_by(model.id)
+        .execution_options(yield_per=batch_size)
+    )
+
+    # Files are written next to their final name and renamed into place
+    # before the rows are deleted: a failed run leaves the rows live and at
+    # worst a duplicate archive copy, which reads ignore
+    files, archived = {}, []
+    os.makedirs(os.path.join(directory, resource), exist_ok=True)
+    try:
+        for row in rows:
+            start = term_start(_archive_key(resource, row)) if _archive_key(resource, row) else None
+            path = _archive_file(directory, resource, start or date.min, stamp)
+            if path not in files:
+                files[path] = gzip.open(path + '.tmp', 'wt', encoding='utf-8')
+            item = serialize_rows(resource, [row])[0]
+            if resource == 'events':
+                item['seriesEnd'] = row.series_end.isoformat() if row.series_end else None
+            files[path].write(json.dumps(item, sort_keys=True, separators=(',', ':')) + '\n')
+            archived.append((row.id, row.user_id))
+    finally:
+        for handle in files.values():
+            handle.close()
+    for path in files:
+        os.replace(path + '.tmp', path)
+
+    ids = [row_id for row_id, _ in archived]
+    for offset in range(0, len(ids), batch_size):
+        connection.execute(delete(model).where(model.id.in_(ids[offset:offset + batch_size])))
+    record_deletions(connection, resource, archived)
+    unindex(connection, resource, ids)
+    return archived
+
+def archive(connection, directory, before, batch_size=ARCHIVE_BATCH_SIZE):
+    # Moves every row closed before `before` into the archive; returns the
+    # (row id, owning user id) pairs archived per resource
+    stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+    archived = {resource: _archive_resource(connection, directory, resource, before, stamp, batch_size)
+                for resource in PARTITIONED}
+    connection.execute(insert(ArchiveRun).values(before=before))
+    if connection.dialect.name == 'postgresql':
+        drop_partitions(connection, term_start(before))
+    return archived
+
+def read_archive(directory, resource, course_ids, first=None, last=None):
+    # Archived rows of the given courses overlapping [first, last], oldest
+    # first. Only files of terms ending before `first` are skipped, since a
+    # series is filed under the term it ended in.
+    course_ids = set(course_ids)
+    folder = os.path.join(directory, resource)
+    items = {}
+    for name in sorted(os.listdir(folder)) if os.path.isdir(folder) else ():
+        if not name.endswith('.ndjson.gz'):
+            continue
+        end = date.fromisoformat(name.split('.')[0].split('--')[1])
+        if first is not None and end <= first:
+            continue
+        with gzip.open(os.path.join(folder, name), 'rt', encoding='utf-8') as handle:
+            for line in handle:
+                item = json.loads(line)
+                if item['courseId'] not in course_ids:
+                    continue
+                if first is not None and (item.get('seriesEnd') or item['date'] or '') < first.isoformat():
+                    continue
+                if last is not None and (item['date'] or '') > last.isoformat():
+                    continue
+                items[item['id']] = item
+    return sorted(items.values(), key=lambda item: (item['date'] or '', item['id']))
+
+def parse_archive_query(args):
+    # (course id or None, first date, last date) for the archive endpoint
+    first = parse_date(args['from'], 'from') if args.get('from') else None
+    last = parse_date(args['to'], 'to') if args.get('to') else None
+    if first is not None and last is not None and first > last:
+        raise ValueError("from must not be after to")
+    course_id = parse_int(args['courseId'], 'courseId') if args.get('courseId') else None
+    return course_id, first, last
+
+if __name__ == '__main__':
+    from app import create_app
+    from cache import cache
+
+    app = create_app()
+
+    parser = argparse.ArgumentParser(description='Term partitions and archival of closed terms')
+    parser.add_argument('command', choices=['archive', 'partitions'])
+    parser.add_argument('--before', type=date.fromisoformat,
+                        help='archive rows closed before this date, YYYY-MM-DD '
+                             '(default: the start of the oldest of ARCHIVE_HOT_TERMS terms)')
+    args = parser.parse_args()
+
+    today = date.today()
+    with app.app_context():
+        with db.engine.begin() as connection:
+            if args.command == 'archive':
+                before = args.before or archive_cutoff(today, app.config['ARCHIVE_HOT_TERMS'])
+                archived = archive(connection, app.config['ARCHIVE_DIR'], before)
+                print(', '.join(f'Archived {len(rows)} {resource}' for resource, rows in archived.items()))
+            created = ensure_partitions(connection, next_term(term_start(today)))
+            if connection.dialect.name == 'postgresql':
+                print(f"Created {created} partitions")
+        if args.command == 'archive':
+            for user_id in {user_id for rows in archived.values() for _, user_id in rows}:
+                cache.invalidate_user(user_id)
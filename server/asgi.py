@@ -0,0 +1,1089 @@
+import asyncio
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime
+from functools import wraps
+from dotenv import load_dotenv
+from flask.json.tag import TaggedJSONSerializer
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import http_date
+from sqlalchemy import select, update
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import HTTPConnection
+from starlette.responses import FileResponse, RedirectResponse, Response, StreamingResponse
+from starlette.routing import Route
+from auth import auth, start_session, end_session, claims_user, REFRESH
+from models import User, Course, Event, Attendance, Recommendation, Job
+from archive import parse_archive_query, read_archive, hot_from, live_since
+from bulk import (BulkError, EXPORT_FORMATS, MODELS as BULK_MODELS, parse_payload, import_rows, mark_attendance,
+                  export_select, export_encoder, export_headers)
+from images import images, FetchError, parse_width, REDIRECT_MAX_AGE, VARIANT_MAX_AGE
+from jobs import enqueue, claim_delivery, announce
+from cache import cache, not_modified
+from notify import notifier
+from config import load_config, engine_options
+from metrics import metrics, MetricsMiddleware, EXPOSITION_TYPE
+from dashboard import dashboard_statements, assemble_dashboard, parse_sections, parse_fields, user_course_ids
+from engines import READ_METHODS, configure_sqlite
+from insights import (DEFAULT_WEEKS, weekly_insights_statement, record_progress, record_event,
+                      record_attendance, record_attendance_status)
+from migrations import upgrade_connection
+from pagination import (parse_date, parse_time, parse_int, filter_query, keyset_page, split_page,
+                        NEXT_CURSOR_HEADER)
+from passwords import passwords
+from idempotency import (HEADER as IDEMPOTENCY_HEADER, DuplicateRequest, idempotency, parse_key, fingerprint,
+                         key_statement, complete_statement, replay, INTERNAL_ERROR)
+from preconditions import etag, parse_if_match, matches, conflict_status
+from progress import progress_percent, parse_progress_update, increment_statement
+from recommendations import refresh_courses
+from recurrence import parse_window, calendar_selects, expand, series_end, normalize_rule
+from serialization import row_select, serialize_rows, stream_list, dumps
+from sync import parse_since, sync_statements, assemble_changes, record_deletions
+from search import reindex, unindex, parse_search, search_statement, assemble_results
+from analytics import (attendance_by_course_statement, attendance_by_week_statement, assemble_attendance,
+                       progress_statement, assemble_progress, deadline_window, deadline_statements,
+                       assemble_deadlines, streak_statement, assemble_streak, parse_weeks, parse_attendance_group)
+
+# ASGI entry point: the routes of app.py on async SQLAlchemy sessions.
+#
+#   uvicorn asgi:app --workers 2
+#
+# Shapes and status codes match app.py, and the session cookie is Flask's,
+# so a client can switch between the two servers without logging in again.
+# GETs go through the same read-through response cache, and requests through
+# the same metrics, as app.py's. Password hashing runs on a bounded thread
+# pool, and the cache, notifier and rate limiter calls (Redis round trips) on
+# Starlette's, so neither blocks the event loop. Rollup and recommendation updates reuse the synchronous helpers via
+# run_sync, inside the same transaction as the write.
+
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'sqlite+pysqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'postgresql+psycopg2': 'postgresql+asyncpg',
+}
+
+INSTANCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance')
+
+def async_url(url):
+    url = make_url(url)
+    url = url.set(drivername=ASYNC_DRIVERS.get(url.drivername, url.drivername))
+    if url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:') \
+            and not os.path.isabs(url.database):
+        # Relative SQLite paths resolve against the instance folder, as
+        # Flask-SQLAlchemy does for app.py
+        os.makedirs(INSTANCE_PATH, exist_ok=True)
+        url = url.set(database=os.path.join(INSTANCE_PATH, url.database))
+    return url
+
+def create_engine_for(url, settings):
+    url = async_url(url)
+    options = engine_options(url, settings)
+    if url.get_backend_name() == 'sqlite':
+        # aiosqlite defaults to NullPool; keep connections like the sync engine does
+        in_memory = url.database in (None, '', ':memory:')
+        options['poolclass'] = StaticPool if in_memory else AsyncAdaptedQueuePool
+    if url.drivername == 'postgresql+asyncpg' and 'connect_args' in options:
+        options['connect_args'] = {'server_settings': {'statement_timeout': str(settings['DB_STATEMENT_TIMEOUT_MS'])}}
+    engine = create_async_engine(url, **options)
+    configure_sqlite(engine.sync_engine, settings.get('SQLITE_PRAGMAS'))
+    metrics.instrument_engine(engine.sync_engine)
+    return engine
+
+class CookieSessionMiddleware:
+    # Reads and writes Flask's signed session cookie
+    def __init__(self, app, secret_key, cookie_name='session', max_age=31 * 24 * 3600):
+        self.app = app
+        self.cookie_name = cookie_name
+        self.max_age = max_age
+        self.serializer = URLSafeTimedSerializer(
+            secret_key, salt='cookie-session', serializer=TaggedJSONSerializer(),
+            signer_kwargs={'key_derivation': 'hmac', 'digest_method': hashlib.sha1},
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] not in ('http', 'websocket'):
+            return await self.app(scope, receive, send)
+
+        initial = {}
+        cookie = HTTPConnection(scope).cookies.get(self.cookie_name)
+        if cookie:
+            try:
+                initial = self.serializer.loads(cookie, max_age=self.max_age)
+            except BadSignature:
+                initial = {}
+        scope['session'] = dict(initial)
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start' and scope['session'] != initial:
+                headers = MutableHeaders(scope=message)
+                if scope['session']:
+                    value = self.serializer.dumps(scope['session'])
+                    headers.append('Set-Cookie', f'{self.cookie_name}={value}; HttpOnly; Path=/')
+                else:
+                    headers.append('Set-Cookie', f'{self.cookie_name}=; Expires=Thu, 01 Jan 1970 00:00:00 GMT; '
+                                                 'Max-Age=0; HttpOnly; Path=/')
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+def json_response(obj, status=200, headers=None):
+    return Response(dumps(obj) + b'\n', status_code=status, headers=headers, media_type='application/json')
+
+def error(message, status):
+    return json_response({"error": message}, status)
+
+NOT_FOUND = {"error": "Not found"}
+
+def versioned_response(obj, version, status=200):
+    return json_response(obj, status, headers={'ETag': etag(version)})
+
+def precondition_failed(version):
+    return versioned_response({"error": "Precondition failed; fetch the latest version and retry"}, version, 412)
+
+def paginated_response(items, next_cursor):
+    return json_response(items, headers={NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None)
+
+def throttled(retry_after):
+    response = error("Too many attempts, try again later", 429)
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def login_required(f):
+    @wraps(f)
+    async def decorated_function(request):
+        claims = auth.authenticate(request.headers.get('Authorization'), request.session)
+        if claims is None:
+            return error("Unauthorized", 401)
+        request.state.user_id = claims['sub']
+        request.state.user_claims = claims
+        return await f(request)
+    return decorated_function
+
+def cached(resource, headers=()):
+    # cache.cached for these handlers, inside login_required
+    def decorator(f):
+        @wraps(f)
+        async def decorated_function(request):
+            if not cache.enabled or cache.backend is None:
+                return await f(request)
+
+            params = MultiDict(request.query_params.multi_items())
+            key, entry = await run_in_threadpool(cache.lookup, request.state.user_id, resource, params)
+            if entry is None:
+                response = await f(request)
+                if response.status_code != 200:
+                    return response
+                entry = await run_in_threadpool(
+                    cache.store, key, response.body,
+                    {name: response.headers[name] for name in headers if name in response.headers})
+
+            validators = {
+                **entry['headers'],
+                'ETag': f'"{entry["etag"]}"',
+                'Last-Modified': http_date(entry['last_modified']),
+                'Cache-Control': 'private, no-cache',
+            }
+            if not_modified(entry, request.headers.get('If-None-Match'), request.headers.get('If-Modified-Since')):
+                return Response(status_code=304, headers=validators)
+            return Response(entry['body'], headers=validators, media_type='application/json')
+        return decorated_function
+    return decorator
+
+def writer(request):
+    return request.app.state.sessions()
+
+def reader(request):
+    # GETs read from the replica unless this client wrote a moment ago
+    state = request.app.state
+    if state.replica_sessions is not None and request.method in READ_METHODS \
+            and request.session.get('primary_until', 0) < time.time():
+        return state.replica_sessions()
+    return state.sessions()
+
+def idempotent(f):
+    # Idempotency-Key handling, inside login_required: the key is claimed by
+    # commit() in the handler's own transaction
+    @wraps(f)
+    async def decorated_function(request):
+        value = request.headers.get(IDEMPOTENCY_HEADER)
+        if value is None or not idempotency.enabled:
+            return await f(request)
+        try:
+            key = parse_key(value)
+        except ValueError as e:
+            return error(str(e), 400)
+
+        user_id = request.state.user_id
+        digest = fingerprint(request.method, request.url.path, await request.body())
+        async with writer(request) as session:
+            row = (await session.execute(key_statement(user_id, key))).scalar_one_or_none()
+        if not idempotency.live(row):
+            request.state.idempotency_claim = (key, digest)
+            try:
+                response = await f(request)
+            except DuplicateRequest:
+                response = None
+            except Exception:
+                # Only matches a claim the handler committed before raising
+                await finish_claim(request, complete_statement(user_id, key, 500, INTERNAL_ERROR, {}))
+                raise
+            if response is not None:
+                await finish_claim(request, complete_statement(
+                    user_id, key, response.status_code, response.body.decode(), response.headers))
+                return response
+            async with writer(request) as session:
+                row = (await session.execute(key_statement(user_id, key))).scalar_one()
+
+        status, body, headers = replay(row, digest)
+        return Response(body, status_code=status, headers=headers, media_type='application/json')
+    return decorated_function
+
+async def finish_claim(request, statement):
+    async with writer(request) as session:
+        await session.execute(statement)
+        await session.commit()
+
+async def commit(request, session, user_id, *resources):
+    claimed = getattr(request.state, 'idempotency_claim', None)
+    if claimed is not None:
+        await session.run_sync(lambda sync: idempotency.claim(sync, request.state.user_id, *claimed))
+    await session.commit()
+    if resources:
+        await run_in_threadpool(cache.invalidate_user, user_id)
+        await run_in_threadpool(notifier.publish, user_id, *resources)
+    sticky = request.app.state.settings['REPLICA_STICKY_SECONDS']
+    if request.app.state.replica_sessions is not None and sticky:
+        request.session['primary_until'] = time.time() + sticky
+
+async def hash_in_pool(request, f, *args):
+    return await asyncio.get_running_loop().run_in_executor(request.app.state.hash_pool, f, *args)
+
+async def owned_course(session, request, course_id):
+    # (course, None) when the course belongs to the user, else (None, response)
+    course = await session.get(Course, course_id)
+    if course is None:
+        return None, json_response(NOT_FOUND, 404)
+    if course.user_id != request.state.user_id:
+        return None, error("Unauthorized", 403)
+    return course, None
+
+# Auth routes
+async def rate_limited(request, account=None):
+    retry_after = await run_in_threadpool(auth.limiter.hit_ip, request.client.host if request.client else None)
+    if retry_after is None and account:
+        retry_after = await run_in_threadpool(auth.limiter.check_account, account)
+    return throttled(retry_after) if retry_after else None
+
+async def authenticate_password(request, data):
+    # (user, None) for valid credentials, else (None, error response)
+    limited = await rate_limited(request, data['email'])
+    if limited:
+        return None, limited
+
+    async with writer(request) as session:
+        user = await session.scalar(select(User).where(User.email == data['email']))
+        if not user or not await hash_in_pool(request, user.check_password, data['password']):
+            await run_in_threadpool(auth.limiter.fail_account, data['email'])
+            return None, error("Invalid email or password", 401)
+
+        # Upgrade hashes made under an older hashing policy
+        if user.password_needs_rehash():
+            await hash_in_pool(request, user.set_password, data['password'])
+            await session.commit()
+    return user, None
+
+async def register(request):
+    data = await request.json()
+    limited = await rate_limited(request)
+    if limited:
+        return limited
+
+    async with writer(request) as session:
+        # Check if user already exists
+        if await session.scalar(select(User.id).where(User.email == data['email'])):
+            return error("Email already registered", 400)
+
+        if await session.scalar(select(User.id).where(User.username == data['username'])):
+            return error("Username already taken", 400)
+
+        user = User(username=data['username'], email=data['email'])
+        await hash_in_pool(request, user.set_password, data['password'])
+        session.add(user)
+        await session.commit()
+
+    # Auto login after registration
+    start_session(request.session, user)
+    return json_response(user.to_dict(), 201)
+
+async def login(request):
+    user, failed = await authenticate_password(request, await request.json())
+    if failed:
+        return failed
+
+    start_session(request.session, user)
+    return json_response(user.to_dict())
+
+async def issue_token(request):
+    user, failed = await authenticate_password(request, await request.json())
+    if failed:
+        return failed
+
+    return json_response(auth.tokens.issue(user))
+
+async def refresh_token(request):
+    data = await request.json()
+    claims = auth.tokens.verify((data or {}).get('refreshToken', ''), REFRESH)
+    if claims:
+        async with writer(request) as session:
+            user = await session.get(User, claims['sub'])
+    if not claims or not user or user.token_version != claims['ver']:
+        return error("Invalid refresh token", 401)
+
+    return json_response(auth.tokens.issue(user))
+
+async def logout(request):
+    # Token clients logging out revoke every refresh token they were issued
+    claims = auth.authenticate(request.headers.get('Authorization'), {})
+    if claims:
+        async with writer(request) as session:
+            await session.execute(
+                update(User).where(User.id == claims['sub']).values(token_version=User.token_version + 1))
+            await session.commit()
+
+    end_session(request.session)
+    return json_response({"message": "Logged out successfully"})
+
+@login_required
+async def get_current_user(request):
+    # Sessions and tokens carry the user's details, so no lookup is needed
+    if 'username' in request.state.user_claims:
+        return json_response(claims_user(request.state.user_claims))
+
+    async with reader(request) as session:
+        user = await session.get(User, request.state.user_id)
+    if not user:
+        end_session(request.session)
+        return error("User not found", 404)
+
+    # Sessions from before tokens existed get the claims filled in
+    start_session(request.session, user)
+    return json_response(user.to_dict())
+
+# Routes for Courses
+@login_required
+@cached('courses', headers=(NEXT_CURSOR_HEADER,))
+async def get_courses(request):
+    user_id = request.state.user_id
+    query = row_select('courses').where(Course.user_id == user_id)
+    try:
+        query = filter_query(query, request.query_params, Course.created_at)
+        query, limit = keyset_page(query, Course.created_at, Course.id, request.query_params)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    async with reader(request) as session:
+        rows = (await session.execute(query)).all()
+    courses, next_cursor = split_page(rows, limit, Course.created_at, Course.id)
+    return paginated_response(serialize_rows('courses', courses), next_cursor)
+
+@login_required
+@idempotent
+async def add_course(request):
+    data = await request.json()
+    user_id = request.state.user_id
+    try:
+        start_date = parse_date(data['startDate'], 'startDate') if data.get('startDate') else None
+        end_date = parse_date(data['endDate'], 'endDate') if data.get('endDate') else None
+    except ValueError as e:
+        return error(str(e), 400)
+
+    course = Course(
+        title=data['title'],
+        platform=data['platform'],
+        url=data['url'],
+        progress=data['progress'],
+        total_sections=data['totalSections'],
+        completed_sections=data['completedSections'],
+        start_date=start_date,
+        end_date=end_date,
+        image_url=data['imageUrl'],
+        user_id=user_id
+    )
+    async with writer(request) as session:
+        session.add(course)
+        await session.flush()
+
+        def update_derived(sync):
+            reindex(sync.connection(), 'courses', Course.id == course.id)
+            refresh_courses([course.id], session=sync)
+
+        await session.run_sync(update_derived)
+        await commit(request, session, user_id, 'courses', 'recommendations')
+    return versioned_response(course.to_dict(), course.version, 201)
+
+@login_required
+async def update_course(request):
+    user_id = request.state.user_id
+    course_id = request.path_params['course_id']
+    try:
+        if_match = parse_if_match(request.headers.get('If-Match'))
+        completed, increment = parse_progress_update(await request.json())
+    except ValueError as e:
+        return error(str(e), 400)
+
+    async with writer(request) as session:
+        if increment is not None:
+            # Atomic increment: concurrent requests add up
+            course = (await session.execute(increment_statement(course_id, user_id, increment, if_match))).scalar()
+            if course is None:
+                current, denied = await owned_course(session, request, course_id)
+                return denied or precondition_failed(current.version)
+            await session.run_sync(lambda sync: record_progress(user_id, course.id, increment, session=sync))
+        else:
+            course, denied = await owned_course(session, request, course_id)
+            if denied:
+                return denied
+            if not matches(if_match, course.version):
+                return precondition_failed(course.version)
+
+            if completed is not None:
+                delta = completed - (course.completed_sections or 0)
+                course.completed_sections = completed
+                course.progress = progress_percent(completed, course.total_sections, course.progress)
+                await session.run_sync(lambda sync: record_progress(user_id, course.id, delta, session=sync))
+
+        try:
+            await session.run_sync(lambda sync: refresh_courses([course.id], session=sync))
+            await commit(request, session, user_id, 'courses', 'recommendations', 'insights')
+        except StaleDataError:
+            await session.rollback()
+            return error("Course was modified by another request", conflict_status(if_match))
+    return versioned_response(course.to_dict(), course.version)
+
+# Routes for Events
+@login_required
+@cached('events', headers=(NEXT_CURSOR_HEADER,))
+async def get_events(request):
+    # Courses for this user, resolved inside the same query
+    course_ids = user_course_ids(request.state.user_id)
+    query = row_select('events').where(Event.course_id.in_(course_ids))
+    try:
+        query = filter_query(query, request.query_params, Event.date, course_column=Event.course_id,
+                             type_column=Event.type,
+                             default_filter=live_since('events', hot_from(request.app.state.settings)))
+        query, limit = keyset_page(query, Event.date, Event.id, request.query_params)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    async with reader(request) as session:
+        rows = (await session.execute(query)).all()
+    events, next_cursor = split_page(rows, limit, Event.date, Event.id)
+    return paginated_response(serialize_rows('events', events), next_cursor)
+
+@login_required
+@idempotent
+async def add_event(request):
+    data = await request.json()
+
+    async with writer(request) as session:
+        course, denied = await owned_course(session, request, data['courseId'])
+        if denied:
+            return denied
+
+        try:
+            event_date = parse_date(data['date'], 'date')
+            event_time = parse_time(data['time'], 'time')
+            recurrence = normalize_rule(data.get('recurrence'))
+            last_date = series_end(event_date, recurrence)
+        except ValueError as e:
+            return error(str(e), 400)
+
+        event = Event(
+            title=data['title'],
+            date=event_date,
+            time=event_time,
+            type=data['type'],
+            course_id=data['courseId'],
+            description=data.get('description', ''),
+            recurrence=recurrence,
+            series_end=last_date
+        )
+        session.add(event)
+
+        def update_derived(sync):
+            sync.flush()
+            reindex(sync.connection(), 'events', Event.id == event.id)
+            record_event(course.user_id, event.date, event.type, event.recurrence, session=sync)
+            refresh_courses([course.id], session=sync)
+
+        await session.run_sync(update_derived)
+        await commit(request, session, course.user_id, 'events', 'recommendations', 'insights')
+    return json_response(event.to_dict(), 201)
+
+@login_required
+async def delete_event(request):
+    async with writer(request) as session:
+        event = await session.get(Event, request.path_params['event_id'])
+        if event is None:
+            return json_response(NOT_FOUND, 404)
+
+        # Verify the event's course belongs to the user
+        course, denied = await owned_course(session, request, event.course_id)
+        if denied:
+            return denied
+
+        await session.delete(event)
+
+        def update_derived(sync):
+            record_deletions(sync.connection(), 'events', [(event.id, course.user_id)])
+            unindex(sync.connection(), 'events', [event.id])
+            record_event(course.user_id, event.date, event.type, event.recurrence, sign=-1, session=sync)
+            refresh_courses([course.id], session=sync)
+
+        await session.run_sync(update_derived)
+        await commit(request, session, course.user_id, 'events', 'recommendations', 'insights')
+    return Response(status_code=204)
+
+# Calendar: events expanded into occurrences within a date window
+@login_required
+async def get_calendar(request):
+    try:
+        window_start, window_end = parse_window(request.query_params)
+        course_id = parse_int(request.query_params['courseId'], 'courseId') \
+            if request.query_params.get('courseId') else None
+    except ValueError as e:
+        return error(str(e), 400)
+
+    single, series = calendar_selects(user_course_ids(request.state.user_id), window_start, window_end,
+                                      course_id, request.query_params.get('type'))
+    async with reader(request) as session:
+        series_rows = (await session.execute(series)).all()
+        single_rows = (await session.execute(single)).all()
+    # Occurrences are still generated and encoded lazily while streaming
+    return StreamingResponse(stream_list(expand(single_rows, series_rows, window_start, window_end)),
+                             media_type='application/json')
+
+# Routes for Attendance
+@login_required
+@cached('attendance', headers=(NEXT_CURSOR_HEADER,))
+async def get_attendance(request):
+    # Courses for this user, resolved inside the same query
+    course_ids = user_course_ids(request.state.user_id)
+    query = row_select('attendance').where(Attendance.course_id.in_(course_ids))
+    try:
+        query = filter_query(query, request.query_params, Attendance.date, course_column=Attendance.course_id,
+                             status_column=Attendance.status,
+                             default_filter=live_since('attendance', hot_from(request.app.state.settings)))
+        query, limit = keyset_page(query, Attendance.date, Attendance.id, request.query_params)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    async with reader(request) as session:
+        rows = (await session.execute(query)).all()
+    records, next_cursor = split_page(rows, limit, Attendance.date, Attendance.id)
+    return paginated_response(serialize_rows('attendance', records), next_cursor)
+
+@login_required
+@idempotent
+async def add_attendance(request):
+    data = await request.json()
+
+    async with writer(request) as session:
+        course, denied = await owned_course(session, request, data['courseId'])
+        if denied:
+            return denied
+
+        try:
+            attendance_date = parse_date(data['date'], 'date')
+        except ValueError as e:
+            return error(str(e), 400)
+
+        attendance = Attendance(
+            course_id=data['courseId'],
+            date=attendance_date,
+            status=data['status'],
+            notes=data.get('notes', '')
+        )
+        session.add(attendance)
+        try:
+            await session.flush()
+        except IntegrityError:
+            await session.rollback()
+            return error("Attendance already recorded for this course and date", 409)
+
+        def update_derived(sync):
+            reindex(sync.connection(), 'attendance', Attendance.id == attendance.id)
+            record_attendance(course.user_id, attendance.date, attendance.status, session=sync)
+            refresh_courses([course.id], session=sync)
+
+        await session.run_sync(update_derived)
+        await commit(request, session, course.user_id, 'attendance', 'recommendations', 'insights')
+    return versioned_response(attendance.to_dict(), attendance.version, 201)
+
+@login_required
+@idempotent
+async def mark_attendance_batch(request):
+    user_id = request.state.user_id
+    data = await request.json()
+    marks = data.get('marks') if isinstance(data, dict) else data
+    if not isinstance(marks, list):
+        return error("Expected a list of marks", 400)
+
+    async with writer(request) as session:
+        try:
+            diff = await session.run_sync(lambda sync: mark_attendance(user_id, marks, session=sync))
+        except BulkError as e:
+            return json_response({"error": e.message, "errors": e.errors}, e.status)
+        changed = ('attendance', 'recommendations', 'insights') if diff['created'] or diff['updated'] else ()
+        await commit(request, session, user_id, *changed)
+    return json_response(diff)
+
+@login_required
+async def update_attendance(request):
+    data = await request.json()
+    if_match = parse_if_match(request.headers.get('If-Match'))
+
+    async with writer(request) as session:
+        record = await session.get(Attendance, request.path_params['record_id'])
+        if record is None:
+            return json_response(NOT_FOUND, 404)
+
+        # Verify the attendance record's course belongs to the user
+        course, denied = await owned_course(session, request, record.course_id)
+        if denied:
+            return denied
+        if not matches(if_match, record.version):
+            return precondition_failed(record.version)
+
+        try:
+            if 'status' in data:
+                previous = record.status
+                await session.run_sync(lambda sync: record_attendance_status(
+                    course.user_id, record.date, previous, data['status'], session=sync))
+                record.status = data['status']
+            if 'notes' in data:
+                record.notes = data['notes']
+                await session.flush()
+                await session.run_sync(lambda sync: reindex(
+                    sync.connection(), 'attendance', Attendance.id == record.id))
+
+            await session.run_sync(lambda sync: refresh_courses([course.id], session=sync))
+            await commit(request, session, course.user_id, 'attendance', 'recommendations', 'insights')
+        except StaleDataError:
+            await session.rollback()
+            return error("Attendance record was modified by another request", conflict_status(if_match))
+    return versioned_response(record.to_dict(), record.version)
+
+async def enqueue_job(request, kind, payload=None):
+    # Commits the job with the request's idempotency key; 202 pointing at it
+    settings = request.app.state.settings
+    user_id = request.state.user_id
+    async with writer(request) as session:
+        job = await session.run_sync(
+            lambda sync: enqueue(kind, payload, user_id, settings['JOB_MAX_ATTEMPTS'], session=sync))
+        await commit(request, session, user_id)
+    return json_response(job.to_dict(), 202, headers={'Location': f'/api/jobs/{job.id}'})
+
+# Routes for Recommendations
+@login_required
+@cached('recommendations', headers=(NEXT_CURSOR_HEADER,))
+async def get_recommendations(request):
+    # Courses for this user, resolved inside the same query
+    course_ids = user_course_ids(request.state.user_id)
+    query = row_select('recommendations').where(Recommendation.course_id.in_(course_ids))
+    try:
+        query = filter_query(query, request.query_params, Recommendation.created_at,
+                             course_column=Recommendation.course_id)
+        query, limit = keyset_page(query, Recommendation.created_at, Recommendation.id, request.query_params)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    async with reader(request) as session:
+        rows = (await session.execute(query)).all()
+    recommendations, next_cursor = split_page(rows, limit, Recommendation.created_at, Recommendation.id)
+    return paginated_response(serialize_rows('recommendations', recommendations), next_cursor)
+
+@login_required
+@idempotent
+async def refresh_recommendations(request):
+    return await enqueue_job(request, 'recommendations.refresh')
+
+# Bulk import/export
+@login_required
+@idempotent
+async def bulk_import(request):
+    resource = request.path_params['resource']
+    if resource not in BULK_MODELS:
+        return json_response(NOT_FOUND, 404)
+    user_id = request.state.user_id
+    partial = request.query_params.get('partial', '').lower() in ('1', 'true')
+    try:
+        records = parse_payload(request.headers.get('Content-Type'), await request.body())
+    except BulkError as e:
+        return json_response({"error": e.message, "errors": e.errors}, e.status)
+    if request.query_params.get('async', '').lower() in ('1', 'true'):
+        # Validate and insert in a worker; poll the job for the result
+        return await enqueue_job(request, 'import', {'resource': resource, 'records': records, 'partial': partial})
+
+    async with writer(request) as session:
+        try:
+            result = await session.run_sync(
+                lambda sync: import_rows(resource, user_id, records, partial=partial, session=sync))
+        except BulkError as e:
+            return json_response({"error": e.message, "errors": e.errors}, e.status)
+        await commit(request, session, user_id, resource, 'recommendations', 'insights')
+    return json_response(result, 201 if result['imported'] else 200)
+
+@login_required
+async def bulk_export(request):
+    resource = request.path_params['resource']
+    if resource not in BULK_MODELS:
+        return json_response(NOT_FOUND, 404)
+    export_format = request.query_params.get('format', 'ndjson')
+    try:
+        encode = export_encoder(resource, export_format)
+    except BulkError as e:
+        return error(e.message, e.status)
+    statement = export_select(resource, request.state.user_id)
+
+    async def chunks():
+        async with reader(request) as session:
+            result = await session.stream(statement)
+            async for rows in result.partitions():
+                yield encode(rows)
+
+    return StreamingResponse(chunks(), media_type=EXPORT_FORMATS[export_format],
+                             headers=export_headers(resource, export_format))
+
+# Dashboard snapshot: every collection in one round trip
+@login_required
+@cached('dashboard')
+async def get_dashboard(request):
+    try:
+        sections = parse_sections(request.query_params.get('sections'))
+    except ValueError as e:
+        return error(str(e), 400)
+
+    courses, children = dashboard_statements(request.state.user_id, hot_from(request.app.state.settings), sections)
+    async with reader(request) as session:
+        course_rows = (await session.execute(courses)).all() if courses is not None else ()
+        child_rows = (await session.execute(children)).all() if children is not None else ()
+    return json_response(assemble_dashboard(sections, parse_fields(request.query_params), course_rows, child_rows))
+
+# Delta sync: rows changed or deleted since the client's last sync token
+@login_required
+async def get_sync(request):
+    now = datetime.utcnow()
+    try:
+        since, full = parse_since(request.query_params.get('since'), now)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    statements, tombstones = sync_statements(request.state.user_id, since, full)
+    # Always the primary: a lagging replica could hide changes from before the new token for good
+    async with writer(request) as session:
+        rows = {resource: (await session.execute(statement)).all() for resource, statement in statements.items()}
+        tombstone_rows = (await session.execute(tombstones)).all() if tombstones is not None else ()
+    return json_response(assemble_changes(now, full, rows, tombstone_rows))
+
+# Search across the user's courses, events, attendance notes and recommendations
+@login_required
+async def search(request):
+    try:
+        terms, types, limit = parse_search(request.query_params)
+        statement = search_statement(request.app.state.engine.dialect.name,
+                                     request.state.user_id, terms, types, limit)
+    except ValueError as e:
+        return error(str(e), 400)
+    except NotImplementedError as e:
+        return error(str(e), 501)
+
+    async with reader(request) as session:
+        rows = (await session.execute(statement)).all()
+    return json_response(assemble_results(rows))
+
+# Live updates: a server-sent event naming the resources that changed.
+# Clients refetch those (or call /api/sync) rather than receive rows here.
+@login_required
+async def stream(request):
+    subscription = notifier.hub.subscribe(request.state.user_id)
+
+    async def events():
+        try:
+            yield b'retry: 5000\n\n'
+            while True:
+                resources = await subscription.changes(notifier.coalesce, notifier.heartbeat)
+                if resources is None:
+                    # Keeps proxies from closing an idle stream
+                    yield b': keep-alive\n\n'
+                else:
+                    yield b'event: change\ndata: ' + dumps({'resources': resources}) + b'\n\n'
+        finally:
+            notifier.hub.unsubscribe(subscription)
+
+    return StreamingResponse(events(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# Routes for Insights
+@login_required
+@cached('insights')
+async def get_insights(request):
+    try:
+        weeks = min(max(int(request.query_params.get('weeks', DEFAULT_WEEKS)), 1), 104)
+    except ValueError:
+        return error("weeks must be an integer", 400)
+
+    async with reader(request) as session:
+        rows = (await session.execute(weekly_insights_statement(request.state.user_id, weeks))).scalars()
+        return json_response([row.to_dict() for row in rows])
+
+@login_required
+@idempotent
+async def rebuild_insights(request):
+    return await enqueue_job(request, 'insights.rebuild')
+
+# Analytics: aggregates computed in SQL, one entry per bucket
+@login_required
+@cached('analytics.attendance')
+async def get_attendance_analytics(request):
+    try:
+        group = parse_attendance_group(request.query_params)
+        weeks = parse_weeks(request.query_params)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    if group == 'course':
+        statement = attendance_by_course_statement(request.state.user_id)
+    else:
+        statement = attendance_by_week_statement(request.app.state.engine.dialect.name, request.state.user_id, weeks)
+    async with reader(request) as session:
+        rows = (await session.execute(statement)).all()
+    return json_response(assemble_attendance(group, rows))
+
+@login_required
+@cached('analytics.progress')
+async def get_progress_analytics(request):
+    async with reader(request) as session:
+        rows = (await session.execute(progress_statement(request.state.user_id))).all()
+    return json_response(assemble_progress(rows))
+
+@login_required
+@cached('analytics.deadlines')
+async def get_deadline_analytics(request):
+    try:
+        first, last = deadline_window(request.query_params)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    single, series = deadline_statements(request.app.state.engine.dialect.name, request.state.user_id, first, last)
+    async with reader(request) as session:
+        single_rows = (await session.execute(single)).all()
+        series_rows = (await session.execute(series)).all()
+    return json_response(assemble_deadlines(single_rows, series_rows, first, last))
+
+@login_required
+@cached('analytics.streak')
+async def get_streak(request):
+    statement = streak_statement(request.app.state.engine.dialect.name, request.state.user_id)
+    async with reader(request) as session:
+        row = (await session.execute(statement)).first()
+    return json_response(assemble_streak(row))
+
+# Archived terms of events and attendance, read back from ARCHIVE_DIR
+@login_required
+async def get_archive(request):
+    resource = request.path_params['resource']
+    if resource not in ('events', 'attendance'):
+        return json_response(NOT_FOUND, 404)
+    try:
+        course_id, first, last = parse_archive_query(request.query_params)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    async with reader(request) as session:
+        course_ids = set((await session.scalars(user_course_ids(request.state.user_id))).all())
+    if course_id is not None:
+        course_ids &= {course_id}
+    directory = request.app.state.settings['ARCHIVE_DIR']
+    items = await run_in_threadpool(read_archive, directory, resource, course_ids, first, last) if course_ids else []
+    return json_response(items)
+
+# Course cover images: a short-lived redirect to a resized variant that is
+# named by its source's digest, so the variant itself can be cached forever
+@login_required
+async def get_course_image(request):
+    try:
+        width = parse_width(request.query_params.get('w'))
+    except ValueError as e:
+        return error(str(e), 400)
+
+    async with reader(request) as session:
+        course, denied = await owned_course(session, request, request.path_params['course_id'])
+    if denied:
+        return denied
+    if not course.image_url:
+        return error("Course has no image", 404)
+
+    try:
+        digest = await run_in_threadpool(images.source_digest, course.image_url)
+    except FetchError as e:
+        return error(str(e), 502)
+    name = images.variant_name(digest, width, request.headers.get('Accept', ''))
+    return RedirectResponse(f'/api/images/{digest}/{name}', 302, headers={
+        'Cache-Control': f'private, max-age={REDIRECT_MAX_AGE}', 'Vary': 'Accept'})
+
+async def get_image_variant(request):
+    # No login: the digest is only handed out to the course's owner
+    digest, name = request.path_params['digest'], request.path_params['name']
+    try:
+        variant = await run_in_threadpool(images.variant, digest, name)
+    except FetchError as e:
+        return error(str(e), 502)
+    if variant is None:
+        return error("Image not found", 404)
+
+    path, mimetype = variant
+    headers = {'ETag': f'"{digest}-{name}"', 'Cache-Control': f'public, max-age={VARIANT_MAX_AGE}, immutable'}
+    if headers['ETag'] in request.headers.get('If-None-Match', ''):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=mimetype, headers=headers)
+
+# Routes for Jobs; polled for completion, so always read from the primary
+async def delivered(session, jobs):
+    # Side effects of finished jobs a worker could not reach this process with
+    claimed = await session.run_sync(lambda sync: claim_delivery(jobs, sync))
+    if claimed:
+        await session.commit()
+        for job in claimed:
+            await run_in_threadpool(announce, job.user_id, job.status)
+    return jobs
+
+@login_required
+async def get_jobs(request):
+    query = (
+        select(Job).where(Job.user_id == request.state.user_id)
+        .order_by(Job.created_at.desc(), Job.id.desc())
+        .limit(50)
+    )
+    async with writer(request) as session:
+        jobs = await delivered(session, (await session.scalars(query)).all())
+    return json_response([job.to_dict() for job in jobs])
+
+@login_required
+async def get_job(request):
+    async with writer(request) as session:
+        job = await session.get(Job, request.path_params['job_id'])
+        if job is None:
+            return json_response(NOT_FOUND, 404)
+        if job.user_id != request.state.user_id:
+            return error("Unauthorized", 403)
+        await delivered(session, [job])
+    return json_response(job.to_dict())
+
+async def get_metrics(request):
+    return Response(metrics.render(), media_type=EXPOSITION_TYPE)
+
+routes = [
+    Route('/api/auth/register', register, methods=['POST']),
+    Route('/api/auth/login', login, methods=['POST']),
+    Route('/api/auth/token', issue_token, methods=['POST']),
+    Route('/api/auth/refresh', refresh_token, methods=['POST']),
+    Route('/api/auth/logout', logout, methods=['POST']),
+    Route('/api/auth/user', get_current_user, methods=['GET']),
+    Route('/api/courses', get_courses, methods=['GET']),
+    Route('/api/courses', add_course, methods=['POST']),
+    Route('/api/courses/{course_id:int}', update_course, methods=['PUT']),
+    Route('/api/events', get_events, methods=['GET']),
+    Route('/api/events', add_event, methods=['POST']),
+    Route('/api/events/{event_id:int}', delete_event, methods=['DELETE']),
+    Route('/api/calendar', get_calendar, methods=['GET']),
+    Route('/api/attendance', get_attendance, methods=['GET']),
+    Route('/api/attendance', add_attendance, methods=['POST']),
+    Route('/api/attendance/mark', mark_attendance_batch, methods=['POST']),
+    Route('/api/attendance/{record_id:int}', update_attendance, methods=['PUT']),
+    Route('/api/recommendations', get_recommendations, methods=['GET']),
+    Route('/api/recommendations/refresh', refresh_recommendations, methods=['POST']),
+    Route('/api/{resource}/import', bulk_import, methods=['POST']),
+    Route('/api/{resource}/export', bulk_export, methods=['GET']),
+    Route('/api/{resource}/archive', get_archive, methods=['GET']),
+    Route('/api/dashboard', get_dashboard, methods=['GET']),
+    Route('/api/sync', get_sync, methods=['GET']),
+    Route('/api/search', search, methods=['GET']),
+    Route('/api/stream', stream, methods=['GET']),
+    Route('/api/insights', get_insights, methods=['GET']),
+    Route('/api/insights/rebuild', rebuild_insights, methods=['POST']),
+    Route('/api/analytics/attendance', get_attendance_analytics, methods=['GET']),
+    Route('/api/analytics/progress', get_progress_analytics, methods=['GET']),
+    Route('/api/analytics/deadlines', get_deadline_analytics, methods=['GET']),
+    Route('/api/analytics/streak', get_streak, methods=['GET']),
+    Route('/api/images/{course_id:int}', get_course_image, methods=['GET']),
+    Route('/api/images/{digest}/{name}', get_image_variant, methods=['GET']),
+    Route('/api/jobs', get_jobs, methods=['GET']),
+    Route('/api/jobs/{job_id:int}', get_job, methods=['GET']),
+    Route('/metrics', get_metrics, methods=['GET']),
+]
+
+def create_app(settings=None):
+    settings = settings or load_config()
+    metrics.configure(settings)
+    cache.configure(settings)
+    auth.configure(settings)
+    passwords.configure(settings)
+    idempotency.configure(settings)
+    images.configure(settings)
+    notifier.configure(settings)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        if settings['SCHEMA_AUTO_UPGRADE']:
+            async with app.state.engine.begin() as connection:
+                await connection.run_sync(upgrade_connection)
+        notifier.broker.start()
+        yield
+        notifier.broker.stop()
+        await app.state.engine.dispose()
+        if app.state.replica_engine is not None:
+            await app.state.replica_engine.dispose()
+        app.state.hash_pool.shutdown(wait=False)
+
+    app = Starlette(
+        routes=routes,
+        lifespan=lifespan,
+        middleware=[
+            Middleware(MetricsMiddleware, metrics=metrics),
+            Middleware(CORSMiddleware, allow_origin_regex='.*', allow_credentials=True,
+                       allow_methods=['*'], allow_headers=['*'], expose_headers=[NEXT_CURSOR_HEADER]),
+            Middleware(CookieSessionMiddleware, secret_key=settings['SECRET_KEY']),
+        ],
+    )
+    # Flask answers /api/courses/ with a 404 rather than a redirect
+    app.router.redirect_slashes = False
+    app.state.settings = settings
+    app.state.engine = create_engine_for(settings['DATABASE_URL'], settings)
+    app.state.sessions = async_sessionmaker(app.state.engine, expire_on_commit=False)
+    app.state.replica_engine = None
+    app.state.replica_sessions = None
+    if settings.get('DATABASE_REPLICA_URL'):
+        app.state.replica_engine = create_engine_for(settings['DATABASE_REPLICA_URL'], settings)
+        app.state.replica_sessions = async_sessionmaker(app.state.replica_engine, expire_on_commit=False)
+    app.state.hash_pool = ThreadPoolExecutor(settings['HASH_THREADS'], thread_name_prefix='hash')
+    return app
+
+# Load environment variables
+load_dotenv()
+
+app = create_app()
@@ -0,0 +1,134 @@
+import time
+from functools import wraps
+from flask import g, jsonify, request, session
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+from cache import create_backend
+
+# Authentication: signed access/refresh tokens, the cookie session, and rate
+# limiting of the credential endpoints.
+#
+# Access tokens carry the user's id, username and email and are checked by
+# signature alone, so authenticated requests need no user lookup. Refresh
+# tokens also carry users.token_version; bumping it revokes every refresh
+# token issued to that user. Browser clients keep using the cookie session,
+# which now stores the same claims.
+
+ACCESS = 'access'
+REFRESH = 'refresh'
+
+def user_claims(user):
+    return {'sub': user.id, 'username': user.username, 'email': user.email}
+
+def claims_user(claims):
+    # The user.to_dict() shape, rebuilt from token claims
+    return {'id': claims['sub'], 'username': claims['username'], 'email': claims['email']}
+
+class TokenSigner:
+    def __init__(self, secret_key, access_ttl=900, refresh_ttl=30 * 24 * 3600):
+        self.ttl = {ACCESS: access_ttl, REFRESH: refresh_ttl}
+        self.serializers = {
+            kind: URLSafeTimedSerializer(secret_key, salt=f'learntrack-{kind}-token') for kind in self.ttl
+        }
+
+    def issue(self, user):
+        return {
+            'accessToken': self.serializers[ACCESS].dumps(user_claims(user)),
+            'refreshToken': self.serializers[REFRESH].dumps({'sub': user.id, 'ver': user.token_version}),
+            'tokenType': 'Bearer',
+            'expiresIn': self.ttl[ACCESS],
+            'user': user.to_dict(),
+        }
+
+    def verify(self, token, kind=ACCESS):
+        # Claims, or None for a forged, expired or wrong-kind token
+        try:
+            return self.serializers[kind].loads(token, max_age=self.ttl[kind])
+        except (BadSignature, SignatureExpired):
+            return None
+
+class RateLimiter:
+    # Fixed-window counters for the credential endpoints: every attempt counts
+    # against the client IP, failed passwords also count against the account.
+    # Both are checked before any password is hashed.
+
+    def __init__(self, config):
+        self.enabled = config.get('AUTH_RATE_LIMIT_ENABLED', True)
+        self.backend = create_backend(config) if self.enabled else None
+        self.ip_limit = config.get('AUTH_IP_LIMIT', 20)
+        self.ip_window = config.get('AUTH_IP_WINDOW', 60)
+        self.account_limit = config.get('AUTH_ACCOUNT_LIMIT', 5)
+        self.account_window = config.get('AUTH_ACCOUNT_WINDOW', 900)
+
+    def _window(self, window, now):
+        return int(now // window), window - now % window
+
+    def hit_ip(self, address):
+        # Seconds to wait when the IP is over its limit, else None
+        if not self.enabled:
+            return None
+        index, remaining = self._window(self.ip_window, time.time())
+        count = self.backend.incr(f'auth:ip:{address}:{index}', ttl=self.ip_window)
+        return int(remaining) + 1 if count > self.ip_limit else None
+
+    def _account_key(self, account, now):
+        index, remaining = self._window(self.account_window, now)
+        return f'auth:account:{account.lower()}:{index}', remaining
+
+    def check_account(self, account):
+        if not self.enabled:
+            return None
+        key, remaining = self._account_key(account, time.time())
+        return int(remaining) + 1 if self.backend.counter(key) >= self.account_limit else None
+
+    def fail_account(self, account):
+        if self.enabled:
+            key, _ = self._account_key(account, time.time())
+            self.backend.incr(key, ttl=self.account_window)
+
+def throttled(retry_after):
+    return jsonify({"error": "Too many attempts, try again later"}), 429, {'Retry-After': str(retry_after)}
+
+class Auth:
+    def __init__(self):
+        self.configure({'SECRET_KEY': ''})
+
+    def init_app(self, app):
+        self.configure(app.config)
+
+    def configure(self, config):
+        self.tokens = TokenSigner(config['SECRET_KEY'], config.get('ACCESS_TOKEN_TTL', 900),
+                                  config.get('REFRESH_TOKEN_TTL', 30 * 24 * 3600))
+        self.limiter = RateLimiter(config)
+
+    def authenticate(self, authorization, cookie_session):
+        # Claims for the request, from a bearer token or the cookie session
+        if authorization:
+            scheme, _, token = authorization.partition(' ')
+            if scheme.lower() != 'bearer':
+                return None
+            return self.tokens.verify(token.strip())
+        if 'user_id' not in cookie_session:
+            return None
+        return cookie_session.get('user') or {'sub': cookie_session['user_id']}
+
+    def login_required(self, f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            claims = self.authenticate(request.headers.get('Authorization'), session)
+            if claims is None:
+                return jsonify({"error": "Unauthorized"}), 401
+            g.user_id = claims['sub']
+            g.user_claims = claims
+            return f(*args, **kwargs)
+        return decorated_function
+
+def start_session(cookie_session, user):
+    cookie_session['user_id'] = user.id
+    cookie_session['user'] = user_claims(user)
+
+def end_session(cookie_session):
+    cookie_session.pop('user_id', None)
+    cookie_session.pop('user', None)
+
+auth = Auth()
+login_required = auth.login_required
@@ -0,0 +1,81 @@
+import argparse
+import gc
+import os
+import statistics
+import time
+from datetime import date, timedelta
+
+# Measures POST /api/attendance/mark with a full class's worth of marks:
+# each round marks a new day for every course (all created), changes every
+# status (all updated) and repeats the request (all unchanged). The median
+# of each phase is checked against the budget, 100 ms for 500 marks.
+#
+#   python bench_attendance.py --marks 500 --rounds 20
+#   python bench_attendance.py --database-url postgresql://localhost/learntrack_bench
+
+def post(client, marks):
+    gc.collect()
+    started = time.perf_counter()
+    response = client.post('/api/attendance/mark', json=marks)
+    elapsed = time.perf_counter() - started
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return elapsed, response.get_json()
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark batched attendance marking')
+    parser.add_argument('--database-url', default='sqlite:///:memory:')
+    parser.add_argument('--marks', type=int, default=500, help='marks per request, one per course')
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--budget', type=float, default=100.0, help='allowed median per request in ms')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database_url
+    os.environ['CACHE_ENABLED'] = '0'
+    from sqlalchemy import insert
+    from app import create_app
+    from models import db, User, Course
+    from migrations import upgrade
+
+    app = create_app()
+    with app.app_context():
+        upgrade(db.engine)
+        user = User(username='bench-attendance', email='bench-attendance@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        db.session.execute(insert(Course), [{
+            'user_id': user.id, 'title': f'Course {i}', 'platform': 'Udemy', 'url': f'https://example.com/{i}',
+            'total_sections': 20,
+        } for i in range(args.marks)])
+        course_ids = [row[0] for row in db.session.query(Course.id).filter_by(user_id=user.id)]
+        user_id, dialect = user.id, db.engine.dialect.name
+        db.session.commit()
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+
+    timings = {'created': [], 'updated': [], 'unchanged': []}
+    first_day = date(2026, 1, 5)
+    for round_number in range(args.rounds):
+        day = (first_day + timedelta(days=round_number)).isoformat()
+        marks = [{'courseId': course_id, 'date': day, 'status': 'present'} for course_id in course_ids]
+        changed = [{**mark, 'status': 'absent'} for mark in marks]
+        for phase, payload in (('created', marks), ('updated', changed), ('unchanged', changed)):
+            elapsed, result = post(client, payload)
+            count = result[phase] if phase == 'unchanged' else len(result[phase])
+            assert count == len(payload), (phase, count)
+            timings[phase].append(elapsed)
+
+    print(f'{args.marks} marks per request, {args.rounds} rounds on {dialect}')
+    print(f'{"phase":<10}{"median ms":>10}{"max ms":>10}')
+    over = False
+    for phase, values in timings.items():
+        median = statistics.median(values) * 1000
+        over = over or median > args.budget
+        print(f'{phase:<10}{median:>10.1f}{max(values) * 1000:>10.1f}')
+    print(f'budget {args.budget:.0f} ms')
+    if over:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
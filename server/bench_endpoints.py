@@ -0,0 +1,341 @@
+import argparse
+import itertools
+import json
+import logging
+import math
+import os
+import shutil
+import statistics
+import struct
+import sys
+import tempfile
+import time
+import zlib
+from datetime import date, timedelta
+
+# Endpoint benchmark: every route in app.py against generated data.
+#
+# Generates a database with datagen (or reuses one), then drives each
+# endpoint through the Flask test client on behalf of a sample of generated
+# users, recording latency and SQL queries per request. --save writes the
+# results as a JSON baseline; --compare reports endpoints whose query count
+# grew or whose p95 got slower than the tolerance allows, and exits non-zero
+# if any did. bench_endpoints.json is the checked-in baseline, so a change
+# in queries per request shows up in review.
+#
+#   python bench_endpoints.py --save bench_endpoints.json
+#   python bench_endpoints.py --compare bench_endpoints.json
+
+FUTURE = date(2031, 1, 1)
+
+class UserContext:
+    # One generated user's client and the ids the scenarios pick from
+    def __init__(self, client, user, course_ids, event_ids, attendance_ids, password, run):
+        self.client = client
+        self.user = user
+        self.password = password
+        self.run = run
+        self.course_ids = course_ids
+        self.event_ids = event_ids
+        self.attendance_ids = attendance_ids
+        self.refresh_token = None
+        self.sync_token = None
+        self.job_id = None
+        self.image_path = None
+
+    def course(self, i):
+        return self.course_ids[i % len(self.course_ids)]
+
+def _course_body(i):
+    return {'title': f'Benchmark course {i}', 'platform': 'Udemy', 'url': 'https://example.com', 'progress': 0,
+            'totalSections': 10, 'completedSections': 0, 'startDate': None, 'endDate': None,
+            'imageUrl': 'https://example.com/image.jpg'}
+
+def _future(i):
+    return (FUTURE + timedelta(days=i)).isoformat()
+
+def _png(width, height):
+    # Solid-colour PNG standing in for the cover images datagen points at
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    rows = b''.join(b'\x00' + b'\x40\x80\xc0' * width for _ in range(height))
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b''))
+
+def write_images(directory, count=97):
+    # The files the 'directory' image fetcher serves for datagen's image URLs
+    os.makedirs(directory)
+    image = _png(800, 533)
+    for n in range(count):
+        with open(os.path.join(directory, f'{n}.jpg'), 'wb') as f:
+            f.write(image)
+
+# (name, rule, method, request) where request(ctx, i) returns the path and
+# keyword arguments for the test client. `rule` ties a scenario to its
+# route so the coverage check can see which routes have none.
+SCENARIOS = [
+    ('register', '/api/auth/register', 'POST',
+     lambda ctx, i: ('/api/auth/register', {'json': {'username': f'bench{ctx.run}x{i}',
+                                                     'email': f'bench{ctx.run}x{i}@example.com',
+                                                     'password': ctx.password}, 'fresh': True})),
+    ('login', '/api/auth/login', 'POST',
+     lambda ctx, i: ('/api/auth/login', {'json': {'email': ctx.user['email'], 'password': ctx.password},
+                                         'fresh': True})),
+    ('token', '/api/auth/token', 'POST',
+     lambda ctx, i: ('/api/auth/token', {'json': {'email': ctx.user['email'], 'password': ctx.password},
+                                         'fresh': True})),
+    ('refresh', '/api/auth/refresh', 'POST',
+     lambda ctx, i: ('/api/auth/refresh', {'json': {'refreshToken': ctx.refresh_token}, 'fresh': True})),
+    ('logout', '/api/auth/logout', 'POST', lambda ctx, i: ('/api/auth/logout', {'fresh': True})),
+    ('current user', '/api/auth/user', 'GET', lambda ctx, i: ('/api/auth/user', {})),
+    ('list courses', '/api/courses', 'GET', lambda ctx, i: ('/api/courses?limit=20', {})),
+    ('add course', '/api/courses', 'POST', lambda ctx, i: ('/api/courses', {'json': _course_body(i)})),
+    ('replay add course', '/api/courses', 'POST',
+     lambda ctx, i: ('/api/courses', {'json': _course_body(0), 'headers': {'Idempotency-Key': f'bench{ctx.run}'}})),
+    ('update course', '/api/courses/<int:course_id>', 'PUT',
+     lambda ctx, i: (f'/api/courses/{ctx.course(i)}', {'json': {'completedSections': i % 5}})),
+    ('complete sections', '/api/courses/<int:course_id>', 'PUT',
+     lambda ctx, i: (f'/api/courses/{ctx.course(i)}', {'json': {'completeSections': 1}})),
+    ('list events', '/api/events', 'GET', lambda ctx, i: ('/api/events?limit=50', {})),
+    ('add event', '/api/events', 'POST',
+     lambda ctx, i: ('/api/events', {'json': {'title': 'Benchmark event', 'date': _future(i), 'time': '10:00',
+                                              'type': 'lecture', 'courseId': ctx.course(i)}})),
+    ('delete event', '/api/events/<int:event_id>', 'DELETE',
+     lambda ctx, i: (f'/api/events/{ctx.event_ids.pop()}', {})),
+    ('calendar', '/api/calendar', 'GET', lambda ctx, i: ('/api/calendar?days=30', {})),
+    ('list attendance', '/api/attendance', 'GET', lambda ctx, i: ('/api/attendance?limit=50', {})),
+    ('add attendance', '/api/attendance', 'POST',
+     lambda ctx, i: ('/api/attendance', {'json': {'courseId': ctx.course(i), 'date': _future(i),
+                                                  'status': 'present'}})),
+    ('mark attendance', '/api/attendance/mark', 'POST',
+     lambda ctx, i: ('/api/attendance/mark', {'json': {'marks': [
+         {'courseId': ctx.course(i + n), 'date': _future(1000 + i), 'status': 'absent'} for n in range(5)
+     ]}})),
+    ('update attendance', '/api/attendance/<int:record_id>', 'PUT',
+     lambda ctx, i: (f'/api/attendance/{ctx.attendance_ids[i % len(ctx.attendance_ids)]}',
+                     {'json': {'status': ('present', 'absent')[i % 2]}})),
+    ('list recommendations', '/api/recommendations', 'GET', lambda ctx, i: ('/api/recommendations?limit=50', {})),
+    ('refresh recommendations', '/api/recommendations/refresh', 'POST',
+     lambda ctx, i: ('/api/recommendations/refresh', {})),
+    ('import courses', '/api/<any(courses, events, attendance):resource>/import', 'POST',
+     lambda ctx, i: ('/api/courses/import', {'json': [_course_body(i * 10 + n) for n in range(10)]})),
+    ('export events', '/api/<any(courses, events, attendance):resource>/export', 'GET',
+     lambda ctx, i: ('/api/events/export?format=ndjson', {})),
+    ('dashboard', '/api/dashboard', 'GET', lambda ctx, i: ('/api/dashboard', {})),
+    ('sync snapshot', '/api/sync', 'GET', lambda ctx, i: ('/api/sync', {})),
+    ('sync delta', '/api/sync', 'GET', lambda ctx, i: (f'/api/sync?since={ctx.sync_token}', {})),
+    ('search', '/api/search', 'GET',
+     lambda ctx, i: (f"/api/search?q={('lecture', 'machine learn', 'session', 'kub')[i % 4]}", {})),
+    ('insights', '/api/insights', 'GET', lambda ctx, i: ('/api/insights', {})),
+    ('rebuild insights', '/api/insights/rebuild', 'POST', lambda ctx, i: ('/api/insights/rebuild', {})),
+    ('attendance by course', '/api/analytics/attendance', 'GET', lambda ctx, i: ('/api/analytics/attendance', {})),
+    ('attendance by week', '/api/analytics/attendance', 'GET',
+     lambda ctx, i: ('/api/analytics/attendance?by=week&weeks=26', {})),
+    ('progress distribution', '/api/analytics/progress', 'GET', lambda ctx, i: ('/api/analytics/progress', {})),
+    ('deadlines per week', '/api/analytics/deadlines', 'GET', lambda ctx, i: ('/api/analytics/deadlines', {})),
+    ('streak', '/api/analytics/streak', 'GET', lambda ctx, i: ('/api/analytics/streak', {})),
+    ('archived attendance', '/api/<any(events, attendance):resource>/archive', 'GET',
+     lambda ctx, i: ('/api/attendance/archive?from=2024-01-01', {})),
+    ('course image', '/api/images/<int:course_id>', 'GET',
+     lambda ctx, i: (f'/api/images/{ctx.course(i)}?w=320', {'headers': {'Accept': 'image/webp'}})),
+    ('image variant', '/api/images/<digest>/<name>', 'GET', lambda ctx, i: (ctx.image_path, {})),
+    ('list jobs', '/api/jobs', 'GET', lambda ctx, i: ('/api/jobs', {})),
+    ('get job', '/api/jobs/<int:job_id>', 'GET', lambda ctx, i: (f'/api/jobs/{ctx.job_id}', {})),
+    ('metrics', '/metrics', 'GET', lambda ctx, i: ('/metrics', {})),
+]
+
+def percentile(values, fraction):
+    # Nearest rank on sorted values
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+def uncovered_routes(app):
+    covered = {(rule, method) for _, rule, method, _ in SCENARIOS}
+    routes = {
+        (rule.rule, method)
+        for rule in app.url_map.iter_rules() if rule.endpoint != 'static'
+        for method in rule.methods - {'HEAD', 'OPTIONS'}
+    }
+    return sorted(routes - covered)
+
+def build_contexts(app, db, password, sample_users):
+    from sqlalchemy import select
+    from models import User, Course, Event, Attendance
+
+    contexts = []
+    # Keeps registered usernames unique when a database is reused
+    run = int(time.time())
+    with app.app_context():
+        users = db.session.execute(
+            select(User.id, User.username, User.email).where(User.username.like('gen%'))
+            .order_by(User.id).limit(sample_users)
+        ).all()
+        for user in users:
+            course_ids = db.session.scalars(select(Course.id).where(Course.user_id == user.id)
+                                            .order_by(Course.id)).all()
+            event_ids = db.session.scalars(select(Event.id).where(Event.course_id.in_(course_ids))
+                                           .order_by(Event.id)).all()
+            attendance_ids = db.session.scalars(select(Attendance.id).where(Attendance.course_id.in_(course_ids))
+                                                .order_by(Attendance.id).limit(100)).all()
+            client = app.test_client()
+            with client.session_transaction() as session:
+                session['user_id'] = user.id
+                session['user'] = {'sub': user.id, 'username': user.username, 'email': user.email}
+            contexts.append(UserContext(client, user._asdict(), course_ids, list(event_ids), attendance_ids,
+                                        password, run))
+
+    for ctx in contexts:
+        tokens = app.test_client().post('/api/auth/token', json={'email': ctx.user['email'], 'password': password})
+        ctx.refresh_token = tokens.get_json()['refreshToken']
+        ctx.sync_token = ctx.client.get('/api/sync').get_json()['token']
+        ctx.job_id = ctx.client.post('/api/recommendations/refresh').get_json()['id']
+        ctx.image_path = ctx.client.get(f'/api/images/{ctx.course(0)}?w=320',
+                                        headers={'Accept': 'image/webp'}).headers['Location']
+    return contexts
+
+def run_scenarios(app, db, contexts, requests, warmup, only=None):
+    from sqlalchemy import event
+
+    queries = [0]
+
+    def count(*args):
+        queries[0] += 1
+
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        event.listen(engine, 'after_cursor_execute', count)
+
+    results = {}
+    counter = itertools.count()
+    for name, rule, method, make_request in SCENARIOS:
+        if only and name not in only:
+            continue
+        latencies, query_counts, errors = [], [], 0
+        for n in range(warmup + requests):
+            i = next(counter)
+            ctx = contexts[n % len(contexts)]
+            path, options = make_request(ctx, i)
+            options = dict(options)
+            client = app.test_client() if options.pop('fresh', False) else ctx.client
+            before = queries[0]
+            started = time.perf_counter()
+            response = client.open(path, method=method, **options)
+            response.get_data()
+            elapsed = time.perf_counter() - started
+            if n < warmup:
+                continue
+            latencies.append(elapsed * 1000)
+            query_counts.append(queries[0] - before)
+            errors += response.status_code >= 400
+        latencies.sort()
+        results[name] = {
+            'route': f'{method} {rule}',
+            'requests': requests,
+            'errors': errors,
+            'p50_ms': round(percentile(latencies, 0.50), 2),
+            'p95_ms': round(percentile(latencies, 0.95), 2),
+            'p99_ms': round(percentile(latencies, 0.99), 2),
+            'queries': round(statistics.mean(query_counts), 2),
+        }
+
+    for engine in engines:
+        event.remove(engine, 'after_cursor_execute', count)
+    return results
+
+def compare(results, baseline, tolerance, floor_ms):
+    # Lines describing regressions against the baseline's endpoints
+    regressions = []
+    for name, old in baseline['endpoints'].items():
+        new = results.get(name)
+        if new is None:
+            continue
+        if new['queries'] > old['queries']:
+            regressions.append(f"{name}: {old['queries']} -> {new['queries']} queries per request")
+        if new['p95_ms'] > old['p95_ms'] * (1 + tolerance) and new['p95_ms'] - old['p95_ms'] > floor_ms:
+            regressions.append(f"{name}: p95 {old['p95_ms']} -> {new['p95_ms']} ms")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark every endpoint against generated data')
+    parser.add_argument('--database-url', help='use this database as it is instead of generating one')
+    parser.add_argument('--users', type=int, default=200, help='users to generate')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--sample-users', type=int, default=20, help='generated users the requests rotate through')
+    parser.add_argument('--requests', type=int, default=50, help='timed requests per endpoint')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--endpoint', action='append', help='only run this scenario (repeatable)')
+    parser.add_argument('--cache', action='store_true', help='keep the response cache on')
+    parser.add_argument('--save', metavar='PATH', help='write the results as a JSON baseline')
+    parser.add_argument('--compare', metavar='PATH', help='compare against a saved baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed p95 slowdown, as a fraction')
+    parser.add_argument('--floor-ms', type=float, default=1.0, help='ignore p95 changes smaller than this')
+    args = parser.parse_args()
+
+    workdir = None
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        workdir = tempfile.mkdtemp(prefix='bench-endpoints-')
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ['AUTH_RATE_LIMIT_ENABLED'] = '0'
+    # Cover images come from local files, into a cache that starts empty
+    imagedir = tempfile.mkdtemp(prefix='bench-images-')
+    write_images(os.path.join(imagedir, 'sources'))
+    os.environ['IMAGE_FETCHER'] = 'directory'
+    os.environ['IMAGE_FETCH_ROOT'] = os.path.join(imagedir, 'sources')
+    os.environ['IMAGE_CACHE_DIR'] = os.path.join(imagedir, 'cache')
+    if not args.cache:
+        os.environ['CACHE_ENABLED'] = '0'
+    # Query-heavy endpoints are what is being measured here
+    logging.getLogger('metrics').setLevel(logging.ERROR)
+
+    from app import create_app, db
+    from migrations import upgrade
+    from datagen import PASSWORD, Scale, generate, rebuild_derived
+
+    scale = Scale(users=args.users)
+    app = create_app()
+    with app.app_context():
+        upgrade(db.engine)
+    if workdir:
+        with app.app_context():
+            generate(db.engine, scale, args.seed, log=None)
+            rebuild_derived(db.engine, log=None)
+
+    missing = uncovered_routes(app)
+    if missing:
+        print('No scenario for: ' + ', '.join(f'{method} {rule}' for rule, method in missing), file=sys.stderr)
+
+    contexts = build_contexts(app, db, PASSWORD, args.sample_users)
+    results = run_scenarios(app, db, contexts, args.requests, args.warmup, args.endpoint)
+
+    print(f'{"endpoint":<26}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"queries":>9}{"errors":>8}')
+    for name, result in results.items():
+        print(f'{name:<26}{result["p50_ms"]:>9.2f}{result["p95_ms"]:>9.2f}{result["p99_ms"]:>9.2f}'
+              f'{result["queries"]:>9.2f}{result["errors"]:>8}')
+
+    if args.save:
+        baseline = {
+            'scale': scale.to_dict() if workdir else None,
+            'seed': args.seed,
+            'requests': args.requests,
+            'endpoints': results,
+        }
+        with open(args.save, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance, args.floor_ms)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if regressions:
+            raise SystemExit(1)
+
+    if workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+    shutil.rmtree(imagedir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import argparse
+import gc
+import os
+import statistics
+import time
+
+# Measures what the request instrumentation costs: the same mix of GET
+# requests runs with metrics off and on, in many short back-to-back pairs
+# whose order alternates, and the median of the pairs' differences is
+# reported. Single long runs drift by more than the 2% being measured.
+#
+#   python bench_metrics.py --requests 200 --rounds 40
+
+PATHS = (
+    '/api/courses',
+    '/api/events?limit=100',
+    '/api/attendance?limit=100',
+    '/api/recommendations?limit=100',
+    '/api/dashboard',
+)
+
+def run(client, paths, requests):
+    gc.collect()
+    started = time.perf_counter()
+    for i in range(requests):
+        response = client.get(paths[i % len(paths)])
+        assert response.status_code == 200, response.status_code
+    return time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark request instrumentation overhead')
+    parser.add_argument('--database-url', default='sqlite:///:memory:')
+    parser.add_argument('--rows', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=200, help='requests per timed run')
+    parser.add_argument('--rounds', type=int, default=40, help='pairs of runs, metrics off and on')
+    parser.add_argument('--budget', type=float, default=2.0, help='allowed overhead in percent')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database_url
+    os.environ['CACHE_ENABLED'] = '0'
+    from app import create_app
+    from models import db
+    from migrations import upgrade
+    from metrics import metrics
+    from bench_serialization import seed
+
+    app = create_app()
+    with app.app_context():
+        upgrade(db.engine)
+        user_id = seed(db, args.rows)
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+    run(client, PATHS, len(PATHS) * 10)
+
+    timings = {True: [], False: []}
+    for round_number in range(args.rounds):
+        for enabled in ((False, True) if round_number % 2 else (True, False)):
+            metrics.enabled = enabled
+            timings[enabled].append(run(client, PATHS, args.requests))
+    metrics.enabled = True
+
+    off, on = statistics.median(timings[False]), statistics.median(timings[True])
+    overhead = statistics.median((a - b) / b * 100 for a, b in zip(timings[True], timings[False]))
+    print(f'{"metrics":<10}{"median ms":>10}{"per request us":>16}')
+    for label, elapsed in (('off', off), ('on', on)):
+        print(f'{label:<10}{elapsed * 1000:>10.1f}{elapsed / args.requests * 1e6:>16.1f}')
+    print(f'overhead {overhead:+.2f}% (budget {args.budget:.1f}%)')
+    if overhead > args.budget:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import os
+import time
+from datetime import date, timedelta
+
+# Measures batch recommendation throughput: the vectorized scoring on its own
+# and the full refresh (feature queries, scoring, delete + insert) against a
+# database seeded with synthetic courses, events and attendance.
+#
+#   python bench_recommendations.py --courses 100000
+
+def seed(db, courses, today):
+    from sqlalchemy import insert
+    from models import User, Course, Event, Attendance
+
+    user_count = max(1, courses // 20)
+    db.session.execute(insert(User), [{
+        'username': f'bench{i}', 'email': f'bench{i}@example.com', 'password_hash': 'x',
+    } for i in range(user_count)])
+    user_ids = [row[0] for row in db.session.query(User.id).order_by(User.id)]
+    db.session.execute(insert(Course), [{
+        'user_id': user_ids[i % user_count], 'title': f'Course {i}', 'platform': 'Udemy',
+        'url': f'https://example.com/{i}', 'progress': (i * 7) % 101, 'total_sections': 20,
+        'completed_sections': (i * 7) % 21, 'start_date': today - timedelta(days=i % 90),
+        'end_date': today + timedelta(days=(i % 60) - 10), 'image_url': None,
+    } for i in range(courses)])
+    course_ids = [row[0] for row in db.session.query(Course.id).order_by(Course.id)]
+    db.session.execute(insert(Event), [{
+        'course_id': course_id, 'title': 'Assignment', 'date': today + timedelta(days=i % 20),
+        'type': ('assignment', 'exam', 'lecture')[i % 3], 'description': '',
+    } for i, course_id in enumerate(course_ids)])
+    db.session.execute(insert(Attendance), [{
+        'course_id': course_id, 'date': today - timedelta(days=day),
+        'status': 'absent' if (i + day) % 4 == 0 else 'present', 'notes': '',
+    } for i, course_id in enumerate(course_ids) for day in range(3)])
+    db.session.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark batch recommendation generation')
+    parser.add_argument('--database-url', default='sqlite:///:memory:')
+    parser.add_argument('--courses', type=int, default=100000)
+    parser.add_argument('--batch-size', type=int, default=10000)
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database_url
+    from sqlalchemy import func, select
+    from app import create_app
+    from models import db, Course, Recommendation
+    from migrations import upgrade
+    import recommendations
+
+    today = date.today()
+    app = create_app()
+    with app.app_context():
+        upgrade(db.engine)
+        seed(db, args.courses, today)
+
+        with db.engine.connect() as connection:
+            features = recommendations.load_features(connection, Course.id.isnot(None), today)
+        started = time.perf_counter()
+        scored = recommendations.score(features, today)
+        rows = recommendations.build_rows(features, scored, None)
+        scoring = time.perf_counter() - started
+
+        with db.engine.begin() as connection:
+            started = time.perf_counter()
+            written = recommendations.refresh(connection, batch_size=args.batch_size, today=today)
+            total = time.perf_counter() - started
+            stored = connection.execute(
+                select(func.count()).where(Recommendation.generated.is_(True))
+            ).scalar()
+        assert written == stored == len(rows)
+
+        print(f'{"stage":<24}{"courses":>10}{"seconds":>10}{"courses/s":>12}')
+        print(f'{"score + build rows":<24}{args.courses:>10}{scoring:>10.2f}{args.courses / scoring:>12.0f}')
+        print(f'{"full refresh":<24}{args.courses:>10}{total:>10.2f}{args.courses / total:>12.0f}')
+        print(f'{written} recommendations written')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import os
+import timeit
+from datetime import date, datetime, time, timedelta
+
+# Compares the old ORM + to_dict() + jsonify path with the row-tuple
+# serialization path for each list endpoint, and checks the bytes match.
+#
+#   python bench_serialization.py --rows 5000 --repeat 5
+
+def seed(db, rows):
+    from sqlalchemy import insert
+    from models import User, Course, Event, Attendance, Recommendation
+
+    user = User(username='bench', email='bench@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+    course_count = max(1, rows // 50)
+    db.session.execute(insert(Course), [{
+        'user_id': user.id, 'title': f'Course {i}', 'platform': 'Udemy',
+        'url': f'https://example.com/{i}', 'progress': i % 100, 'total_sections': 20,
+        'completed_sections': i % 20, 'start_date': date(2026, 1, 1),
+        'end_date': date(2026, 6, 1) if i % 3 else None,
+        'image_url': f'https://example.com/{i}.jpg', 'created_at': datetime(2026, 1, 1) + timedelta(minutes=i),
+    } for i in range(course_count)])
+    course_ids = [row[0] for row in db.session.query(Course.id).filter_by(user_id=user.id)]
+    db.session.execute(insert(Event), [{
+        'course_id': course_ids[i % len(course_ids)], 'title': f'Event {i}',
+        'date': date(2026, 1, 1) + timedelta(days=i % 365), 'time': time(i % 24, 30),
+        'type': 'lecture', 'description': 'Café session' if i % 10 == 0 else 'Session',
+    } for i in range(rows)])
+    db.session.execute(insert(Attendance), [{
+        'course_id': course_ids[i % len(course_ids)],
+        'date': date(2026, 1, 1) + timedelta(days=i % 365),
+        'status': ('present', 'absent', 'excused')[i % 3], 'notes': f'Note {i}',
+    } for i in range(rows)])
+    db.session.execute(insert(Recommendation), [{
+        'course_id': course_ids[i % len(course_ids)], 'content': f'Review chapter {i}',
+        'created_at': datetime(2026, 1, 1) + timedelta(minutes=i),
+    } for i in range(rows)])
+    db.session.commit()
+    return user.id
+
+def body(response):
+    return b''.join(response.response) if response.is_streamed else response.get_data()
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark list endpoint serialization')
+    parser.add_argument('--database-url', default='sqlite:///:memory:')
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--backend', default='auto', help='auto, json or orjson')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database_url
+    from flask import jsonify
+    from app import create_app
+    from models import db, Course, Event, Attendance, Recommendation
+    from dashboard import user_course_ids
+    from migrations import upgrade
+    import serialization
+
+    serialization.set_backend(args.backend)
+
+    app = create_app()
+    with app.test_request_context():
+        upgrade(db.engine)
+        user_id = seed(db, args.rows)
+        course_ids = user_course_ids(user_id)
+        cases = {
+            'courses': (Course, Course.user_id == user_id),
+            'events': (Event, Event.course_id.in_(course_ids)),
+            'attendance': (Attendance, Attendance.course_id.in_(course_ids)),
+            'recommendations': (Recommendation, Recommendation.course_id.in_(course_ids)),
+        }
+
+        print(f'{"endpoint":<16}{"rows":>8}{"old ms":>10}{"new ms":>10}{"speedup":>9}')
+        for resource, (model, criterion) in cases.items():
+            def old_path():
+                records = model.query.filter(criterion).order_by(model.id).all()
+                return jsonify([record.to_dict() for record in records]).get_data()
+
+            def new_path():
+                rows = serialization.row_query(resource).filter(criterion).order_by(model.id).all()
+                return body(serialization.list_response(serialization.serialize_rows(resource, rows)))
+
+            old_bytes, new_bytes = old_path(), new_path()
+            assert old_bytes == new_bytes, f'{resource}: output differs from to_dict() + jsonify'
+
+            old_ms = min(timeit.repeat(old_path, number=1, repeat=args.repeat)) * 1000
+            new_ms = min(timeit.repeat(new_path, number=1, repeat=args.repeat)) * 1000
+            count = model.query.filter(criterion).count()
+            print(f'{resource:<16}{count:>8}{old_ms:>10.1f}{new_ms:>10.1f}{old_ms / new_ms:>8.1f}x')
+
+if __name__ == '__main__':
+    main()
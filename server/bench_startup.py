@@ -0,0 +1,140 @@
+import argparse
+import gc
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Startup benchmark: what a fresh interpreter spends importing app.py and
+# building the app, what a worker without preloading spends before its first
+# response, and what a preloaded worker (gunicorn.conf.py) spends from fork
+# to its first response. Importing and building are timed against a
+# DATABASE_URL that cannot be opened, since neither may touch the database.
+# Exits non-zero if a preloaded worker's median boot is over budget.
+#
+#   python bench_startup.py --runs 20
+
+UNREACHABLE_URL = 'sqlite:////nonexistent/learntrack/startup.db'
+
+# Run in a fresh interpreter; prints the seconds each stage took
+COLD_START = '''
+import time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+timings = [imported - started, created - imported]
+if {user_id} is not None:
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = {user_id}
+    assert client.get('/api/courses').status_code == 200
+    timings.append(time.perf_counter() - started)
+print(*timings)
+'''
+
+def cold_start(database_url, user_id=None):
+    env = {**os.environ, 'DATABASE_URL': database_url, 'SCHEMA_AUTO_UPGRADE': '0'}
+    output = subprocess.run([sys.executable, '-c', COLD_START.format(user_id=user_id)], env=env,
+                            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True,
+                            check=True).stdout
+    return [float(value) for value in output.split()]
+
+def load_settings(database_url):
+    os.environ['DATABASE_URL'] = database_url
+    from config import load_config
+    return load_config()
+
+def seed(database_url):
+    # A user with a few courses; returns the user id
+    from app import create_app
+    from engines import dispose_engines
+    from migrations import upgrade
+    from models import db, User, Course
+
+    app = create_app(load_settings(database_url))
+    with app.app_context():
+        upgrade(db.engine)
+        user = User(username='startup', email='startup@example.com', password_hash='-')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add_all(Course(user_id=user.id, title=f'Course {i}', platform='Udemy', progress=0,
+                                  total_sections=10, completed_sections=0) for i in range(20))
+        db.session.commit()
+        user_id = user.id
+        dispose_engines(db)
+    return user_id
+
+def preloaded_boots(database_url, user_id, runs):
+    # Seconds from fork to each worker's first response
+    from app import create_app, warm_up
+    from engines import dispose_engines
+    from models import db
+
+    app = create_app(load_settings(database_url))
+    warm_up(app)
+    gc.freeze()
+
+    boots = []
+    for _ in range(runs):
+        read_end, write_end = os.pipe()
+        started = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_end)
+            with app.app_context():
+                dispose_engines(db, close=False)
+            client = app.test_client()
+            with client.session_transaction() as session:
+                session['user_id'] = user_id
+            status = client.get('/api/courses').status_code
+            os.write(write_end, f'{status} {time.perf_counter() - started}'.encode())
+            os._exit(0)
+        os.close(write_end)
+        with os.fdopen(read_end) as pipe:
+            status, elapsed = pipe.read().split()
+        os.waitpid(pid, 0)
+        assert status == '200', status
+        boots.append(float(elapsed))
+    return boots
+
+def summary(label, seconds):
+    values = sorted(value * 1000 for value in seconds)
+    p95 = values[max(0, int(len(values) * 0.95 + 0.5) - 1)]
+    print(f'{label:<30}{statistics.median(values):>10.1f}{p95:>10.1f}')
+    return statistics.median(values)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark import time and worker boot')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--budget', type=float, default=200.0, help='preloaded worker boot budget in ms')
+    args = parser.parse_args()
+    if not hasattr(os, 'fork'):
+        raise SystemExit('Needs os.fork')
+
+    workdir = tempfile.mkdtemp(prefix='bench-startup-')
+    database_url = f"sqlite:///{os.path.join(workdir, 'startup.db')}"
+    os.environ['CACHE_ENABLED'] = '0'
+    try:
+        user_id = seed(database_url)
+        unreachable = [cold_start(UNREACHABLE_URL) for _ in range(args.runs)]
+        cold = [cold_start(database_url, user_id) for _ in range(args.runs)]
+        boots = preloaded_boots(database_url, user_id, args.runs)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f'{"stage":<30}{"p50 ms":>10}{"p95 ms":>10}')
+    summary('import app', [run[0] for run in unreachable])
+    summary('create_app (no database)', [run[1] for run in unreachable])
+    summary('worker, no preload', [run[2] for run in cold])
+    boot = summary('worker, preloaded', boots)
+    print(f'preloaded worker boot {boot:.1f} ms (budget {args.budget:.0f} ms)')
+    if boot > args.budget:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,359 @@
+import csv
+import io
+import json
+from datetime import date, time
+from flask import Response, stream_with_context
+from sqlalchemy import insert, select, func, tuple_
+from sqlalchemy.exc import IntegrityError
+from models import db, Course, Event, Attendance
+from dialects import dialect_insert
+from insights import RollupDeltas
+from recommendations import refresh_courses
+from search import reindex_ids
+from recurrence import normalize_rule, series_end
+from serialization import RESOURCES, row_select, dumps
+
+# Bulk import/export for courses, events and attendance.
+#
+# Imports validate every row before touching the database, check course
+# ownership with one query per batch and insert everything with a single
+# executemany in one transaction, which the caller commits. Exports stream
+# rows from a server-side cursor as NDJSON or CSV. Everything takes an
+# optional session, so asgi.py runs the same code through run_sync.
+
+MAX_IMPORT_ROWS = 50000
+EXPORT_BATCH_SIZE = 1000
+
+class BulkError(Exception):
+    def __init__(self, message, status=400, errors=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.errors = errors or []
+
+# Payload parsing
+
+def parse_payload(content_type, data):
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    text = data.decode('utf-8-sig')
+    try:
+        if content_type in ('application/x-ndjson', 'application/ndjson', 'application/jsonl'):
+            rows = [json.loads(line) for line in text.splitlines() if line.strip()]
+        elif content_type in ('text/csv', 'application/csv'):
+            rows = [dict(row) for row in csv.DictReader(io.StringIO(text))]
+        else:
+            rows = json.loads(text)
+    except (ValueError, csv.Error) as e:
+        raise BulkError(f"Could not parse payload: {e}")
+
+    if not isinstance(rows, list):
+        raise BulkError("Payload must be an array of records")
+    if len(rows) > MAX_IMPORT_ROWS:
+        raise BulkError(f"At most {MAX_IMPORT_ROWS} rows per import", status=413)
+    return rows
+
+# Field converters; CSV hands us strings, JSON may hand us typed values
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and value.strip() == '')
+
+def _string(value):
+    return str(value)
+
+def _integer(value):
+    if isinstance(value, bool):
+        raise ValueError("must be an integer")
+    if isinstance(value, int):
+        return value
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        raise ValueError("must be an integer")
+
+def _date(value):
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value).strip())
+    except ValueError:
+        raise ValueError("must be a date in YYYY-MM-DD format")
+
+def _time(value):
+    if isinstance(value, time):
+        return value
+    try:
+        return time.fromisoformat(str(value).strip())
+    except ValueError:
+        raise ValueError("must be a time in HH:MM[:SS] format")
+
+def _recurrence(value):
+    try:
+        return normalize_rule(value)
+    except ValueError as e:
+        # The key is prefixed to the message already
+        raise ValueError(str(e).removeprefix('recurrence '))
+
+# (json key, column name, converter, required)
+IMPORT_FIELDS = {
+    'courses': [
+        ('title', 'title', _string, True),
+        ('platform', 'platform', _string, False),
+        ('url', 'url', _string, False),
+        ('progress', 'progress', _integer, False),
+        ('totalSections', 'total_sections', _integer, False),
+        ('completedSections', 'completed_sections', _integer, False),
+        ('startDate', 'start_date', _date, False),
+        ('endDate', 'end_date', _date, False),
+        ('imageUrl', 'image_url', _string, False),
+    ],
+    'events': [
+        ('courseId', 'course_id', _integer, True),
+        ('title', 'title', _string, True),
+        ('date', 'date', _date, True),
+        ('time', 'time', _time, False),
+        ('type', 'type', _string, False),
+        ('description', 'description', _string, False),
+        ('recurrence', 'recurrence', _recurrence, False),
+    ],
+    'attendance': [
+        ('courseId', 'course_id', _integer, True),
+        ('date', 'date', _date, True),
+        ('status', 'status', _string, True),
+        ('notes', 'notes', _string, False),
+    ],
+}
+
+MODELS = {'courses': Course, 'events': Event, 'attendance': Attendance}
+
+def validate_row(resource, record):
+    if not isinstance(record, dict):
+        return None, ["must be an object"]
+    values, errors = {}, []
+    for key, column, convert, required in IMPORT_FIELDS[resource]:
+        value = record.get(key)
+        if _blank(value):
+            if required:
+                errors.append(f"{key} is required")
+            else:
+                values[column] = None
+            continue
+        try:
+            values[column] = convert(value)
+        except ValueError as e:
+            errors.append(f"{key} {e}")
+    if resource == 'events' and not errors:
+        try:
+            values['series_end'] = series_end(values['date'], values['recurrence'])
+        except ValueError as e:
+            errors.append(str(e))
+    return values, errors
+
+def import_rows(resource, user_id, records, partial=False, session=None):
+    session = session or db.session
+    rows, errors = [], []
+    for index, record in enumerate(records):
+        values, row_errors = validate_row(resource, record)
+        if row_errors:
+            errors.append({'row': index, 'errors': row_errors})
+        else:
+            rows.append((index, values))
+
+    if resource == 'courses':
+        for _, values in rows:
+            values['user_id'] = user_id
+    else:
+        rows = _check_ownership(session, user_id, rows, errors)
+
+    errors.sort(key=lambda error: error['row'])
+    if errors and not partial:
+        raise BulkError("Import rejected; no rows were written", status=422, errors=errors)
+
+    if rows:
+        deltas = RollupDeltas()
+        for _, values in rows:
+            if resource == 'attendance':
+                deltas.attendance(user_id, values['date'], values['status'])
+            elif resource == 'events':
+                deltas.event(user_id, values['date'], values['type'], values.get('recurrence'))
+        try:
+            model = MODELS[resource]
+            ids = session.scalars(insert(model).returning(model.id), [values for _, values in rows]).all()
+            reindex_ids(session.connection(), resource, ids)
+            deltas.apply(session)
+            if resource == 'courses':
+                refresh_courses(select(Course.id).where(Course.user_id == user_id), session=session)
+            else:
+                refresh_courses({values['course_id'] for _, values in rows}, session=session)
+        except IntegrityError:
+            session.rollback()
+            raise BulkError("Import conflicts with existing records; no rows were written", status=409)
+    return {'imported': len(rows), 'errors': errors}
+
+def _check_ownership(session, user_id, rows, errors):
+    # One ownership check for the whole batch
+    requested = {values['course_id'] for _, values in rows}
+    owned = set(session.scalars(
+        select(Course.id).where(Course.user_id == user_id, Course.id.in_(requested))
+    )) if requested else set()
+    valid = []
+    for index, values in rows:
+        if values['course_id'] in owned:
+            valid.append((index, values))
+        else:
+            errors.append({'row': index, 'errors': [f"courseId {values['course_id']} not found"]})
+    return valid
+
+# Attendance marking
+
+def _locked_marks(session, keys):
+    # Current rows for (course_id, date) keys, locked until the caller commits
+    return {
+        (row.course_id, row.date): row
+        for row in session.execute(
+            select(Attendance.id, Attendance.course_id, Attendance.date, Attendance.status, Attendance.notes)
+            .where(tuple_(Attendance.course_id, Attendance.date).in_(keys))
+            .with_for_update()
+        )
+    }
+
+def _mark(row):
+    return {'id': row.id, 'courseId': row.course_id, 'date': row.date.isoformat(), 'status': row.status}
+
+def mark_attendance(user_id, records, session=None):
+    # Upserts many (course, date) marks at once. Marks that would not change
+    # anything are skipped, so retrying a request is a no-op.
+    session = session or db.session
+    marks, errors = {}, []
+    for index, record in enumerate(records):
+        values, row_errors = validate_row('attendance', record)
+        if row_errors:
+            errors.append({'row': index, 'errors': row_errors})
+            continue
+        if isinstance(record, dict) and 'notes' not in record:
+            values.pop('notes')
+        marks[(values['course_id'], values['date'])] = (index, values)
+
+    valid = _check_ownership(session, user_id, list(marks.values()), errors)
+    if errors:
+        errors.sort(key=lambda error: error['row'])
+        raise BulkError("Marks rejected; no rows were written", status=422, errors=errors)
+    if not valid:
+        return {'created': [], 'updated': [], 'unchanged': 0}
+
+    try:
+        upsert = dialect_insert(Attendance, session.get_bind().dialect.name)
+    except NotImplementedError as e:
+        raise BulkError(str(e), status=501)
+    returning = (Attendance.id, Attendance.course_id, Attendance.date, Attendance.status, Attendance.version)
+    existing = _locked_marks(session, [(values['course_id'], values['date']) for _, values in valid])
+
+    # New keys first, with DO NOTHING: the rows that come back are the ones
+    # this request created. A key another request inserted since the read
+    # comes back empty and is locked and handled as an update instead.
+    created, written, inserted = [], [], set()
+    deltas = RollupDeltas()
+    fresh = [values for _, values in valid if (values['course_id'], values['date']) not in existing]
+    if fresh:
+        statement = upsert.on_conflict_do_nothing(index_elements=['course_id', 'date']).returning(*returning)
+        for row in session.execute(statement, [{'notes': None, **values} for values in fresh]):
+            inserted.add((row.course_id, row.date))
+            written.append(row.id)
+            created.append(_mark(row))
+            deltas.attendance(user_id, row.date, row.status)
+        lost = [key for key in ((values['course_id'], values['date']) for values in fresh) if key not in inserted]
+        if lost:
+            existing.update(_locked_marks(session, lost))
+
+    changes, unchanged = [], 0
+    for _, values in valid:
+        key = (values['course_id'], values['date'])
+        if key in inserted:
+            continue
+        current = existing[key]
+        # Missing or blank notes keep whatever was recorded before
+        notes = values['notes'] if values.get('notes') is not None else current.notes
+        if current.status == values['status'] and current.notes == notes:
+            unchanged += 1
+            continue
+        changes.append(values)
+
+    updated = []
+    if changes:
+        statement = upsert.on_conflict_do_update(
+            index_elements=['course_id', 'date'],
+            set_={
+                'status': upsert.excluded.status,
+                'notes': func.coalesce(upsert.excluded.notes, Attendance.notes),
+                # ON CONFLICT DO UPDATE skips the column's onupdate
+                'updated_at': upsert.excluded.updated_at,
+                'version': Attendance.version + 1,
+            },
+        ).returning(*returning)
+        for row in session.execute(statement, [{'notes': None, **values} for values in changes]):
+            written.append(row.id)
+            if row.version == 1:
+                # Inserted after all: the row was gone by the time of the write
+                created.append(_mark(row))
+                deltas.attendance(user_id, row.date, row.status)
+                continue
+            previous = existing[(row.course_id, row.date)].status
+            updated.append({**_mark(row), 'previousStatus': previous})
+            deltas.attendance_status(user_id, row.date, previous, row.status)
+
+    if written:
+        reindex_ids(session.connection(), 'attendance', written)
+        deltas.apply(session)
+        refresh_courses({values['course_id'] for values in fresh + changes}, session=session)
+
+    return {'created': created, 'updated': updated, 'unchanged': unchanged}
+
+# Export
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+def export_select(resource, user_id):
+    model = MODELS[resource]
+    query = row_select(resource)
+    if resource == 'courses':
+        query = query.where(Course.user_id == user_id)
+    else:
+        query = query.where(model.course_id.in_(select(Course.id).where(Course.user_id == user_id)))
+    # yield_per streams from a server-side cursor instead of buffering all rows
+    return query.order_by(model.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+def export_encoder(resource, export_format):
+    # Encodes each successive batch of rows as the next chunk of the export
+    if export_format not in EXPORT_FORMATS:
+        raise BulkError(f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    _, serializer = RESOURCES[resource]
+    if export_format == 'ndjson':
+        return lambda rows: b''.join(dumps(serializer(row)) + b'\n' for row in rows)
+
+    buffer = io.StringIO()
+    writer = None
+
+    def encode(rows):
+        nonlocal writer
+        buffer.seek(0)
+        buffer.truncate()
+        for row in rows:
+            item = serializer(row)
+            if writer is None:
+                writer = csv.DictWriter(buffer, fieldnames=list(item))
+                writer.writeheader()
+            writer.writerow(item)
+        return buffer.getvalue().encode()
+    return encode
+
+def export_headers(resource, export_format):
+    return {'Content-Disposition': f'attachment; filename={resource}.{export_format}'}
+
+def export_response(resource, user_id, export_format):
+    encode = export_encoder(resource, export_format)
+    result = db.session.execute(export_select(resource, user_id))
+    chunks = (encode(rows) for rows in result.partitions())
+    return Response(stream_with_context(chunks), mimetype=EXPORT_FORMATS[export_format],
+                    headers=export_headers(resource, export_format))
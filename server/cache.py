@@ -0,0 +1,278 @@
+import hashlib
+import json
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+from flask import Response, g, request
+from werkzeug.http import parse_date, parse_etags
+
+# Read-through response cache for the per-user GET endpoints.
+#
+# Entries are keyed by (user_id, resource, query params) plus a per-user
+# generation number. Invalidating a user just bumps their generation, which
+# orphans exactly that user's entries; they are then dropped by TTL/LRU.
+
+class MemoryBackend:
+    # In-process LRU with per-entry TTL, for a single worker
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _live_counter(self, key, now):
+        count, expires_at = self._counters.get(key, (0, None))
+        if expires_at is not None and expires_at <= now:
+            del self._counters[key]
+            return 0, None
+        return count, expires_at
+
+    def incr(self, key, ttl=None):
+        # `ttl` applies when the counter is created, like INCR + EXPIRE NX
+        now = time.monotonic()
+        with self._lock:
+            count, expires_at = self._live_counter(key, now)
+            if count == 0 and ttl:
+                expires_at = now + ttl
+            self._counters[key] = (count + 1, expires_at)
+            if len(self._counters) > self.max_entries * 4:
+                for name in [name for name, (_, at) in self._counters.items() if at is not None and at <= now]:
+                    del self._counters[name]
+            return count + 1
+
+    def counter(self, key):
+        with self._lock:
+            return self._live_counter(key, time.monotonic())[0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._counters.clear()
+
+class RedisBackend:
+    # Works with any client exposing the redis-py get/set/incr API, including
+    # FakeRedis below. LRU eviction is left to the server's maxmemory-policy.
+
+    def __init__(self, client, prefix='learntrack:cache:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=ttl)
+
+    def incr(self, key, ttl=None):
+        value = self.client.incr(self.prefix + key)
+        if ttl and value == 1:
+            self.client.expire(self.prefix + key, ttl)
+        return value
+
+    def counter(self, key):
+        value = self.client.get(self.prefix + key)
+        return int(value) if value is not None else 0
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + '*'):
+            self.client.delete(key)
+
+class FakeRedis:
+    # Minimal in-memory stand-in for a redis client, for local runs and tests
+
+    def __init__(self):
+        self._data = {}
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(key)
+            return entry[0] if entry else None
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ex if ex else None)
+        return True
+
+    def incr(self, key):
+        with self._lock:
+            entry = self._live(key)
+            value = int(entry[0]) + 1 if entry else 1
+            self._data[key] = (str(value).encode(), entry[1] if entry else None)
+            return value
+
+    def expire(self, key, seconds):
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                return False
+            self._data[key] = (entry[0], time.monotonic() + seconds)
+            return True
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(1 for key in keys if self._data.pop(key, None) is not None)
+
+    def scan_iter(self, match='*'):
+        prefix = match.rstrip('*')
+        with self._lock:
+            keys = [key for key in self._data if key.startswith(prefix)]
+        return iter(keys)
+
+    def publish(self, channel, message):
+        with self._lock:
+            handlers = list(self._channels.get(channel, ()))
+        for handler in handlers:
+            handler({'type': 'message', 'channel': channel, 'data': message})
+        return len(handlers)
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return FakePubSub(self)
+
+class FakePubSub:
+    # Delivers each message from the publisher's thread, so there is no
+    # listener thread to run; run_in_thread() returns the pubsub itself
+
+    def __init__(self, client):
+        self.client = client
+        self.handlers = {}
+
+    def subscribe(self, **handlers):
+        with self.client._lock:
+            for channel, handler in handlers.items():
+                self.client._channels.setdefault(channel, []).append(handler)
+        self.handlers.update(handlers)
+
+    def run_in_thread(self, sleep_time=0, daemon=False):
+        return self
+
+    def stop(self):
+        with self.client._lock:
+            for channel, handler in self.handlers.items():
+                self.client._channels[channel].remove(handler)
+        self.handlers = {}
+
+def create_backend(config):
+    kind = config.get('CACHE_BACKEND', 'memory')
+    if kind == 'memory':
+        return MemoryBackend(config.get('CACHE_MAX_ENTRIES', 1024))
+    if kind == 'fakeredis':
+        return RedisBackend(FakeRedis())
+    if kind == 'redis':
+        import redis
+        return RedisBackend(redis.Redis.from_url(config['REDIS_URL']))
+    raise ValueError(f"Unknown CACHE_BACKEND: {kind}")
+
+class ResponseCache:
+    def __init__(self):
+        self.backend = None
+        self.ttl = 300
+        self.enabled = True
+
+    def init_app(self, app):
+        self.configure(app.config)
+
+    def configure(self, config):
+        self.backend = create_backend(config)
+        self.ttl = config.get('CACHE_TTL', 300)
+        self.enabled = config.get('CACHE_ENABLED', True)
+
+    def _generation_key(self, user_id):
+        return f'gen:{user_id}'
+
+    def key(self, user_id, resource, params):
+        generation = self.backend.counter(self._generation_key(user_id))
+        digest = hashlib.sha1(
+            json.dumps(sorted(params.items(multi=True)), separators=(',', ':')).encode()
+        ).hexdigest()
+        return f'{user_id}:{generation}:{resource}:{digest}'
+
+    def lookup(self, user_id, resource, params):
+        key = self.key(user_id, resource, params)
+        return key, self.backend.get(key)
+
+    def store(self, key, body, headers):
+        entry = {
+            'body': body,
+            'etag': hashlib.sha1(body).hexdigest(),
+            'last_modified': datetime.now(timezone.utc).replace(microsecond=0),
+            'headers': headers,
+        }
+        self.backend.set(key, entry, self.ttl)
+        return entry
+
+    def invalidate_user(self, user_id):
+        if self.backend is not None:
+            self.backend.incr(self._generation_key(user_id))
+
+    def cached(self, resource, headers=()):
+        # View decorator; `headers` lists response headers worth replaying on
+        # a cache hit (e.g. the pagination cursor)
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                if not self.enabled or self.backend is None:
+                    return f(*args, **kwargs)
+
+                key, entry = self.lookup(g.get('user_id'), resource, request.args)
+                if entry is None:
+                    response = f(*args, **kwargs)
+                    if not isinstance(response, Response) or response.status_code != 200:
+                        return response
+                    entry = self.store(key, response.get_data(),
+                                       {name: response.headers[name] for name in headers if name in response.headers})
+
+                response = Response(entry['body'], mimetype='application/json')
+                response.headers.update(entry['headers'])
+                response.set_etag(entry['etag'])
+                response.last_modified = entry['last_modified']
+                response.cache_control.private = True
+                response.cache_control.no_cache = True
+                return response.make_conditional(request)
+            return decorated_function
+        return decorator
+
+def not_modified(entry, if_none_match, if_modified_since):
+    # make_conditional's check, for servers without a werkzeug Response
+    if if_none_match:
+        return parse_etags(if_none_match).contains_weak(entry['etag'])
+    since = parse_date(if_modified_since)
+    return since is not None and entry['last_modified'] <= since
+
+cache = ResponseCache()
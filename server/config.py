@@ -0,0 +1,285 @@
+import os
+import secrets
+from sqlalchemy.engine import make_url
+
+# Configuration profiles.
+#
+# APP_PROFILE picks one of PROFILES (development, production, testing); any
+# setting can still be overridden from the environment. The DB_* settings are
+# turned into SQLALCHEMY_ENGINE_OPTIONS for whichever database DATABASE_URL
+# points at, and DATABASE_REPLICA_URL adds a read-only engine that GET
+# requests are routed to.
+
+def _env(name, default, cast=str):
+    value = os.getenv(name)
+    if value is None or value == '':
+        return default
+    if cast is bool:
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    return cast(value)
+
+def _pragmas(value):
+    # "journal_mode=WAL,synchronous=NORMAL", or "off" for SQLite's defaults
+    if value.lower() == 'off':
+        return {}
+    return dict(item.strip().split('=', 1) for item in value.split(',') if item.strip())
+
+class Config:
+    PROFILE = 'base'
+    DATABASE_URL = 'sqlite:///learning_dashboard.db'
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Per-process pool: gunicorn workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+    # must stay below the server's connection limit
+    DB_POOL_SIZE = 5
+    DB_MAX_OVERFLOW = 10
+    DB_POOL_TIMEOUT = 30
+    DB_POOL_RECYCLE = -1
+    DB_POOL_PRE_PING = False
+    DB_STATEMENT_TIMEOUT_MS = 0
+    DB_ECHO = False
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'cache_size': -20000,
+        'temp_store': 'MEMORY',
+    }
+    REPLICA_STICKY_SECONDS = 5
+
+    # Per-route histograms on /metrics plus a Server-Timing header; requests
+    # issuing more than METRICS_QUERY_THRESHOLD queries and queries slower than
+    # SLOW_QUERY_MS are logged
+    METRICS_ENABLED = True
+    METRICS_SERVER_TIMING = True
+    METRICS_QUERY_THRESHOLD = 20
+    SLOW_QUERY_MS = 250
+
+    CACHE_ENABLED = True
+    CACHE_BACKEND = 'memory'
+    CACHE_TTL = 300
+    CACHE_MAX_ENTRIES = 1024
+    REDIS_URL = None
+
+    # Live updates: 'local' when one process serves both writes and streams,
+    # 'redis' (on REDIS_URL) once app.py, asgi.py or the workers are separate
+    LIVE_BROKER = 'local'
+    LIVE_COALESCE_MS = 250
+    LIVE_HEARTBEAT_SECONDS = 15
+
+    # POSTs sent with an Idempotency-Key are answered once and replayed for
+    # retries within IDEMPOTENCY_TTL seconds
+    IDEMPOTENCY_ENABLED = True
+    IDEMPOTENCY_TTL = 24 * 3600
+
+    # `archive.py archive` keeps the last ARCHIVE_HOT_TERMS half-year terms of
+    # attendance and events live and moves older rows to files in ARCHIVE_DIR;
+    # their lists and the dashboard default to those terms
+    ARCHIVE_DIR = 'archive'
+    ARCHIVE_HOT_TERMS = 2
+
+    # Course cover images are fetched through IMAGE_FETCHER ('http' or
+    # 'directory', reading IMAGE_FETCH_ROOT offline) and cached resized in
+    # IMAGE_CACHE_DIR, up to IMAGE_CACHE_MAX_BYTES
+    IMAGE_FETCHER = 'http'
+    IMAGE_FETCH_ROOT = None
+    IMAGE_FETCH_TIMEOUT = 10.0
+    IMAGE_MAX_BYTES = 10 * 1024 * 1024
+    IMAGE_CACHE_DIR = 'image-cache'
+    IMAGE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+    JOB_CONCURRENCY = 2
+    JOB_POOL = 'thread'
+    JOB_POLL_INTERVAL = 1.0
+    JOB_MAX_ATTEMPTS = 3
+    JOB_RETRY_DELAY = 5.0
+    JOB_LOCK_TIMEOUT = 600
+
+    # Threads the ASGI app uses for password hashing
+    HASH_THREADS = 4
+
+    # 'auto' is argon2 when argon2-cffi is installed, else pbkdf2; pick costs
+    # for your hardware with `python passwords.py calibrate --budget-ms 50`
+    PASSWORD_HASHER = 'auto'
+    PASSWORD_PBKDF2_ITERATIONS = 600000
+    PASSWORD_SCRYPT_N = 2 ** 15
+    PASSWORD_ARGON2_TIME_COST = 2
+    PASSWORD_ARGON2_MEMORY_COST = 19456
+    PASSWORD_ARGON2_PARALLELISM = 1
+
+    ACCESS_TOKEN_TTL = 900
+    REFRESH_TOKEN_TTL = 30 * 24 * 3600
+    # Rate limit counters live on CACHE_BACKEND, so use redis to share them
+    # between workers
+    AUTH_RATE_LIMIT_ENABLED = True
+    AUTH_IP_LIMIT = 20
+    AUTH_IP_WINDOW = 60
+    AUTH_ACCOUNT_LIMIT = 5
+    AUTH_ACCOUNT_WINDOW = 900
+
+class DevelopmentConfig(Config):
+    PROFILE = 'development'
+    # SQLite connections are cheap to hold; keep enough that a threaded
+    # server never churns overflow connections
+    DB_POOL_SIZE = 20
+    DB_MAX_OVERFLOW = 10
+
+class ProductionConfig(Config):
+    PROFILE = 'production'
+    DATABASE_URL = None
+    DB_POOL_SIZE = 5
+    DB_MAX_OVERFLOW = 5
+    DB_POOL_TIMEOUT = 10
+    DB_POOL_RECYCLE = 1800
+    DB_POOL_PRE_PING = True
+    DB_STATEMENT_TIMEOUT_MS = 5000
+    # gunicorn runs several workers, which must share invalidations, pushes
+    # and rate limit counters
+    CACHE_BACKEND = 'redis'
+    LIVE_BROKER = 'redis'
+
+class TestingConfig(Config):
+    PROFILE = 'testing'
+    TESTING = True
+    DATABASE_URL = 'sqlite:///:memory:'
+    # In-memory databases start empty
+    SCHEMA_AUTO_UPGRADE = True
+    SQLITE_PRAGMAS = {'busy_timeout': 5000}
+    CACHE_ENABLED = False
+    JOB_RETRY_DELAY = 0.0
+    PASSWORD_HASHER = 'pbkdf2'
+    PASSWORD_PBKDF2_ITERATIONS = 1000
+    AUTH_RATE_LIMIT_ENABLED = False
+
+PROFILES = {
+    'development': DevelopmentConfig,
+    'production': ProductionConfig,
+    'testing': TestingConfig,
+}
+
+# Settings read from the environment, with their types
+ENVIRONMENT = {
+    'DATABASE_URL': str,
+    'DATABASE_REPLICA_URL': str,
+    'SECRET_KEY': str,
+    'DB_POOL_SIZE': int,
+    'DB_MAX_OVERFLOW': int,
+    'DB_POOL_TIMEOUT': int,
+    'DB_POOL_RECYCLE': int,
+    'DB_POOL_PRE_PING': bool,
+    'DB_STATEMENT_TIMEOUT_MS': int,
+    'DB_ECHO': bool,
+    'SCHEMA_AUTO_UPGRADE': bool,
+    'SQLITE_PRAGMAS': _pragmas,
+    'REPLICA_STICKY_SECONDS': float,
+    'METRICS_ENABLED': bool,
+    'METRICS_SERVER_TIMING': bool,
+    'METRICS_QUERY_THRESHOLD': int,
+    'SLOW_QUERY_MS': int,
+    'CACHE_ENABLED': bool,
+    'CACHE_BACKEND': str,
+    'CACHE_TTL': int,
+    'CACHE_MAX_ENTRIES': int,
+    'REDIS_URL': str,
+    'LIVE_BROKER': str,
+    'LIVE_COALESCE_MS': int,
+    'LIVE_HEARTBEAT_SECONDS': int,
+    'IDEMPOTENCY_ENABLED': bool,
+    'IDEMPOTENCY_TTL': int,
+    'ARCHIVE_DIR': str,
+    'ARCHIVE_HOT_TERMS': int,
+    'IMAGE_FETCHER': str,
+    'IMAGE_FETCH_ROOT': str,
+    'IMAGE_FETCH_TIMEOUT': float,
+    'IMAGE_MAX_BYTES': int,
+    'IMAGE_CACHE_DIR': str,
+    'IMAGE_CACHE_MAX_BYTES': int,
+    'JOB_CONCURRENCY': int,
+    'JOB_POOL': str,
+    'JOB_POLL_INTERVAL': float,
+    'JOB_MAX_ATTEMPTS': int,
+    'JOB_RETRY_DELAY': float,
+    'JOB_LOCK_TIMEOUT': int,
+    'HASH_THREADS': int,
+    'PASSWORD_HASHER': str,
+    'PASSWORD_PBKDF2_ITERATIONS': int,
+    'PASSWORD_SCRYPT_N': int,
+    'PASSWORD_ARGON2_TIME_COST': int,
+    'PASSWORD_ARGON2_MEMORY_COST': int,
+    'PASSWORD_ARGON2_PARALLELISM': int,
+    'ACCESS_TOKEN_TTL': int,
+    'REFRESH_TOKEN_TTL': int,
+    'AUTH_RATE_LIMIT_ENABLED': bool,
+    'AUTH_IP_LIMIT': int,
+    'AUTH_IP_WINDOW': int,
+    'AUTH_ACCOUNT_LIMIT': int,
+    'AUTH_ACCOUNT_WINDOW': int,
+}
+
+def engine_options(url, settings):
+    url = make_url(url)
+    options = {'echo': settings['DB_ECHO']}
+    if url.get_backend_name() == 'sqlite':
+        if url.database in (None, '', ':memory:'):
+            # In-memory databases use a single static connection
+            return options
+        options.update(pool_size=settings['DB_POOL_SIZE'], max_overflow=settings['DB_MAX_OVERFLOW'],
+                       pool_timeout=settings['DB_POOL_TIMEOUT'])
+        return options
+
+    options.update(
+        pool_size=settings['DB_POOL_SIZE'],
+        max_overflow=settings['DB_MAX_OVERFLOW'],
+        pool_timeout=settings['DB_POOL_TIMEOUT'],
+        pool_recycle=settings['DB_POOL_RECYCLE'],
+        pool_pre_ping=settings['DB_POOL_PRE_PING'],
+    )
+    if settings['DB_STATEMENT_TIMEOUT_MS'] and url.get_backend_name() == 'postgresql':
+        options['connect_args'] = {'options': f"-c statement_timeout={settings['DB_STATEMENT_TIMEOUT_MS']}"}
+    return options
+
+# Backends that only reach the process they live in
+PROCESS_LOCAL = {'CACHE_BACKEND': 'memory', 'LIVE_BROKER': 'local'}
+
+def process_local_backends(settings):
+    # Settings naming a backend in use that only reaches this process
+    return [name for name, kind in PROCESS_LOCAL.items()
+            if settings[name] == kind and (name != 'CACHE_BACKEND' or settings['CACHE_ENABLED'])]
+
+def check_shared_backends(settings, processes):
+    # With several processes, an invalidation or push on a process-local
+    # backend never reaches the others
+    if processes < 2:
+        return
+    for name in process_local_backends(settings):
+        raise ValueError(f"{name}={settings[name]} does not reach other processes; "
+                         f"use redis with {processes} workers")
+
+def load_config(profile=None):
+    profile = profile or os.getenv('APP_PROFILE', 'development')
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown APP_PROFILE: {profile}")
+
+    base = PROFILES[profile]
+    settings = {name: getattr(base, name) for name in dir(base) if name.isupper()}
+    for name, cast in ENVIRONMENT.items():
+        settings[name] = _env(name, settings.get(name), cast)
+    if not settings['DATABASE_URL']:
+        raise ValueError(f"DATABASE_URL must be set for the {profile} profile")
+    if 'redis' in (settings['CACHE_BACKEND'], settings['LIVE_BROKER']) and not settings['REDIS_URL']:
+        raise ValueError("REDIS_URL must be set for the redis cache and live broker")
+    if not settings.get('SECRET_KEY'):
+        if profile == 'production':
+            # A per-process key would sign sessions and tokens no other
+            # worker, or the next deploy, accepts
+            raise ValueError("SECRET_KEY must be set for the production profile")
+        settings['SECRET_KEY'] = secrets.token_hex(16)
+
+    settings['SQLALCHEMY_DATABASE_URI'] = settings['DATABASE_URL']
+    settings['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(settings['DATABASE_URL'], settings)
+    if settings['DATABASE_REPLICA_URL']:
+        settings['SQLALCHEMY_BINDS'] = {'replica': {
+            'url': settings['DATABASE_REPLICA_URL'],
+            **engine_options(settings['DATABASE_REPLICA_URL'], settings),
+        }}
+    return settings
@@ -0,0 +1,164 @@
+from sqlalchemy import select, union_all, literal, null, cast, Integer, String, Date, Time, Text
+from models import db, Course, Event, Attendance, Recommendation, WeeklyInsight
+from insights import week_window
+from archive import live_since
+from serialization import isoformat, time_string, course_row, row_select
+
+SECTIONS = ('courses', 'events', 'attendance', 'recommendations', 'insights')
+
+def user_course_ids(user_id):
+    # Subquery of the user's course ids, so child tables never need a
+    # separate round trip to look the courses up first
+    return select(Course.id).where(Course.user_id == user_id)
+
+def _event_row(row):
+    return {
+        'id': row.id,
+        'courseId': row.course_id,
+        'title': row.title,
+        'date': isoformat(row.date),
+        'time': time_string(row.time),
+        'type': row.type,
+        'description': row.text,
+        'recurrence': row.status
+    }
+
+def _attendance_row(row):
+    return {
+        'id': row.id,
+        'courseId': row.course_id,
+        'date': isoformat(row.date),
+        'status': row.status,
+        'notes': row.text,
+        'version': row.n1
+    }
+
+def _recommendation_row(row):
+    return {
+        'id': row.id,
+        'courseId': row.course_id,
+        'title': row.title,
+        'description': row.text,
+        'priority': row.status
+    }
+
+def _insight_row(row):
+    return {
+        'weekStarting': isoformat(row.date),
+        'sectionsCompleted': row.n1,
+        'coursesProgressed': row.n2,
+        'attendanceRate': round(row.n3 * 100 / row.n4) if row.n4 else None,
+        'upcomingDeadlines': row.n5
+    }
+
+_CHILD_SERIALIZERS = {
+    'events': _event_row,
+    'attendance': _attendance_row,
+    'recommendations': _recommendation_row,
+    'insights': _insight_row,
+}
+
+_UNION_COLUMNS = ('section', 'id', 'course_id', 'title', 'date', 'time', 'type', 'status', 'text',
+                  'n1', 'n2', 'n3', 'n4', 'n5')
+
+def _union_select(section, id, course_id=None, title=None, date=None, time=None,
+                  type=None, status=None, text=None, counters=()):
+    # Every child collection is projected onto the same column layout so they
+    # can all be fetched with a single UNION ALL; n1..n5 carry insight counters
+    # (and the attendance version)
+    counters = tuple(counters) + (None,) * (5 - len(counters))
+    columns = (
+        literal(section, String),
+        id,
+        course_id if course_id is not None else cast(null(), Integer),
+        title if title is not None else cast(null(), String),
+        date if date is not None else cast(null(), Date),
+        time if time is not None else cast(null(), Time),
+        type if type is not None else cast(null(), String),
+        status if status is not None else cast(null(), String),
+        text if text is not None else cast(null(), Text),
+    ) + tuple(
+        counter if counter is not None else cast(null(), Integer) for counter in counters
+    )
+    return select(*[column.label(name) for column, name in zip(columns, _UNION_COLUMNS)])
+
+def _child_select(section, user_id, course_ids, since):
+    if section == 'events':
+        return _union_select(
+            section, Event.id, Event.course_id, title=Event.title, date=Event.date,
+            time=Event.time, type=Event.type, status=Event.recurrence, text=Event.description,
+        ).where(Event.course_id.in_(course_ids), live_since('events', since))
+    if section == 'attendance':
+        return _union_select(
+            section, Attendance.id, Attendance.course_id, date=Attendance.date,
+            status=Attendance.status, text=Attendance.notes, counters=(Attendance.version,),
+        ).where(Attendance.course_id.in_(course_ids), live_since('attendance', since))
+    if section == 'recommendations':
+        return _union_select(
+            section, Recommendation.id, Recommendation.course_id, title=Recommendation.title,
+            status=Recommendation.priority, text=Recommendation.content,
+        ).where(Recommendation.course_id.in_(course_ids))
+    first, last = week_window()
+    return _union_select(
+        section, WeeklyInsight.id, date=WeeklyInsight.week_starting,
+        counters=(WeeklyInsight.sections_completed, WeeklyInsight.courses_progressed,
+                  WeeklyInsight.attendance_present, WeeklyInsight.attendance_total,
+                  WeeklyInsight.deadlines),
+    ).where(WeeklyInsight.user_id == user_id, WeeklyInsight.week_starting.between(first, last))
+
+def parse_sections(value):
+    if not value:
+        return list(SECTIONS)
+    requested = [part.strip() for part in value.split(',') if part.strip()]
+    unknown = [part for part in requested if part not in SECTIONS]
+    if unknown:
+        raise ValueError(f"Unknown section(s): {', '.join(unknown)}")
+    return [section for section in SECTIONS if section in requested]
+
+def parse_fields(args):
+    # Accepts fields[<section>]=a,b,c for any of the requested sections
+    fields = {}
+    for section in SECTIONS:
+        value = args.get(f'fields[{section}]')
+        if value:
+            fields[section] = [part.strip() for part in value.split(',') if part.strip()]
+    return fields
+
+def _project(item, selected):
+    if not selected:
+        return item
+    return {key: item[key] for key in selected if key in item}
+
+def dashboard_statements(user_id, since, sections=SECTIONS):
+    # At most two statements: the courses, and one UNION ALL of every other
+    # requested section. Events and attendance are those live at `since`.
+    courses = row_select('courses').where(Course.user_id == user_id) if 'courses' in sections else None
+    children = [section for section in sections if section != 'courses']
+    if not children:
+        return courses, None
+    course_ids = user_course_ids(user_id)
+    selects = [_child_select(section, user_id, course_ids, since) for section in children]
+    return courses, selects[0] if len(selects) == 1 else union_all(*selects)
+
+def assemble_dashboard(sections, fields, course_rows, child_rows):
+    fields = fields or {}
+    snapshot = {}
+    if 'courses' in sections:
+        snapshot['courses'] = [_project(course_row(row), fields.get('courses')) for row in course_rows]
+    for section in sections:
+        if section != 'courses':
+            snapshot[section] = []
+    for row in child_rows:
+        section = row.section
+        snapshot[section].append(
+            _project(_CHILD_SERIALIZERS[section](row), fields.get(section))
+        )
+    return snapshot
+
+def build_dashboard(user_id, since, sections=SECTIONS, fields=None):
+    courses, children = dashboard_statements(user_id, since, sections)
+    return assemble_dashboard(
+        sections, fields,
+        db.session.execute(courses) if courses is not None else (),
+        db.session.execute(children) if children is not None else (),
+    )
@@ -0,0 +1,221 @@
+import argparse
+import random
+import time
+from datetime import date, datetime, timedelta
+from itertools import islice
+from sqlalchemy import func, insert, select, text
+from models import User, Course, Event, Attendance, CourseProgress
+from passwords import passwords
+from recurrence import WEEKDAYS, series_end
+
+# Synthetic data at benchmark scale.
+#
+# Fills users, courses, events, attendance and the progress log with
+# plausible data: courses spread over the last two years, mostly-present
+# attendance, a few weekly series among the events. The same --seed and
+# --today give the same rows. Ids are assigned up front, continuing after
+# whatever is already in the tables, so loading is nothing but batched
+# inserts; on Postgres each chunk then moves the id sequences past them, so
+# the app's own inserts do not collide. Users are generated CHUNK_USERS at
+# a time to keep memory flat.
+# Insights, recommendations and the search index are rebuilt at the end unless
+# --skip-derived is given.
+#
+#   python datagen.py --users 100000 --courses-per-user 10 --attendance-per-course 20
+
+PASSWORD = 'datagen-password'
+BATCH_SIZE = 5000
+CHUNK_USERS = 1000
+
+PLATFORMS = ('Udemy', 'Coursera', 'edX', 'Udacity', 'Pluralsight', 'Khan Academy')
+SUBJECTS = (
+    'React', 'Machine Learning', 'Algorithms', 'Databases', 'Statistics', 'Rust',
+    'Linear Algebra', 'Design Systems', 'Français B1', 'Data Engineering', 'Kubernetes',
+)
+LEVELS = ('Introduction to', 'Complete Guide to', 'Advanced', 'Practical', 'Fundamentals of')
+EVENT_TYPES = ('lecture',) * 5 + ('assignment',) * 2 + ('deadline', 'exam')
+STATUSES = ('present',) * 8 + ('absent', 'excused')
+RECURRING_SHARE = 0.05
+
+class Scale:
+    def __init__(self, users=1000, courses_per_user=10, events_per_course=10,
+                 attendance_per_course=20, progress_per_course=5):
+        self.users = users
+        self.courses_per_user = courses_per_user
+        self.events_per_course = events_per_course
+        self.attendance_per_course = attendance_per_course
+        self.progress_per_course = progress_per_course
+
+    def to_dict(self):
+        return dict(vars(self))
+
+def _next_ids(connection):
+    return {
+        model: (connection.scalar(select(func.max(model.id))) or 0) + 1
+        for model in (User, Course, Event, Attendance, CourseProgress)
+    }
+
+def _advance_sequences(connection):
+    # Explicit ids leave serial sequences behind; SQLite needs nothing
+    if connection.dialect.name != 'postgresql':
+        return
+    for model in (User, Course, Event, Attendance, CourseProgress):
+        table_name = model.__tablename__
+        connection.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table_name}', 'id'), "
+            f"(SELECT COALESCE(MAX(id), 0) + 1 FROM {table_name}), false)"
+        ))
+
+def _course(rng, course_id, user_id, today):
+    start = today - timedelta(days=rng.randrange(730))
+    total = rng.randint(5, 40)
+    completed = rng.randint(0, total)
+    created = datetime.combine(start, datetime.min.time()) + timedelta(minutes=rng.randrange(1440))
+    subject = rng.choice(SUBJECTS)
+    return {
+        'id': course_id, 'user_id': user_id,
+        'title': f'{rng.choice(LEVELS)} {subject}', 'platform': rng.choice(PLATFORMS),
+        'url': f'https://example.com/courses/{course_id}', 'progress': round(completed / total * 100),
+        'total_sections': total, 'completed_sections': completed,
+        'start_date': start, 'end_date': start + timedelta(days=rng.randint(30, 180)),
+        'image_url': f'https://example.com/images/{course_id % 97}.jpg',
+        'created_at': created, 'updated_at': created,
+    }
+
+def _events(rng, course, first_id, count):
+    span = (course['end_date'] - course['start_date']).days
+    for offset in range(count):
+        day = course['start_date'] + timedelta(days=rng.randrange(span + 1))
+        recurrence = None
+        if rng.random() < RECURRING_SHARE:
+            recurrence = f"FREQ=WEEKLY;BYDAY={WEEKDAYS[day.weekday()]};UNTIL={course['end_date']:%Y%m%d}"
+        event_type = 'lecture' if recurrence else rng.choice(EVENT_TYPES)
+        yield {
+            'id': first_id + offset, 'course_id': course['id'], 'title': f'{event_type.title()} {offset + 1}',
+            'date': day, 'time': datetime.min.time().replace(hour=rng.randint(8, 21), minute=rng.choice((0, 30))),
+            'type': event_type, 'description': '' if offset % 3 else 'Bring questions for the Q&A',
+            'recurrence': recurrence, 'series_end': series_end(day, recurrence),
+            'created_at': course['created_at'], 'updated_at': course['created_at'],
+        }
+
+def _attendance(rng, course, first_id, count):
+    # Distinct dates, as (course_id, date) is unique
+    step = rng.randint(1, 7)
+    for offset in range(count):
+        yield {
+            'id': first_id + offset, 'course_id': course['id'],
+            'date': course['start_date'] + timedelta(days=offset * step), 'status': rng.choice(STATUSES),
+            'notes': '' if offset % 4 else f'Session {offset + 1}',
+            'created_at': course['created_at'], 'updated_at': course['created_at'],
+        }
+
+def _progress(rng, course, first_id, count, today):
+    # The completed sections, logged in up to `count` steps since the start
+    steps = min(count, course['completed_sections'])
+    remaining = course['completed_sections']
+    elapsed = max((today - course['start_date']).days, 1)
+    for offset in range(steps):
+        delta = remaining if offset == steps - 1 else rng.randint(1, max(1, remaining - (steps - offset - 1)))
+        remaining -= delta
+        yield {
+            'id': first_id + offset, 'user_id': course['user_id'], 'course_id': course['id'], 'delta': delta,
+            'created_at': course['created_at'] + timedelta(days=elapsed * (offset + 1) // (steps + 1)),
+        }
+
+def _insert(connection, model, rows, batch_size):
+    statement = insert(model)
+    rows = iter(rows)
+    count = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return count
+        connection.execute(statement, batch)
+        count += len(batch)
+
+def generate(engine, scale, seed=0, today=None, batch_size=BATCH_SIZE, log=print):
+    # Appends scale.users users and their data; returns row counts per table
+    rng = random.Random(seed)
+    today = today or date.today()
+    password_hash = passwords.hash(PASSWORD)
+    counts = {model.__tablename__: 0 for model in (User, Course, Event, Attendance, CourseProgress)}
+    started = time.perf_counter()
+
+    with engine.connect() as connection:
+        if connection.dialect.name == 'sqlite':
+            # A lost load is simply rerun
+            connection.exec_driver_sql('PRAGMA synchronous=OFF')
+        next_id = _next_ids(connection)
+
+        for chunk_start in range(0, scale.users, CHUNK_USERS):
+            chunk = range(chunk_start, min(chunk_start + CHUNK_USERS, scale.users))
+            users, courses, events, attendance, progress = [], [], [], [], []
+            for _ in chunk:
+                user_id = next_id[User]
+                next_id[User] += 1
+                users.append({
+                    'id': user_id, 'username': f'gen{user_id}', 'email': f'gen{user_id}@example.com',
+                    'password_hash': password_hash, 'token_version': 0,
+                    'created_at': datetime.combine(today, datetime.min.time()) - timedelta(days=rng.randrange(730)),
+                })
+                for _ in range(scale.courses_per_user):
+                    course = _course(rng, next_id[Course], user_id, today)
+                    next_id[Course] += 1
+                    courses.append(course)
+                    events.extend(_events(rng, course, next_id[Event], scale.events_per_course))
+                    next_id[Event] += scale.events_per_course
+                    attendance.extend(_attendance(rng, course, next_id[Attendance], scale.attendance_per_course))
+                    next_id[Attendance] += scale.attendance_per_course
+                    logged = list(_progress(rng, course, next_id[CourseProgress], scale.progress_per_course, today))
+                    next_id[CourseProgress] += len(logged)
+                    progress.extend(logged)
+
+            for model, rows in ((User, users), (Course, courses), (Event, events),
+                                (Attendance, attendance), (CourseProgress, progress)):
+                counts[model.__tablename__] += _insert(connection, model, rows, batch_size)
+            _advance_sequences(connection)
+            connection.commit()
+            if log:
+                total = sum(counts.values())
+                log(f"{chunk.stop}/{scale.users} users, {total} rows, "
+                    f"{total / (time.perf_counter() - started):.0f} rows/s")
+    return counts
+
+def rebuild_derived(engine, log=print):
+    from insights import rebuild
+    from recommendations import refresh
+    from search import rebuild as rebuild_search
+
+    started = time.perf_counter()
+    with engine.begin() as connection:
+        weeks = rebuild(connection)
+        recommendations = refresh(connection)
+        documents = rebuild_search(connection)
+    if log:
+        log(f"Rebuilt {weeks} insight weeks, {recommendations} recommendations and "
+            f"{documents} search documents in {time.perf_counter() - started:.1f}s")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fill the database with synthetic data')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--courses-per-user', type=int, default=10)
+    parser.add_argument('--events-per-course', type=int, default=10)
+    parser.add_argument('--attendance-per-course', type=int, default=20)
+    parser.add_argument('--progress-per-course', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--today', type=date.fromisoformat, help='anchor date, YYYY-MM-DD (default: today)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--skip-derived', action='store_true', help='skip rebuilding insights, recommendations and the search index')
+    args = parser.parse_args()
+
+    from app import create_app, db
+    from migrations import upgrade
+
+    scale = Scale(args.users, args.courses_per_user, args.events_per_course,
+                  args.attendance_per_course, args.progress_per_course)
+    with create_app().app_context():
+        upgrade(db.engine)
+        counts = generate(db.engine, scale, args.seed, args.today, args.batch_size)
+        print(', '.join(f'{count} {table}' for table, count in counts.items()))
+        if not args.skip_derived:
+            rebuild_derived(db.engine)
@@ -0,0 +1,30 @@
+from sqlalchemy import Date, Integer, cast, func
+from sqlalchemy.dialects import postgresql, sqlite
+
+# Small helpers for the few places where SQLite and Postgres need different SQL
+
+def dialect_insert(model, dialect_name):
+    # INSERT that supports ON CONFLICT on the backends we run against
+    if dialect_name == 'postgresql':
+        return postgresql.insert(model)
+    if dialect_name == 'sqlite':
+        return sqlite.insert(model)
+    raise NotImplementedError(f"Upserts are not supported on {dialect_name}")
+
+def week_start(column, dialect_name):
+    # Monday of the ISO week containing `column` (a DATE or TIMESTAMP)
+    if dialect_name == 'postgresql':
+        return cast(func.date_trunc('week', column), Date)
+    return func.date(column, 'weekday 0', '-6 days', type_=Date)
+
+def day_of(column, dialect_name):
+    # The calendar date of a DATE or TIMESTAMP
+    if dialect_name == 'postgresql':
+        return cast(column, Date)
+    return func.date(column, type_=Date)
+
+def day_number(column, dialect_name):
+    # Whole days since a fixed epoch, so consecutive dates differ by one
+    if dialect_name == 'postgresql':
+        return cast(column, Date) - cast('1970-01-01', Date)
+    return cast(func.julianday(func.date(column)), Integer)
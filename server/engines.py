@@ -0,0 +1,67 @@
+import time
+from flask import g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+# Engine setup shared by every bind: SQLite pragmas on connect, and routing of
+# read-only requests to the optional 'replica' bind.
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+class RoutingSession(Session):
+    # Reads go to the replica while the request allows it; anything flushed or
+    # explicitly bound still goes to the primary
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_request_context() and g.get('use_replica'):
+            replica = self._db.engines.get('replica')
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+# Settings stored in the database file itself only need setting once
+PERSISTENT_PRAGMAS = ('journal_mode',)
+
+def _sqlite_pragmas(pragmas):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+    return on_connect
+
+def configure_sqlite(engine, pragmas):
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+    persistent = {name: value for name, value in pragmas.items() if name in PERSISTENT_PRAGMAS}
+    session_pragmas = {name: value for name, value in pragmas.items() if name not in PERSISTENT_PRAGMAS}
+    event.listen(engine, 'first_connect', _sqlite_pragmas(persistent))
+    event.listen(engine, 'connect', _sqlite_pragmas(session_pragmas))
+
+def init_engines(app, db):
+    with app.app_context():
+        engines = db.engines
+    for engine in engines.values():
+        configure_sqlite(engine, app.config.get('SQLITE_PRAGMAS'))
+
+    if 'replica' not in engines:
+        return
+    sticky = app.config.get('REPLICA_STICKY_SECONDS', 0)
+
+    @app.before_request
+    def route_reads():
+        # A user who just wrote keeps reading from the primary for a few
+        # seconds so they see their own changes despite replication lag
+        g.use_replica = request.method in READ_METHODS and session.get('primary_until', 0) < time.time()
+
+    @app.after_request
+    def pin_writers(response):
+        if sticky and request.method not in READ_METHODS and response.status_code < 400:
+            session['primary_until'] = time.time() + sticky
+        return response
+
+def dispose_engines(db, close=True):
+    # Before forking, close pooled connections so no worker inherits them; in
+    # a forked worker pass close=False to drop the parent's connections
+    # without closing them under the parent
+    for engine in db.engines.values():
+        engine.dispose(close=close)
@@ -0,0 +1,115 @@
+import argparse
+from datetime import date, timedelta
+from flask import current_app
+from sqlalchemy import Column, Index, MetaData, Table, column, insert, select, table, text
+from app import create_app
+from models import db, Course, Event, Attendance, Recommendation
+from archive import hot_from, live_since
+from dashboard import user_course_ids
+from pagination import filter_query, keyset_page
+from recurrence import calendar_selects
+from serialization import row_select
+
+# Prints the query plan of every list endpoint's query without and with the
+# composite indexes, so we can check that the planner actually uses them.
+# The queries are built with the same helpers as app.py's handlers. The
+# "before" plans run against session-local copies of the tables in the temp
+# schema, which shadows the real tables for unqualified names and has every
+# index but the composite ones. The live tables are only read, never locked
+# for writes, but the copy reads them in full: run it against a replica or
+# off-peak on a large database.
+
+INDEXES = [
+    'ix_courses_user_id_created_at',
+    'ix_events_course_id_date',
+    'ix_events_course_id_series_end',
+    'uq_attendance_course_id_date',
+    'ix_recommendations_course_id_created_at',
+]
+TEMP_SCHEMAS = {'sqlite': 'temp', 'postgresql': 'pg_temp'}
+
+def endpoint_queries(user_id, config):
+    course_ids = user_course_ids(user_id)
+    hot = hot_from(config)
+    args = {}
+
+    def first_page(resource, condition, sort_column, id_column, **filters):
+        query = filter_query(row_select(resource).where(condition), args, sort_column, **filters)
+        return keyset_page(query, sort_column, id_column, args)[0]
+
+    window_start = date.today()
+    single, series = calendar_selects(course_ids, window_start, window_start + timedelta(days=7))
+    return {
+        'GET /api/courses': first_page('courses', Course.user_id == user_id, Course.created_at, Course.id),
+        'GET /api/events': first_page('events', Event.course_id.in_(course_ids), Event.date, Event.id,
+                                      default_filter=live_since('events', hot)),
+        'GET /api/attendance': first_page('attendance', Attendance.course_id.in_(course_ids), Attendance.date,
+                                          Attendance.id, default_filter=live_since('attendance', hot)),
+        'GET /api/recommendations': first_page('recommendations', Recommendation.course_id.in_(course_ids),
+                                               Recommendation.created_at, Recommendation.id),
+        'GET /api/calendar?days=7 (one-off events)': single,
+        'GET /api/calendar?days=7 (recurring events)': series,
+    }
+
+def copy_without_indexes(connection, tables):
+    # Temp-schema copies of `tables` with their rows and every index but INDEXES
+    schema = TEMP_SCHEMAS[connection.dialect.name]
+    source_schema = connection.dialect.default_schema_name
+    metadata = MetaData()
+    for source in tables:
+        copy = Table(
+            source.name, metadata,
+            *[Column(col.name, col.type, primary_key=col.primary_key) for col in source.columns],
+            *[Index(index.name, *[col.name for col in index.columns], unique=index.unique)
+              for index in source.indexes if index.name not in INDEXES],
+            schema=schema,
+        )
+        copy.create(connection)
+        names = [col.name for col in source.columns]
+        rows = select(table(source.name, *[column(name) for name in names], schema=source_schema))
+        connection.execute(insert(copy).from_select(names, rows))
+        if connection.dialect.name == 'postgresql':
+            # Autovacuum never analyzes temp tables
+            connection.execute(text(f'ANALYZE {schema}.{source.name}'))
+
+def explain(connection, statement):
+    dialect = connection.dialect
+    sql = str(statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect.name == 'sqlite' else 'EXPLAIN '
+    rows = connection.execute(text(prefix + sql)).fetchall()
+    if dialect.name == 'sqlite':
+        return [row[-1] for row in rows]
+    return [row[0] for row in rows]
+
+def report(user_id):
+    queries = endpoint_queries(user_id, current_app.config)
+    tables = [model.__table__ for model in (Course, Event, Attendance, Recommendation)]
+    # Two separate connections, since SQLite caches prepared plans per
+    # connection and would otherwise keep reporting the old plan
+    with db.engine.connect() as current, db.engine.connect() as scratch:
+        after = {name: explain(current, query) for name, query in queries.items()}
+
+        try:
+            copy_without_indexes(scratch, tables)
+            before = {name: explain(scratch, query) for name, query in queries.items()}
+        finally:
+            # Closes the connection instead of pooling it with the copies
+            scratch.invalidate()
+
+    for name in queries:
+        print(f'== {name}')
+        print('-- before (no composite indexes)')
+        for line in before[name]:
+            print(f'   {line}')
+        print('-- after')
+        for line in after[name]:
+            print(f'   {line}')
+        print()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Report EXPLAIN plans for the list endpoints')
+    parser.add_argument('--user-id', type=int, default=1)
+    args = parser.parse_args()
+
+    with create_app().app_context():
+        report(args.user_id)
@@ -0,0 +1,36 @@
+import gc
+import multiprocessing
+import os
+
+# gunicorn settings: the app is imported, built and warmed once in the
+# master, then forked, so workers boot in milliseconds and share the loaded
+# modules and configured mappers copy-on-write. Freezing the collector
+# before forking keeps garbage collection in the workers from touching, and
+# so copying, those shared pages. Each worker drops the pool it inherited.
+# More than one worker needs the redis cache and live broker. Workers are
+# threaded, since each open /api/stream holds a thread.
+#
+#   gunicorn -c gunicorn.conf.py
+
+wsgi_app = 'wsgi:app'
+bind = os.getenv('BIND', '127.0.0.1:5000')
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+preload_app = True
+
+def when_ready(server):
+    from wsgi import app
+    from app import warm_up
+    from config import check_shared_backends
+
+    check_shared_backends(app.config, server.num_workers)
+    warm_up(app)
+    gc.freeze()
+
+def post_fork(server, worker):
+    from wsgi import app
+    from engines import dispose_engines
+    from models import db
+
+    with app.app_context():
+        dispose_engines(db, close=False)
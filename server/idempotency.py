@@ -0,0 +1,169 @@
+import argparse
+import hashlib
+import json
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import g, jsonify, make_response, request
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+from models import db, IdempotencyKey
+
+# Idempotency-Key support for the POST handlers.
+#
+# The first request with a given key inserts an idempotency_keys row in the
+# same transaction as its own writes, so the unique (user_id, key) index
+# lets exactly one of any concurrent retries commit; the others roll back
+# whatever they wrote. Once the request has finished, its status, body and
+# ETag are stored and later retries get them back unchanged, with
+# Idempotent-Replayed: true. A retry that arrives while the first request
+# is still running gets 409, and reusing a key for a different request 422.
+# A request that fails before committing rolls its claim back with its
+# writes, so it can be retried with the same key. One that committed and
+# then failed keeps the key with the failure response, since a retry would
+# repeat writes that are already saved. Keys expire after IDEMPOTENCY_TTL:
+# each insert clears that user's expired keys, and `python idempotency.py
+# purge` clears everyone's.
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+STORED_HEADERS = ('ETag',)
+PURGE_BATCH_SIZE = 1000
+# Stored for a key whose handler committed and then raised
+INTERNAL_ERROR = json.dumps({"error": "Internal server error"})
+
+class DuplicateRequest(Exception):
+    # Another request claimed the key first
+    pass
+
+def parse_key(value):
+    key = value.strip()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise ValueError(f"{HEADER} must be 1 to {MAX_KEY_LENGTH} characters")
+    return key
+
+def fingerprint(method, path, body):
+    return hashlib.sha256(b'\n'.join((method.encode(), path.encode(), body))).hexdigest()
+
+def key_statement(user_id, key):
+    return select(IdempotencyKey).where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+
+def expired_statement(user_id, cutoff):
+    return delete(IdempotencyKey).where(IdempotencyKey.user_id == user_id, IdempotencyKey.created_at < cutoff)
+
+def complete_statement(user_id, key, status_code, body, headers):
+    return (
+        update(IdempotencyKey)
+        .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+        .values(status_code=status_code, response=body,
+                headers=json.dumps({name: headers[name] for name in STORED_HEADERS if name in headers}))
+    )
+
+def replay(row, digest):
+    # (status, body, headers) answering a retry of a claimed key
+    if row.fingerprint != digest:
+        return 422, json.dumps({"error": f"{HEADER} was already used for a different request"}), {}
+    if row.status_code is None:
+        return 409, json.dumps({"error": f"A request with this {HEADER} is still in progress"}), {'Retry-After': '1'}
+    return row.status_code, row.response, {**json.loads(row.headers or '{}'), REPLAYED_HEADER: 'true'}
+
+def purge(connection, cutoff, batch_size=PURGE_BATCH_SIZE):
+    purged = 0
+    while True:
+        batch = select(IdempotencyKey.id).where(IdempotencyKey.created_at < cutoff).limit(batch_size)
+        deleted = connection.execute(
+            delete(IdempotencyKey).where(IdempotencyKey.id.in_(batch.scalar_subquery()))
+        ).rowcount
+        purged += deleted
+        if deleted < batch_size:
+            return purged
+
+class IdempotencyStore:
+    def __init__(self):
+        self.enabled = True
+        self.ttl = 24 * 3600
+
+    def init_app(self, app):
+        self.configure(app.config)
+
+    def configure(self, config):
+        self.enabled = config.get('IDEMPOTENCY_ENABLED', True)
+        self.ttl = config.get('IDEMPOTENCY_TTL', 24 * 3600)
+
+    def cutoff(self, now=None):
+        return (now or datetime.utcnow()) - timedelta(seconds=self.ttl)
+
+    def live(self, row, now=None):
+        return row is not None and row.created_at >= self.cutoff(now)
+
+    def claim(self, session, user_id, key, digest):
+        # Adds the key to the session's transaction, so whatever commits the
+        # handler's writes commits the key with them
+        now = datetime.utcnow()
+        existing = session.execute(key_statement(user_id, key)).scalar_one_or_none()
+        if self.live(existing, now):
+            raise DuplicateRequest()
+        session.execute(expired_statement(user_id, self.cutoff(now)))
+        session.add(IdempotencyKey(user_id=user_id, key=key, fingerprint=digest, created_at=now))
+        try:
+            session.flush()
+        except IntegrityError:
+            # Lost the race to a concurrent retry, which has committed by now
+            session.rollback()
+            raise DuplicateRequest()
+
+    def idempotent(self, f):
+        # View decorator for POST handlers, inside login_required
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            value = request.headers.get(HEADER)
+            if value is None or not self.enabled:
+                return f(*args, **kwargs)
+            try:
+                key = parse_key(value)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+
+            user_id = g.user_id
+            digest = fingerprint(request.method, request.path, request.get_data())
+            try:
+                self.claim(db.session, user_id, key, digest)
+            except DuplicateRequest:
+                status, body, headers = replay(db.session.execute(key_statement(user_id, key)).scalar_one(), digest)
+                return make_response(body, status, {'Content-Type': 'application/json', **headers})
+
+            try:
+                response = make_response(f(*args, **kwargs))
+            except Exception:
+                self._failed(user_id, key, 500, INTERNAL_ERROR, {})
+                raise
+            if 200 <= response.status_code < 300:
+                db.session.execute(complete_statement(
+                    user_id, key, response.status_code, response.get_data(as_text=True), response.headers))
+                db.session.commit()
+            else:
+                self._failed(user_id, key, response.status_code, response.get_data(as_text=True), response.headers)
+            return response
+        return decorated_function
+
+    def _failed(self, user_id, key, status_code, body, headers):
+        # An uncommitted claim rolls back here; one the handler committed is
+        # still there and keeps the failure for retries
+        db.session.rollback()
+        db.session.execute(complete_statement(user_id, key, status_code, body, headers))
+        db.session.commit()
+
+idempotency = IdempotencyStore()
+
+if __name__ == '__main__':
+    from app import create_app
+
+    app = create_app()
+
+    parser = argparse.ArgumentParser(description='Idempotency key maintenance')
+    parser.add_argument('command', choices=['purge'])
+    parser.parse_args()
+
+    with app.app_context():
+        with db.engine.begin() as connection:
+            print(f"Purged {purge(connection, idempotency.cutoff())} expired idempotency keys")
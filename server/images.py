@@ -0,0 +1,303 @@
+import hashlib
+import http.client
+import ipaddress
+import os
+import socket
+import tempfile
+import urllib.request
+from io import BytesIO
+from urllib.parse import urlsplit
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+# Course cover images, proxied and resized.
+#
+# GET /api/images/<course_id>?w=320 fetches the course's image_url once,
+# stores the source under its SHA-256 and redirects to a content-addressed
+# variant, /api/images/<digest>/<width>.<ext>. Variants never change, so they
+# are served straight from disk with year-long immutable cache headers; the
+# redirect itself is only cached briefly, since image_url can be edited.
+# Variants are WebP when the browser accepts it and JPEG otherwise, at one of
+# WIDTHS. Without Pillow nothing is resized: the source is served as it is.
+#
+# Sources, variants and the url -> digest index share IMAGE_CACHE_DIR. Each
+# read touches the file's mtime, and once the directory grows past
+# IMAGE_CACHE_MAX_BYTES the least recently used files are removed until it is
+# back under EVICT_TO of the limit. A variant whose source is still cached is
+# regenerated on demand.
+#
+# Fetching goes through IMAGE_FETCHER: 'http' downloads over HTTP(S) and
+# refuses addresses that are not globally routable, 'directory' reads
+# <IMAGE_FETCH_ROOT>/<file name of the URL> for offline runs, and
+# ImageProxy.fetcher accepts any callable taking a URL and returning bytes.
+
+WIDTHS = (160, 320, 640)
+FORMATS = {'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+QUALITY = 80
+EVICT_TO = 0.9
+VARIANT_MAX_AGE = 365 * 24 * 3600
+REDIRECT_MAX_AGE = 3600
+
+# Magic numbers of the source formats accepted, by extension
+SIGNATURES = {
+    'jpeg': (b'\xff\xd8\xff',),
+    'png': (b'\x89PNG\r\n\x1a\n',),
+    'gif': (b'GIF87a', b'GIF89a'),
+    'webp': (b'RIFF',),
+}
+MIMETYPES = {**FORMATS, 'png': 'image/png', 'gif': 'image/gif'}
+
+class FetchError(Exception):
+    pass
+
+def sniff(data):
+    # Extension of an accepted image format, or None
+    for extension, prefixes in SIGNATURES.items():
+        if data.startswith(prefixes):
+            if extension == 'webp' and data[8:12] != b'WEBP':
+                continue
+            return extension
+    return None
+
+def _check_scheme(url):
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise FetchError("Image URL must be http or https")
+
+def _connect_public(address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None):
+    # Resolves the host once and connects to the address that was checked,
+    # so DNS cannot answer differently between the check and the connect
+    host, port = address
+    try:
+        addresses = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror:
+        raise FetchError(f"Cannot resolve {host}")
+    for *_, sockaddr in addresses:
+        if not ipaddress.ip_address(sockaddr[0].split('%')[0]).is_global:
+            raise FetchError(f"{host} is not a public address")
+    return socket.create_connection(addresses[0][4][:2], timeout, source_address)
+
+# Connections keep the URL's host for the Host header, SNI and certificate
+# checks while the socket goes to the checked address
+class _PublicHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _connect_public
+
+class _PublicHTTPSConnection(http.client.HTTPSConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _connect_public
+
+class _PublicHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(_PublicHTTPConnection, req)
+
+class _PublicHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(_PublicHTTPSConnection, req, context=self._context)
+
+class _CheckedRedirects(urllib.request.HTTPRedirectHandler):
+    # Redirect targets connect through the same handlers, so only the scheme
+    # needs checking here
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        _check_scheme(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+class HttpFetcher:
+    def __init__(self, timeout=10.0, max_bytes=10 * 1024 * 1024):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        # No proxies: a proxy would resolve the host itself, unchecked
+        self.opener = urllib.request.build_opener(
+            urllib.request.ProxyHandler({}), _PublicHTTPHandler, _PublicHTTPSHandler, _CheckedRedirects)
+
+    def __call__(self, url):
+        _check_scheme(url)
+        request = urllib.request.Request(url, headers={'User-Agent': 'LearnTrack image proxy'})
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                data = response.read(self.max_bytes + 1)
+        except OSError as e:
+            raise FetchError(f"Fetching the image failed: {e}")
+        if len(data) > self.max_bytes:
+            raise FetchError(f"Image is larger than {self.max_bytes} bytes")
+        return data
+
+class DirectoryFetcher:
+    def __init__(self, root):
+        self.root = root
+
+    def __call__(self, url):
+        name = os.path.basename(urlsplit(url).path)
+        try:
+            with open(os.path.join(self.root, name), 'rb') as f:
+                return f.read()
+        except OSError:
+            raise FetchError(f"No local copy of {url}")
+
+def create_fetcher(config):
+    kind = config.get('IMAGE_FETCHER', 'http')
+    if kind == 'http':
+        return HttpFetcher(config.get('IMAGE_FETCH_TIMEOUT', 10.0), config.get('IMAGE_MAX_BYTES', 10 * 1024 * 1024))
+    if kind == 'directory':
+        return DirectoryFetcher(config['IMAGE_FETCH_ROOT'])
+    raise ValueError(f"Unknown IMAGE_FETCHER: {kind}")
+
+def resize(data, width, extension):
+    # Scaled down to `width` (never up) and encoded as `extension`
+    try:
+        with Image.open(BytesIO(data)) as source:
+            image = ImageOps.exif_transpose(source)
+            if image.width > width:
+                image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+            if extension == 'jpeg' and image.mode != 'RGB':
+                image = image.convert('RGB')
+            output = BytesIO()
+            image.save(output, extension.upper(), quality=QUALITY)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise FetchError(f"The image could not be resized: {e}")
+    return output.getvalue()
+
+def parse_width(value):
+    if value is None:
+        return WIDTHS[-1]
+    try:
+        width = int(value)
+    except ValueError:
+        raise ValueError("w must be an integer")
+    if width not in WIDTHS:
+        raise ValueError(f"w must be one of {', '.join(map(str, WIDTHS))}")
+    return width
+
+class ImageProxy:
+    def __init__(self):
+        self.directory = 'image-cache'
+        self.max_bytes = 256 * 1024 * 1024
+        self.fetcher = None
+        self.size = None
+
+    def init_app(self, app):
+        self.configure(app.config)
+
+    def configure(self, config):
+        self.directory = os.path.abspath(config.get('IMAGE_CACHE_DIR', 'image-cache'))
+        self.max_bytes = config.get('IMAGE_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+        self.fetcher = create_fetcher(config)
+        self.size = None
+
+    @property
+    def resizing(self):
+        return Image is not None
+
+    def variant_extension(self, accept):
+        return 'webp' if 'image/webp' in accept else 'jpeg'
+
+    def _path(self, kind, name):
+        # Spread over 256 subdirectories by the name's leading hex digits
+        return os.path.join(self.directory, kind, name[:2], name)
+
+    def _read(self, path):
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        os.utime(path)
+        return data
+
+    def _format(self, path):
+        try:
+            with open(path, 'rb') as f:
+                return sniff(f.read(12))
+        except FileNotFoundError:
+            return None
+
+    def _write(self, path, data):
+        # Written beside the target and renamed, so readers in other workers
+        # never see a partial file
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(handle, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        if self.size is not None:
+            self.size += len(data)
+        if self.size is None or self.size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        # Least recently used first, until the cache is under EVICT_TO of its
+        # limit; the size is recounted from disk since other workers write too
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        self.size = sum(size for _, size, _ in files)
+        if self.size <= self.max_bytes:
+            return 0
+        evicted = 0
+        for _, size, path in sorted(files):
+            if self.size <= self.max_bytes * EVICT_TO:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size -= size
+            evicted += 1
+        return evicted
+
+    def source_digest(self, url):
+        # Digest of the image at `url`, fetched unless it is cached
+        url_key = hashlib.sha256(url.encode()).hexdigest()
+        known = self._read(self._path('urls', url_key))
+        if known is not None and os.path.exists(self._path('sources', known.decode())):
+            return known.decode()
+        data = self.fetcher(url)
+        if sniff(data) is None:
+            raise FetchError("The URL does not point to a JPEG, PNG, GIF or WebP image")
+        digest = hashlib.sha256(data).hexdigest()
+        self._write(self._path('sources', digest), data)
+        self._write(self._path('urls', url_key), digest.encode())
+        return digest
+
+    def variant_name(self, digest, width, accept):
+        if not self.resizing:
+            return f'source.{self._format(self._path("sources", digest))}'
+        return f'{width}.{self.variant_extension(accept)}'
+
+    def variant(self, digest, name):
+        # (path, mimetype) of a cached variant, generated from the source when
+        # missing; None if neither is cached or the name is not a variant
+        stem, _, extension = name.partition('.')
+        if len(digest) != 64 or digest.strip('0123456789abcdef') or extension not in MIMETYPES:
+            return None
+        source_path = self._path('sources', digest)
+        if stem == 'source':
+            if self._format(source_path) != extension:
+                return None
+            os.utime(source_path)
+            return source_path, MIMETYPES[extension]
+        if not self.resizing or extension not in FORMATS or not stem.isdigit() or int(stem) not in WIDTHS:
+            return None
+
+        path = self._path('variants', f'{digest}-{name}')
+        if os.path.exists(path):
+            os.utime(path)
+            return path, MIMETYPES[extension]
+        data = self._read(source_path)
+        if data is None:
+            return None
+        self._write(path, resize(data, int(stem), extension))
+        return path, MIMETYPES[extension]
+
+images = ImageProxy()
@@ -0,0 +1,250 @@
+import argparse
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import case, delete, distinct, func, insert, select
+from models import db, User, Course, Event, Attendance, CourseProgress, WeeklyInsight, ArchiveRun
+from dialects import dialect_insert, week_start
+from recurrence import MAX_WINDOW_DAYS, occurrences, parse_rule
+
+# Per-user weekly insights, kept as rollup counters.
+#
+# Write handlers adjust the counters for the affected weeks in the same
+# transaction as the write itself, so reading insights only touches one row
+# per week. `python insights.py rebuild` recomputes everything from the
+# source tables and `python insights.py verify` checks the two agree, both
+# from the first week after the latest archive run: earlier weeks counted
+# rows that now live in ARCHIVE_DIR.
+
+COUNTERS = ('sections_completed', 'courses_progressed', 'attendance_present', 'attendance_total', 'deadlines')
+DEADLINE_TYPES = ('deadline', 'exam', 'assignment')
+DEFAULT_WEEKS = 12
+REBUILD_BATCH_SIZE = 500
+
+def week_of(day):
+    return day - timedelta(days=day.weekday())
+
+def deadline_days(start, recurrence):
+    # The days a deadline event falls on: its date, or every occurrence of its
+    # series. Open-ended series count for the longest calendar window, so the
+    # same rows always give the same counters.
+    if recurrence is None:
+        return [start]
+    return list(occurrences(start, parse_rule(recurrence), None, start + timedelta(days=MAX_WINDOW_DAYS)))
+
+def week_window(weeks=DEFAULT_WEEKS, today=None):
+    current = week_of(today or date.today())
+    return current - timedelta(weeks=weeks - 1), current
+
+def weekly_insights_statement(user_id, weeks=DEFAULT_WEEKS):
+    first, last = week_window(weeks)
+    return (
+        select(WeeklyInsight)
+        .where(WeeklyInsight.user_id == user_id,
+               WeeklyInsight.week_starting.between(first, last))
+        .order_by(WeeklyInsight.week_starting)
+    )
+
+def weekly_insights(user_id, weeks=DEFAULT_WEEKS):
+    rows = db.session.execute(weekly_insights_statement(user_id, weeks)).scalars()
+    return [row.to_dict() for row in rows]
+
+# Incremental maintenance
+
+class RollupDeltas:
+    # Collects counter deltas per (user, week) and applies them with one upsert
+
+    def __init__(self):
+        self._deltas = defaultdict(lambda: defaultdict(int))
+
+    def add(self, user_id, day, counter, delta):
+        if day is not None and delta:
+            self._deltas[(user_id, week_of(day))][counter] += delta
+
+    def attendance(self, user_id, day, status, sign=1):
+        self.add(user_id, day, 'attendance_total', sign)
+        if status == 'present':
+            self.add(user_id, day, 'attendance_present', sign)
+
+    def attendance_status(self, user_id, day, old_status, new_status):
+        self.add(user_id, day, 'attendance_present', (new_status == 'present') - (old_status == 'present'))
+
+    def event(self, user_id, day, event_type, recurrence=None, sign=1):
+        if event_type in DEADLINE_TYPES and day is not None:
+            for occurrence in deadline_days(day, recurrence):
+                self.add(user_id, occurrence, 'deadlines', sign)
+
+    def apply(self, session=None):
+        session = session or db.session
+        rows = [
+            {'user_id': user_id, 'week_starting': week, **{name: counters.get(name, 0) for name in COUNTERS}}
+            for (user_id, week), counters in self._deltas.items()
+            if any(counters.values())
+        ]
+        self._deltas.clear()
+        if not rows:
+            return
+        statement = dialect_insert(WeeklyInsight, session.get_bind().dialect.name)
+        statement = statement.on_conflict_do_update(
+            index_elements=['user_id', 'week_starting'],
+            set_={name: getattr(WeeklyInsight, name) + getattr(statement.excluded, name) for name in COUNTERS},
+        )
+        session.execute(statement, rows)
+
+def record_attendance(user_id, day, status, session=None):
+    deltas = RollupDeltas()
+    deltas.attendance(user_id, day, status)
+    deltas.apply(session)
+
+def record_attendance_status(user_id, day, old_status, new_status, session=None):
+    deltas = RollupDeltas()
+    deltas.attendance_status(user_id, day, old_status, new_status)
+    deltas.apply(session)
+
+def record_event(user_id, day, event_type, recurrence=None, sign=1, session=None):
+    deltas = RollupDeltas()
+    deltas.event(user_id, day, event_type, recurrence, sign)
+    deltas.apply(session)
+
+def record_progress(user_id, course_id, delta, now=None, session=None):
+    if not delta:
+        return
+    session = session or db.session
+    now = now or datetime.utcnow()
+    deltas = RollupDeltas()
+    deltas.add(user_id, now.date(), 'sections_completed', delta)
+
+    if delta > 0:
+        # A course counts as progressed once per week
+        week_begin = datetime.combine(week_of(now.date()), time.min)
+        already = session.execute(
+            select(CourseProgress.id).where(
+                CourseProgress.course_id == course_id,
+                CourseProgress.delta > 0,
+                CourseProgress.created_at >= week_begin,
+                CourseProgress.created_at < week_begin + timedelta(weeks=1),
+            ).limit(1)
+        ).first()
+        if already is None:
+            deltas.add(user_id, now.date(), 'courses_progressed', 1)
+
+    session.add(CourseProgress(user_id=user_id, course_id=course_id, delta=delta, created_at=now))
+    deltas.apply(session)
+
+# Rebuild and verification
+
+def live_weeks_from(connection):
+    # First week whose rows are all still in the database, or None
+    before = connection.scalar(select(func.max(ArchiveRun.before)))
+    return week_of(before + timedelta(days=6)) if before else None
+
+def compute_rollups(connection, user_ids, since=None):
+    # Set-based GROUP BY passes over the source tables for a batch of users,
+    # from the week starting `since` on
+    dialect = connection.dialect.name
+    first = since or date.min
+    totals = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+
+    week = week_start(Attendance.date, dialect)
+    statement = (
+        select(Course.user_id, week.label('week'), func.count(),
+               func.sum(case((Attendance.status == 'present', 1), else_=0)))
+        .join(Course, Course.id == Attendance.course_id)
+        .where(Course.user_id.in_(user_ids), Attendance.date >= first)
+        .group_by(Course.user_id, week)
+    )
+    for user_id, week_starting, total, present in connection.execute(statement):
+        totals[(user_id, week_starting)].update(attendance_total=total, attendance_present=present)
+
+    week = week_start(Event.date, dialect)
+    statement = (
+        select(Course.user_id, week.label('week'), func.count())
+        .join(Course, Course.id == Event.course_id)
+        .where(Course.user_id.in_(user_ids), Event.series_end.is_(None), Event.date >= first,
+               Event.type.in_(DEADLINE_TYPES))
+        .group_by(Course.user_id, week)
+    )
+    for user_id, week_starting, count in connection.execute(statement):
+        totals[(user_id, week_starting)]['deadlines'] = count
+
+    # Recurring deadlines are expanded here, one count per occurrence
+    statement = (
+        select(Course.user_id, Event.date, Event.recurrence)
+        .join(Course, Course.id == Event.course_id)
+        .where(Course.user_id.in_(user_ids), Event.series_end >= first, Event.type.in_(DEADLINE_TYPES))
+    )
+    for user_id, start, recurrence in connection.execute(statement):
+        for day in deadline_days(start, recurrence):
+            if day >= first:
+                totals[(user_id, week_of(day))]['deadlines'] += 1
+
+    week = week_start(CourseProgress.created_at, dialect)
+    statement = (
+        select(CourseProgress.user_id, week.label('week'), func.sum(CourseProgress.delta),
+               func.count(distinct(case((CourseProgress.delta > 0, CourseProgress.course_id)))))
+        .where(CourseProgress.user_id.in_(user_ids), CourseProgress.created_at >= datetime.combine(first, time.min))
+        .group_by(CourseProgress.user_id, week)
+    )
+    for user_id, week_starting, sections, courses in connection.execute(statement):
+        totals[(user_id, week_starting)].update(sections_completed=sections, courses_progressed=courses)
+
+    return totals
+
+def _user_batches(connection, batch_size):
+    user_ids = list(connection.execute(select(User.id).order_by(User.id)).scalars())
+    for start in range(0, len(user_ids), batch_size):
+        yield user_ids[start:start + batch_size]
+
+def _stored(user_ids, since):
+    condition = WeeklyInsight.user_id.in_(user_ids)
+    return condition & (WeeklyInsight.week_starting >= since) if since else condition
+
+def rebuild(connection, batch_size=REBUILD_BATCH_SIZE, user_ids=None):
+    weeks = 0
+    since = live_weeks_from(connection)
+    batches = _user_batches(connection, batch_size) if user_ids is None else [list(user_ids)]
+    for user_ids in batches:
+        totals = compute_rollups(connection, user_ids, since)
+        connection.execute(delete(WeeklyInsight).where(_stored(user_ids, since)))
+        rows = [
+            {'user_id': user_id, 'week_starting': week, **counters}
+            for (user_id, week), counters in totals.items()
+        ]
+        if rows:
+            connection.execute(insert(WeeklyInsight), rows)
+        weeks += len(rows)
+    return weeks
+
+def verify(connection, batch_size=REBUILD_BATCH_SIZE):
+    mismatches = []
+    since = live_weeks_from(connection)
+    for user_ids in _user_batches(connection, batch_size):
+        expected = compute_rollups(connection, user_ids, since)
+        stored = {
+            (row.user_id, row.week_starting): {name: getattr(row, name) for name in COUNTERS}
+            for row in connection.execute(select(WeeklyInsight).where(_stored(user_ids, since)))
+        }
+        zero = dict.fromkeys(COUNTERS, 0)
+        for key in set(expected) | set(stored):
+            if expected.get(key, zero) != stored.get(key, zero):
+                mismatches.append((key, expected.get(key, zero), stored.get(key, zero)))
+    return mismatches
+
+if __name__ == '__main__':
+    from app import create_app
+
+    app = create_app()
+
+    parser = argparse.ArgumentParser(description='Rebuild or verify the weekly insight rollups')
+    parser.add_argument('command', choices=['rebuild', 'verify'])
+    parser.add_argument('--batch-size', type=int, default=REBUILD_BATCH_SIZE)
+    args = parser.parse_args()
+
+    with app.app_context():
+        with db.engine.begin() as connection:
+            if args.command == 'rebuild':
+                print(f"Rebuilt {rebuild(connection, args.batch_size)} weekly rollups")
+            mismatches = verify(connection, args.batch_size)
+        for (user_id, week), expected, stored in mismatches:
+            print(f"user {user_id} week {week}: expected {expected}, stored {stored}")
+        print("Rollups match the source tables" if not mismatches else f"{len(mismatches)} mismatched weeks")
+        raise SystemExit(1 if mismatches else 0)
@@ -0,0 +1,260 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import threading
+import traceback
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, update
+from models import db, Job
+from cache import cache
+from config import process_local_backends
+from notify import notifier, RESOURCES
+
+# Background jobs backed by the jobs table.
+#
+# Handlers call enqueue() and commit; the job row is written in the same
+# transaction as the request's own changes. Workers (`python jobs.py`) claim
+# due jobs with a single conditional UPDATE, run the registered task inside an
+# app context and record the result. Failed attempts are retried with
+# exponential backoff until max_attempts is reached. No broker is needed, so
+# this runs locally against SQLite as well as on Postgres.
+#
+# A finished job invalidates its user's cached responses and, on success,
+# pushes a change, exactly once (delivered_at). The worker does it when the
+# cache and live broker are shared; with the in-process ones it cannot reach
+# the web process, so the web process does it when the job is next read.
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+FINISHED = (SUCCEEDED, FAILED)
+
+MAX_RETRY_DELAY = 3600
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+class JobFailed(Exception):
+    # Raised by a task for failures that retrying will not fix
+    def __init__(self, message, result=None):
+        super().__init__(message)
+        self.result = result
+
+def task(name):
+    def decorator(f):
+        TASKS[name] = f
+        return f
+    return decorator
+
+def enqueue(kind, payload=None, user_id=None, max_attempts=None, delay=0, session=None):
+    if kind not in TASKS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    session = session or db.session
+    job = Job(
+        kind=kind,
+        payload=json.dumps(payload or {}),
+        user_id=user_id,
+        max_attempts=max_attempts or current_app.config['JOB_MAX_ATTEMPTS'],
+        run_at=datetime.utcnow() + timedelta(seconds=delay),
+    )
+    session.add(job)
+    session.flush()
+    return job
+
+def retry_delay(attempts, base):
+    # 1x, 2x, 4x ... the base delay, with jitter so retries spread out
+    delay = min(base * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+    return delay * random.uniform(0.75, 1.25)
+
+def delivery_statement(job_id):
+    # Claims the job's side effects; matches no row once they are delivered
+    return (
+        update(Job)
+        .where(Job.id == job_id, Job.status.in_(FINISHED), Job.delivered_at.is_(None))
+        .values(delivered_at=datetime.utcnow())
+    )
+
+def announce(user_id, status):
+    if user_id is None:
+        return
+    cache.invalidate_user(user_id)
+    if status == SUCCEEDED:
+        notifier.publish(user_id, *RESOURCES)
+
+def claim_delivery(jobs, session=None):
+    # From the web process: the finished jobs whose side effects the worker
+    # left, now claimed by this session; commit, then announce() each
+    session = session or db.session
+    return [job for job in jobs if job.status in FINISHED and job.delivered_at is None
+            and session.execute(delivery_statement(job.id)).rowcount]
+
+def deliver(jobs):
+    claimed = claim_delivery(jobs)
+    if claimed:
+        db.session.commit()
+        for job in claimed:
+            announce(job.user_id, job.status)
+
+# Worker side
+
+def release_stale(connection, lock_timeout):
+    # Jobs whose worker died mid-run go back on the queue
+    cutoff = datetime.utcnow() - timedelta(seconds=lock_timeout)
+    return connection.execute(
+        update(Job)
+        .where(Job.status == RUNNING, Job.locked_at < cutoff)
+        .values(status=QUEUED, locked_by=None, locked_at=None)
+    ).rowcount
+
+def claim(connection, worker_id):
+    now = datetime.utcnow()
+    due = (
+        select(Job.id)
+        .where(Job.status == QUEUED, Job.run_at <= now)
+        .order_by(Job.run_at, Job.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    # The status check makes the claim atomic when two workers race for a row
+    return connection.execute(
+        update(Job)
+        .where(Job.id == due, Job.status == QUEUED)
+        .values(status=RUNNING, locked_by=worker_id, locked_at=now, attempts=Job.attempts + 1)
+        .returning(Job.id)
+    ).scalar()
+
+def _finish(job_id, **values):
+    db.session.execute(
+        update(Job).where(Job.id == job_id).values(locked_by=None, locked_at=None, **values)
+    )
+
+def run_job(job_id):
+    job = db.session.get(Job, job_id)
+    user_id = job.user_id
+    try:
+        result = TASKS[job.kind](json.loads(job.payload), job)
+        # The task's writes and the job's status commit together
+        _finish(job_id, status=SUCCEEDED, result=json.dumps(result), error=None,
+                finished_at=datetime.utcnow())
+        db.session.commit()
+        status = SUCCEEDED
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(Job, job_id)
+        if isinstance(e, JobFailed) or job.kind not in TASKS or job.attempts >= job.max_attempts:
+            result = getattr(e, 'result', None)
+            _finish(job_id, status=FAILED, error=str(e) or type(e).__name__,
+                    result=json.dumps(result) if result is not None else None,
+                    finished_at=datetime.utcnow())
+            status = FAILED
+        else:
+            delay = retry_delay(job.attempts, current_app.config['JOB_RETRY_DELAY'])
+            _finish(job_id, status=QUEUED, error=str(e) or type(e).__name__,
+                    run_at=datetime.utcnow() + timedelta(seconds=delay))
+            status = QUEUED
+        db.session.commit()
+        if not isinstance(e, JobFailed):
+            logger.error("Job %s (%s) attempt %s failed:\n%s", job_id, job.kind, job.attempts,
+                         traceback.format_exc())
+    finally:
+        db.session.remove()
+    if status in FINISHED and not process_local_backends(current_app.config):
+        with db.engine.begin() as connection:
+            delivered = connection.execute(delivery_statement(job_id)).rowcount
+        if delivered:
+            announce(user_id, status)
+    return status
+
+def work(app, worker_id, stop, poll_interval=None, burst=False):
+    with app.app_context():
+        poll_interval = poll_interval or app.config['JOB_POLL_INTERVAL']
+        lock_timeout = app.config['JOB_LOCK_TIMEOUT']
+        while not stop.is_set():
+            with db.engine.begin() as connection:
+                release_stale(connection, lock_timeout)
+                job_id = claim(connection, worker_id)
+            if job_id is not None:
+                run_job(job_id)
+            elif burst:
+                return
+            else:
+                stop.wait(poll_interval)
+
+def _process_main(worker_id, stop, poll_interval, burst):
+    from app import create_app
+    work(create_app(), worker_id, stop, poll_interval, burst)
+
+def run_workers(app, concurrency, pool='thread', poll_interval=None, burst=False):
+    # One polling loop per thread or per process; each loop runs one job at a time
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    if pool == 'process':
+        context = multiprocessing.get_context('spawn')
+        stop = context.Event()
+        workers = [
+            context.Process(target=_process_main, args=(f"{prefix}:p{i}", stop, poll_interval, burst))
+            for i in range(concurrency)
+        ]
+    else:
+        stop = threading.Event()
+        workers = [
+            threading.Thread(target=work, args=(app, f"{prefix}:t{i}", stop, poll_interval, burst))
+            for i in range(concurrency)
+        ]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        stop.set()
+        for worker in workers:
+            worker.join()
+
+# Tasks
+
+@task('import')
+def import_task(payload, job):
+    from bulk import BulkError, import_rows
+
+    try:
+        return import_rows(payload['resource'], job.user_id, payload['records'], partial=payload['partial'])
+    except BulkError as e:
+        if e.status >= 500:
+            raise
+        raise JobFailed(e.message, {'errors': e.errors})
+
+@task('insights.rebuild')
+def rebuild_insights_task(payload, job):
+    from insights import rebuild
+
+    return {'weeks': rebuild(db.session.connection(), user_ids=[job.user_id])}
+
+@task('recommendations.refresh')
+def refresh_recommendations_task(payload, job):
+    from dashboard import user_course_ids
+    from recommendations import refresh
+
+    return {'recommendations': refresh(db.session.connection(), user_course_ids(job.user_id))}
+
+if __name__ == '__main__':
+    from app import create_app
+
+    app = create_app()
+
+    parser = argparse.ArgumentParser(description='Run background job workers')
+    parser.add_argument('--concurrency', type=int, default=app.config['JOB_CONCURRENCY'])
+    parser.add_argument('--pool', choices=['thread', 'process'], default=app.config['JOB_POOL'])
+    parser.add_argument('--poll-interval', type=float, default=app.config['JOB_POLL_INTERVAL'])
+    parser.add_argument('--burst', action='store_true', help='exit once the queue is empty')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    run_workers(app, args.concurrency, args.pool, args.poll_interval, args.burst)
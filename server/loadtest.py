@@ -0,0 +1,198 @@
+import argparse
+import http.client
+import importlib.util
+import json
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Load test for the engine profiles.
+#
+# Seeds a SQLite database once, then for each scenario copies it, starts
+# gunicorn against the copy with that scenario's environment and drives a
+# mixed read/write workload from client threads. The response cache is
+# turned off so every request reaches the database.
+#
+#   python loadtest.py --workers 4 --clients 16 --duration 15
+
+SCENARIOS = {
+    # SQLAlchemy's engine defaults: pool of 5 + 10 overflow, rollback journal, no pragmas
+    'defaults': {'APP_PROFILE': 'development', 'SQLITE_PRAGMAS': 'off', 'DB_POOL_SIZE': '5', 'DB_MAX_OVERFLOW': '10'},
+    # The development profile: WAL, synchronous=NORMAL, busy timeout, pooled connections
+    'tuned': {'APP_PROFILE': 'development'},
+}
+
+PASSWORD = 'loadtest-password'
+
+def seed(path, users, courses):
+    os.environ.update(DATABASE_URL=f'sqlite:///{path}', APP_PROFILE='testing')
+    from datetime import date, timedelta
+    from sqlalchemy import insert
+    from app import create_app
+    from models import db, User, Course, Event, Attendance
+
+    # The testing profile upgrades the new database's schema
+    with create_app().app_context():
+        template = User(username='template', email='template@example.com')
+        template.set_password(PASSWORD)
+        db.session.execute(insert(User), [{
+            'username': f'load{i}', 'email': f'load{i}@example.com', 'password_hash': template.password_hash,
+        } for i in range(users)])
+        user_ids = [row[0] for row in db.session.query(User.id).order_by(User.id)]
+        db.session.execute(insert(Course), [{
+            'user_id': user_id, 'title': f'Course {i}', 'platform': 'Udemy', 'progress': 0,
+            'total_sections': 20, 'completed_sections': 0, 'start_date': date.today() - timedelta(days=30),
+            'end_date': date.today() + timedelta(days=30),
+        } for user_id in user_ids for i in range(courses)])
+        course_ids = [row[0] for row in db.session.query(Course.id)]
+        db.session.execute(insert(Event), [{
+            'course_id': course_id, 'title': 'Lecture', 'date': date.today() + timedelta(days=i),
+            'type': 'lecture', 'description': '',
+        } for course_id in course_ids for i in range(5)])
+        db.session.execute(insert(Attendance), [{
+            'course_id': course_id, 'date': date.today() - timedelta(days=i), 'status': 'present', 'notes': '',
+        } for course_id in course_ids for i in range(5)])
+        db.session.commit()
+        db.engine.dispose()
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+class Client:
+    def __init__(self, port):
+        self.port = port
+        self.cookie = None
+
+    def request(self, method, path, body=None):
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+        headers = {'Content-Type': 'application/json'}
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        connection.request(method, path, json.dumps(body) if body is not None else None, headers)
+        response = connection.getresponse()
+        data = response.read()
+        cookie = response.getheader('Set-Cookie')
+        if cookie:
+            self.cookie = cookie.split(';', 1)[0]
+        connection.close()
+        return response.status, data
+
+def _login(port, user):
+    client = Client(port)
+    client.request('POST', '/api/auth/login', {'email': f'load{user}@example.com', 'password': PASSWORD})
+    status, data = client.request('GET', '/api/courses?limit=20')
+    return client, [course['id'] for course in json.loads(data)]
+
+def _client_loop(client, course_ids, deadline, write_ratio, results):
+    latencies, errors = [], 0
+    while time.perf_counter() < deadline:
+        roll = random.random()
+        started = time.perf_counter()
+        if roll < write_ratio:
+            status, _ = client.request('PUT', f'/api/courses/{random.choice(course_ids)}',
+                                       {'completedSections': random.randint(0, 20)})
+        elif roll < 0.5:
+            status, _ = client.request('GET', '/api/dashboard')
+        else:
+            status, _ = client.request('GET', '/api/events?limit=50')
+        latencies.append(time.perf_counter() - started)
+        errors += status >= 400
+    results.append((latencies, errors))
+
+def run_scenario(name, template, args):
+    workdir = tempfile.mkdtemp(prefix=f'loadtest-{name}-')
+    path = os.path.join(workdir, 'load.db')
+    shutil.copy(template, path)
+    env = {
+        **os.environ, **SCENARIOS[name],
+        'DATABASE_URL': f'sqlite:///{path}', 'SECRET_KEY': 'loadtest', 'CACHE_ENABLED': '0',
+        'AUTH_RATE_LIMIT_ENABLED': '0',
+    }
+    if args.server == 'gunicorn':
+        ports = [_free_port()]
+        commands = [[sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '-w', str(args.workers),
+                     '-b', f'127.0.0.1:{ports[0]}']]
+    else:
+        # Without gunicorn, one threaded werkzeug server per worker, each on
+        # its own port; clients are spread across them
+        ports = [_free_port() for _ in range(args.workers)]
+        commands = [[sys.executable, '-c', 'from werkzeug.serving import run_simple; from wsgi import app; '
+                     f'run_simple("127.0.0.1", {port}, app, threaded=True)'] for port in ports]
+    servers = [
+        subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        for command in commands
+    ]
+    try:
+        for port in ports:
+            for _ in range(100):
+                try:
+                    Client(port).request('GET', '/api/auth/user')
+                    break
+                except OSError:
+                    time.sleep(0.1)
+
+        # Log everyone in first so password hashing stays out of the numbers
+        clients = [_login(ports[i % len(ports)], i % args.users) for i in range(args.clients)]
+        results = []
+        deadline = time.perf_counter() + args.duration
+        threads = [
+            threading.Thread(target=_client_loop, args=(client, course_ids, deadline, args.write_ratio, results))
+            for client, course_ids in clients
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        for server in servers:
+            server.terminate()
+            server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    latencies = sorted(latency for batch, _ in results for latency in batch)
+    errors = sum(count for _, count in results)
+    return {
+        'requests': len(latencies),
+        'rps': len(latencies) / elapsed,
+        'p50': statistics.median(latencies) * 1000,
+        'p95': latencies[int(len(latencies) * 0.95)] * 1000,
+        'errors': errors,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare engine profiles under concurrent load')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn worker processes')
+    parser.add_argument('--clients', type=int, default=16, help='concurrent client threads')
+    parser.add_argument('--duration', type=float, default=15, help='seconds per scenario')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--courses', type=int, default=20, help='courses per user')
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--server', choices=['gunicorn', 'werkzeug'],
+                        default='gunicorn' if importlib.util.find_spec('gunicorn') else 'werkzeug')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS))
+    args = parser.parse_args()
+
+    template = os.path.join(tempfile.mkdtemp(prefix='loadtest-'), 'template.db')
+    seed(template, args.users, args.courses)
+
+    print(f'{"scenario":<12}{"requests":>10}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"errors":>8}')
+    for name in args.scenario or SCENARIOS:
+        result = run_scenario(name, template, args)
+        print(f'{name:<12}{result["requests"]:>10}{result["rps"]:>10.1f}{result["p50"]:>10.1f}'
+              f'{result["p95"]:>10.1f}{result["errors"]:>8}')
+    shutil.rmtree(os.path.dirname(template), ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,278 @@
+import contextvars
+import logging
+import threading
+import time
+from bisect import bisect_left
+from flask import Response, g, request
+from sqlalchemy import event
+
+# Request instrumentation for app.py, and for asgi.py via MetricsMiddleware.
+#
+# Every request gets a RequestStats in a context variable; SQLAlchemy cursor
+# events add each query's count and time to it, and serialization.py adds the
+# time spent turning rows into JSON. After the request the totals go into
+# per-route histograms, exported in Prometheus text format on GET /metrics,
+# and into a Server-Timing header so browser dev tools show the split.
+#
+# Requests issuing more than METRICS_QUERY_THRESHOLD queries are logged with
+# their most repeated statement, which is what an N+1 loop looks like, and
+# queries slower than SLOW_QUERY_MS are logged with their bound parameters
+# reduced to type names. Counters are per process.
+#
+#   python bench_metrics.py --requests 2000
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+EXPOSITION_TYPE = 'text/plain; version=0.0.4'
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('learntrack_request_stats', default=None)
+
+class RequestStats:
+    __slots__ = ('route', 'started', 'queries', 'query_time', 'serialize_time', 'statements')
+
+    def __init__(self, route):
+        # `route` is called for the route label once the request is routed
+        self.route = route
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.query_time = 0.0
+        self.serialize_time = 0.0
+        self.statements = {}
+
+def record_serialization(started):
+    # Called by serialization.py with the perf_counter() its work started at
+    stats = _current.get()
+    if stats is not None:
+        stats.serialize_time += time.perf_counter() - started
+
+def _label_string(names, values):
+    return ','.join(f'{name}="{value}"' for name, value in zip(names, values))
+
+class Histogram:
+    def __init__(self, name, description, buckets, labels=('route', 'method')):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.labels = labels
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.get(labels)
+            if series is None:
+                # One count per bucket plus +Inf, then the sum
+                series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {labels: list(values) for labels, values in self.series.items()}
+        for labels, values in sorted(series.items()):
+            prefix = _label_string(self.labels, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{prefix}}} {values[-1]}')
+            lines.append(f'{self.name}_count{{{prefix}}} {cumulative}')
+        return lines
+
+class Counter:
+    def __init__(self, name, description, labels=('route', 'method')):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = dict(self.values)
+        for labels, value in sorted(values.items()):
+            lines.append(f'{self.name}{{{_label_string(self.labels, labels)}}} {value}')
+        return lines
+
+def redact(parameters):
+    # Bound values replaced by their type names: enough to read a plan, no user data
+    if isinstance(parameters, dict):
+        return {name: type(value).__name__ for name, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            return f'<{len(parameters)} parameter sets>'
+        return tuple(type(value).__name__ for value in parameters)
+    return type(parameters).__name__
+
+class Metrics:
+    def __init__(self):
+        self.requests = Histogram('learntrack_request_duration_seconds', 'Request latency', DURATION_BUCKETS)
+        self.queries = Histogram('learntrack_request_queries', 'SQL queries per request', QUERY_BUCKETS)
+        self.query_time = Histogram('learntrack_request_query_seconds', 'Time spent in SQL per request',
+                                    DURATION_BUCKETS)
+        self.serialize_time = Histogram('learntrack_request_serialize_seconds',
+                                        'Time spent serializing responses per request', DURATION_BUCKETS)
+        self.response_size = Histogram('learntrack_response_bytes', 'Response body size', SIZE_BUCKETS)
+        self.query_heavy = Counter('learntrack_query_heavy_requests_total',
+                                   'Requests issuing more than METRICS_QUERY_THRESHOLD queries')
+        self.slow_queries = Counter('learntrack_slow_queries_total', 'Queries slower than SLOW_QUERY_MS',
+                                    labels=('route',))
+        self.configure({})
+
+    def configure(self, config):
+        self.enabled = config.get('METRICS_ENABLED', True)
+        self.query_threshold = config.get('METRICS_QUERY_THRESHOLD', 20)
+        self.slow_query = config.get('SLOW_QUERY_MS', 250) / 1000
+        self.server_timing = config.get('METRICS_SERVER_TIMING', True)
+
+    def init_app(self, app, db):
+        self.configure(app.config)
+        with app.app_context():
+            engines = db.engines
+        for engine in engines.values():
+            self.instrument_engine(engine)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._teardown)
+        app.add_url_rule('/metrics', 'metrics', self.export)
+
+    def instrument_engine(self, engine):
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(engine, 'handle_error', self._handle_error)
+
+    # Engine events
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self.enabled:
+            conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('query_started')
+        if not started:
+            return
+        elapsed = time.perf_counter() - started.pop()
+        stats = _current.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.query_time += elapsed
+            stats.statements[statement] = stats.statements.get(statement, 0) + 1
+        if elapsed >= self.slow_query:
+            route = stats.route() if stats is not None else '<background>'
+            self.slow_queries.inc((route,))
+            logger.warning("Slow query (%.1f ms) in %s: %s [parameters: %s]",
+                           elapsed * 1000, route, statement, redact(parameters))
+
+    def _handle_error(self, context):
+        # A failed query never reaches after_cursor_execute
+        if context.connection is not None:
+            started = context.connection.info.get('query_started')
+            if started:
+                started.pop()
+
+    # Request hooks
+
+    def _start(self):
+        if self.enabled:
+            g.request_stats = stats = RequestStats(_route)
+            g.request_stats_token = _current.set(stats)
+
+    def _finish(self, response):
+        stats = g.pop('request_stats', None)
+        if stats is None:
+            return response
+        # Streamed bodies have no length yet, and measuring one would buffer it
+        size = None if response.is_streamed else response.calculate_content_length()
+        timing = self.record(stats, request.method, size)
+        if timing:
+            response.headers['Server-Timing'] = timing
+        return response
+
+    def _teardown(self, exc):
+        token = g.pop('request_stats_token', None)
+        if token is not None:
+            _current.reset(token)
+
+    def record(self, stats, method, size):
+        # Adds a finished request to the histograms; returns its Server-Timing
+        # header value, or None when that is turned off
+        elapsed = time.perf_counter() - stats.started
+        labels = (stats.route(), method)
+        self.requests.observe(labels, elapsed)
+        self.queries.observe(labels, stats.queries)
+        self.query_time.observe(labels, stats.query_time)
+        self.serialize_time.observe(labels, stats.serialize_time)
+        if size is not None:
+            self.response_size.observe(labels, size)
+
+        if stats.queries > self.query_threshold:
+            self.query_heavy.inc(labels)
+            statement, repeats = max(stats.statements.items(), key=lambda item: item[1])
+            logger.warning("%s %s issued %d queries; the most repeated ran %d times: %s",
+                           method, labels[0], stats.queries, repeats, statement)
+
+        if not self.server_timing:
+            return None
+        return (
+            f'db;dur={stats.query_time * 1000:.1f};desc="{stats.queries} queries", '
+            f'serialize;dur={stats.serialize_time * 1000:.1f}, '
+            f'app;dur={elapsed * 1000:.1f}'
+        )
+
+    def render(self):
+        lines = []
+        for metric in (self.requests, self.queries, self.query_time, self.serialize_time,
+                       self.response_size, self.query_heavy, self.slow_queries):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def export(self):
+        return Response(self.render(), mimetype=EXPOSITION_TYPE)
+
+class MetricsMiddleware:
+    # The request hooks as ASGI middleware, for asgi.py. Routes are labelled
+    # with Starlette's path templates.
+    def __init__(self, app, metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self.metrics.enabled:
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats(lambda: _asgi_route(scope))
+        token = _current.set(stats)
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                headers = list(message.get('headers', ()))
+                # Streamed bodies are sent without a Content-Length
+                size = next((int(value) for name, value in headers if name.lower() == b'content-length'), None)
+                timing = self.metrics.record(stats, scope['method'], size)
+                if timing:
+                    message = {**message, 'headers': headers + [(b'server-timing', timing.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+
+def _route():
+    return request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+
+def _asgi_route(scope):
+    route = scope.get('route')
+    return route.path if route is not None else '<unmatched>'
+
+metrics = Metrics()
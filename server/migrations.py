@@ -0,0 +1,271 @@
+import logging
+from datetime import date, datetime
+import click
+from flask.cli import AppGroup
+from sqlalchemy import Column, Index, MetaData, Table, inspect, text
+from sqlalchemy.schema import CreateColumn
+from models import db
+
+# Versioned schema migrations. Each entry runs once, in order, and its
+# version is recorded in the schema_migrations table. Migrations must be safe
+# to run against a database created by an older `db.create_all()`.
+#
+# Derived data (insight rollups, generated recommendations, the search
+# index) is computed from the models, which describe the latest schema, so a
+# migration only queues its rebuild in schema_rebuilds. Queued rebuilds run
+# once no migration is pending, in REBUILDS order.
+#
+#   flask --app app schema upgrade
+#   flask --app app schema status
+
+logger = logging.getLogger(__name__)
+
+def _create_index(connection, table_name, index_name, *columns, unique=False):
+    # Built on a detached Table so the models' metadata is left untouched
+    table = Table(table_name, MetaData(), *[Column(column) for column in columns])
+    Index(index_name, *table.c, unique=unique).create(connection, checkfirst=True)
+
+def _drop_index(connection, table_name, index_name):
+    if any(ix['name'] == index_name for ix in inspect(connection).get_indexes(table_name)):
+        connection.execute(text(f'DROP INDEX {index_name}'))
+
+def _add_columns(connection, table_name, *column_names):
+    existing = {column['name'] for column in inspect(connection).get_columns(table_name)}
+    table = db.metadata.tables[table_name]
+    for name in column_names:
+        if name not in existing:
+            ddl = CreateColumn(table.c[name]).compile(dialect=connection.dialect)
+            connection.execute(text(f'ALTER TABLE {table_name} ADD COLUMN {ddl}'))
+
+def _initial_schema(connection):
+    db.metadata.create_all(connection, checkfirst=True)
+
+def _foreign_key_indexes(connection):
+    _create_index(connection, 'courses', 'ix_courses_user_id_created_at', 'user_id', 'created_at')
+    _create_index(connection, 'events', 'ix_events_course_id_date', 'course_id', 'date')
+    _create_index(connection, 'attendance', 'ix_attendance_course_id_date', 'course_id', 'date')
+    _create_index(connection, 'recommendations', 'ix_recommendations_course_id_created_at', 'course_id', 'created_at')
+
+def _unique_attendance_per_day(connection):
+    # Keep the newest record for any (course_id, date) that was entered twice,
+    # then swap the plain index for a unique one that upserts can target. The
+    # older records are kept in attendance_duplicates for review.
+    duplicates = ('date IS NOT NULL AND id NOT IN ('
+                  'SELECT MAX(id) FROM attendance WHERE date IS NOT NULL GROUP BY course_id, date)')
+    connection.execute(text(f'CREATE TABLE attendance_duplicates AS SELECT * FROM attendance WHERE {duplicates}'))
+    moved = connection.execute(text(f'DELETE FROM attendance WHERE {duplicates}')).rowcount
+    if moved:
+        logger.warning("Moved %d duplicate attendance records to attendance_duplicates", moved)
+    _drop_index(connection, 'attendance', 'ix_attendance_course_id_date')
+    _create_index(connection, 'attendance', 'uq_attendance_course_id_date', 'course_id', 'date', unique=True)
+
+def _create_tables(connection, *table_names):
+    for name in table_names:
+        db.metadata.tables[name].create(connection, checkfirst=True)
+
+def _queue_rebuild(connection, name):
+    connection.execute(text(
+        'INSERT INTO schema_rebuilds (name) SELECT :name '
+        'WHERE NOT EXISTS (SELECT 1 FROM schema_rebuilds WHERE name = :name)'
+    ), {'name': name})
+
+def _weekly_insight_rollups(connection):
+    _create_tables(connection, 'weekly_insights', 'course_progress')
+    _queue_rebuild(connection, 'insights')
+
+def _generated_recommendations(connection):
+    _add_columns(connection, 'recommendations', 'title', 'priority', 'score', 'generated')
+    _queue_rebuild(connection, 'recommendations')
+
+def _job_queue(connection):
+    _create_tables(connection, 'jobs')
+
+def _token_versions(connection):
+    _add_columns(connection, 'users', 'token_version')
+
+def _recurring_events(connection):
+    _add_columns(connection, 'events', 'recurrence', 'series_end')
+    _create_index(connection, 'events', 'ix_events_course_id_series_end', 'course_id', 'series_end')
+
+def _sync_tracking(connection):
+    now = datetime.utcnow()
+    for table_name, owner in (('courses', 'user_id'), ('events', 'course_id'),
+                              ('attendance', 'course_id'), ('recommendations', 'course_id')):
+        _add_columns(connection, table_name, 'updated_at')
+        connection.execute(
+            text(f'UPDATE {table_name} SET updated_at = COALESCE(created_at, :now) WHERE updated_at IS NULL'),
+            {'now': now}
+        )
+        _create_index(connection, table_name, f'ix_{table_name}_{owner}_updated_at', owner, 'updated_at')
+    _create_tables(connection, 'tombstones')
+
+def _search_index(connection):
+    from search import create_index
+
+    create_index(connection)
+    _queue_rebuild(connection, 'search')
+
+def _versions_and_idempotency_keys(connection):
+    _add_columns(connection, 'courses', 'version')
+    _add_columns(connection, 'attendance', 'version')
+    _create_tables(connection, 'idempotency_keys')
+
+def _term_partitions(connection):
+    from archive import PARTITIONED, next_term, partition_table, term_start
+
+    # The partition key joins the primary key, so it cannot be NULL; undated
+    # rows take the day they were created
+    for table_name in PARTITIONED:
+        connection.execute(text(
+            f'UPDATE {table_name} SET date = COALESCE(date(created_at), CURRENT_DATE) WHERE date IS NULL'
+        ))
+    if connection.dialect.name != 'postgresql':
+        return
+    for table_name in PARTITIONED:
+        connection.execute(text(f'ALTER TABLE {table_name} ALTER COLUMN date SET NOT NULL'))
+        partition_table(connection, table_name, next_term(term_start(date.today())))
+
+def _job_delivery(connection):
+    # Jobs that already finished had their side effects run by the worker
+    _add_columns(connection, 'jobs', 'delivered_at')
+    connection.execute(text('UPDATE jobs SET delivered_at = finished_at WHERE finished_at IS NOT NULL'))
+
+def _archive_runs(connection):
+    _create_tables(connection, 'archive_runs')
+
+MIGRATIONS = [
+    (1, 'initial schema', _initial_schema),
+    (2, 'composite indexes on foreign-key hot paths', _foreign_key_indexes),
+    (3, 'one attendance record per course and day', _unique_attendance_per_day),
+    (4, 'weekly insight rollups', _weekly_insight_rollups),
+    (5, 'generated recommendations', _generated_recommendations),
+    (6, 'background job queue', _job_queue),
+    (7, 'refresh token versions', _token_versions),
+    (8, 'recurring events', _recurring_events),
+    (9, 'updated_at and tombstones for delta sync', _sync_tracking),
+    (10, 'full-text search index', _search_index),
+    (11, 'row versions and idempotency keys', _versions_and_idempotency_keys),
+    (12, 'term partitions for attendance and events', _term_partitions),
+    (13, 'delivery tracking for finished jobs', _job_delivery),
+    (14, 'archive runs', _archive_runs),
+]
+
+def _rebuild_insights(connection):
+    from insights import rebuild
+
+    rebuild(connection)
+
+def _rebuild_recommendations(connection):
+    from recommendations import refresh
+
+    refresh(connection)
+
+def _rebuild_search(connection):
+    from search import rebuild
+
+    rebuild(connection)
+
+REBUILDS = [
+    ('insights', _rebuild_insights),
+    ('recommendations', _rebuild_recommendations),
+    ('search', _rebuild_search),
+]
+
+def _ensure_version_table(connection):
+    connection.execute(text(
+        'CREATE TABLE IF NOT EXISTS schema_migrations ('
+        'version INTEGER PRIMARY KEY, '
+        'description VARCHAR(255) NOT NULL, '
+        'applied_at TIMESTAMP NOT NULL)'
+    ))
+    connection.execute(text('CREATE TABLE IF NOT EXISTS schema_rebuilds (name VARCHAR(50) PRIMARY KEY)'))
+
+def applied_versions(connection):
+    if not inspect(connection).has_table('schema_migrations'):
+        return set()
+    return {row[0] for row in connection.execute(text('SELECT version FROM schema_migrations'))}
+
+def queued_rebuilds(connection):
+    if not inspect(connection).has_table('schema_rebuilds'):
+        return []
+    queued = {row[0] for row in connection.execute(text('SELECT name FROM schema_rebuilds'))}
+    return [name for name, _ in REBUILDS if name in queued]
+
+def run_rebuilds(connection):
+    # Queued rebuilds, once the schema is at the latest version
+    if {version for version, _, _ in MIGRATIONS} - applied_versions(connection):
+        return []
+    rebuilt = queued_rebuilds(connection)
+    for name, rebuild in REBUILDS:
+        if name in rebuilt:
+            rebuild(connection)
+            connection.execute(text('DELETE FROM schema_rebuilds WHERE name = :name'), {'name': name})
+    return rebuilt
+
+def current_version(engine):
+    with engine.connect() as connection:
+        return max(applied_versions(connection), default=0)
+
+def upgrade_connection(connection, target=None):
+    applied = []
+    _ensure_version_table(connection)
+    done = applied_versions(connection)
+    for version, description, migrate in MIGRATIONS:
+        if version in done or (target is not None and version > target):
+            continue
+        migrate(connection)
+        connection.execute(
+            text('INSERT INTO schema_migrations (version, description, applied_at) '
+                 'VALUES (:version, :description, :applied_at)'),
+            {'version': version, 'description': description, 'applied_at': datetime.utcnow()}
+        )
+        applied.append(version)
+    run_rebuilds(connection)
+    return applied
+
+def upgrade(engine, target=None):
+    with engine.begin() as connection:
+        return upgrade_connection(connection, target)
+
+def pending_migrations(engine):
+    with engine.connect() as connection:
+        done = applied_versions(connection)
+    return [(version, description) for version, description, _ in MIGRATIONS if version not in done]
+
+schema_cli = AppGroup('schema', help='Manage the database schema.')
+
+@schema_cli.command('upgrade', help='Apply pending migrations.')
+@click.option('--target', type=int, help='Stop after this version.')
+def upgrade_command(target):
+    applied = upgrade(db.engine, target)
+    if applied:
+        click.echo(f"Applied migrations: {', '.join(str(v) for v in applied)}")
+    click.echo(f"Schema is at version {current_version(db.engine)}")
+    with db.engine.connect() as connection:
+        queued = queued_rebuilds(connection)
+    if queued:
+        click.echo(f"Rebuilds queued until the last migration: {', '.join(queued)}")
+
+@schema_cli.command('status', help='Show the schema version, pending migrations and queued rebuilds; '
+                                   'exits 1 if any are pending.')
+def status_command():
+    pending = pending_migrations(db.engine)
+    with db.engine.connect() as connection:
+        queued = queued_rebuilds(connection)
+    click.echo(f"Schema is at version {current_version(db.engine)}")
+    for version, description in pending:
+        click.echo(f"Pending: {version} {description}")
+    for name in queued:
+        click.echo(f"Queued rebuild: {name}")
+    if pending or queued:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        applied = upgrade(db.engine)
+        if applied:
+            print(f"Applied migrations: {', '.join(str(v) for v in applied)}")
+        print(f"Schema is at version {current_version(db.engine)}")
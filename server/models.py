@@ -1,8 +1,10 @@
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+import json
+from engines import RoutingSession
+from passwords import passwords
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -11,15 +13,19 @@ class User(db.Model):
     username = db.Column(db.String(50), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(255), nullable=False)
+    token_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     courses = db.relationship('Course', backref='user', lazy=True)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = passwords.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return passwords.verify(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return passwords.needs_rehash(self.password_hash)
 
     def to_dict(self):
         return {
@@ -30,6 +36,10 @@ class User(db.Model):
 
 class Course(db.Model):
     __tablename__ = 'courses'
+    __table_args__ = (
+        db.Index('ix_courses_user_id_created_at', 'user_id', 'created_at'),
+        db.Index('ix_courses_user_id_updated_at', 'user_id', 'updated_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -42,11 +52,16 @@ class Course(db.Model):
     start_date = db.Column(db.Date)
     end_date = db.Column(db.Date)
     image_url = db.Column(db.String(255))
+    # Bumped by every update; sent as the ETag that If-Match is checked against
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     events = db.relationship('Event', backref='course', lazy=True)
     attendance = db.relationship('Attendance', backref='course', lazy=True)
 
+    __mapper_args__ = {'version_id_col': version}
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -58,20 +73,31 @@ class Course(db.Model):
             'completedSections': self.completed_sections,
             'startDate': self.start_date.isoformat() if self.start_date else None,
             'endDate': self.end_date.isoformat() if self.end_date else None,
-            'imageUrl': self.image_url
+            'imageUrl': self.image_url,
+            'version': self.version
         }
 
 class Event(db.Model):
     __tablename__ = 'events'
+    __table_args__ = (
+        db.Index('ix_events_course_id_date', 'course_id', 'date'),
+        db.Index('ix_events_course_id_series_end', 'course_id', 'series_end'),
+        db.Index('ix_events_course_id_updated_at', 'course_id', 'updated_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     course_id = db.Column(db.Integer, db.ForeignKey('courses.id'), nullable=False)
     title = db.Column(db.String(100), nullable=False)
-    date = db.Column(db.Date)
+    # The partition key on Postgres (see archive.py), so it is required
+    date = db.Column(db.Date, nullable=False)
     time = db.Column(db.Time)
     type = db.Column(db.String(50))
     description = db.Column(db.Text)
+    # Recurrence rule (see recurrence.py) and the date of the last occurrence
+    recurrence = db.Column(db.String(100))
+    series_end = db.Column(db.Date)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     def to_dict(self):
         return {
@@ -81,18 +107,27 @@ class Event(db.Model):
             'date': self.date.isoformat() if self.date else None,
             'time': str(self.time) if self.time else None,
             'type': self.type,
-            'description': self.description
+            'description': self.description,
+            'recurrence': self.recurrence
         }
 
 class Attendance(db.Model):
     __tablename__ = 'attendance'
+    __table_args__ = (
+        db.Index('uq_attendance_course_id_date', 'course_id', 'date', unique=True),
+        db.Index('ix_attendance_course_id_updated_at', 'course_id', 'updated_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     course_id = db.Column(db.Integer, db.ForeignKey('courses.id'), nullable=False)
-    date = db.Column(db.Date)
+    date = db.Column(db.Date, nullable=False)
     status = db.Column(db.String(50))
     notes = db.Column(db.Text)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __mapper_args__ = {'version_id_col': version}
 
     def to_dict(self):
         return {
@@ -100,22 +135,34 @@ class Attendance(db.Model):
             'courseId': self.course_id,
             'date': self.date.isoformat() if self.date else None,
             'status': self.status,
-            'notes': self.notes
+            'notes': self.notes,
+            'version': self.version
         }
 
 class Recommendation(db.Model):
     __tablename__ = 'recommendations'
+    __table_args__ = (
+        db.Index('ix_recommendations_course_id_created_at', 'course_id', 'created_at'),
+        db.Index('ix_recommendations_course_id_updated_at', 'course_id', 'updated_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     course_id = db.Column(db.Integer, db.ForeignKey('courses.id'), nullable=False)
     content = db.Column(db.Text)
+    title = db.Column(db.String(100))
+    priority = db.Column(db.String(20))
+    score = db.Column(db.Float)
+    generated = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     def to_dict(self):
         return {
             'id': self.id,
             'courseId': self.course_id,
-            'content': self.content
+            'title': self.title,
+            'description': self.content,
+            'priority': self.priority
         }
 
 class Insight(db.Model):
@@ -129,4 +176,118 @@ class Insight(db.Model):
         return {
             'id': self.id,
             'content': self.content
-        }
\ No newline at end of file
+        }
+
+class WeeklyInsight(db.Model):
+    __tablename__ = 'weekly_insights'
+    __table_args__ = (
+        db.Index('uq_weekly_insights_user_id_week_starting', 'user_id', 'week_starting', unique=True),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    week_starting = db.Column(db.Date, nullable=False)
+    sections_completed = db.Column(db.Integer, nullable=False, default=0)
+    courses_progressed = db.Column(db.Integer, nullable=False, default=0)
+    attendance_present = db.Column(db.Integer, nullable=False, default=0)
+    attendance_total = db.Column(db.Integer, nullable=False, default=0)
+    deadlines = db.Column(db.Integer, nullable=False, default=0)
+
+    def to_dict(self):
+        return {
+            'weekStarting': self.week_starting.isoformat(),
+            'sectionsCompleted': self.sections_completed,
+            'coursesProgressed': self.courses_progressed,
+            'attendanceRate': round(self.attendance_present * 100 / self.attendance_total) if self.attendance_total else None,
+            'upcomingDeadlines': self.deadlines
+        }
+
+class CourseProgress(db.Model):
+    __tablename__ = 'course_progress'
+    __table_args__ = (
+        db.Index('ix_course_progress_course_id_created_at', 'course_id', 'created_at'),
+        db.Index('ix_course_progress_user_id_created_at', 'user_id', 'created_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    course_id = db.Column(db.Integer, db.ForeignKey('courses.id'), nullable=False)
+    delta = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+        db.Index('ix_jobs_user_id_created_at', 'user_id', 'created_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(100))
+    locked_at = db.Column(db.DateTime)
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    delivered_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'attempts': self.attempts,
+            'maxAttempts': self.max_attempts,
+            'runAt': self.run_at.isoformat() if self.run_at else None,
+            'result': json.loads(self.result) if self.result else None,
+            'error': self.error,
+            'createdAt': self.created_at.isoformat() if self.created_at else None,
+            'finishedAt': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+class Tombstone(db.Model):
+    # Deleted rows, kept for a while so /api/sync can report the deletion
+    __tablename__ = 'tombstones'
+    __table_args__ = (
+        db.Index('ix_tombstones_user_id_deleted_at', 'user_id', 'deleted_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    resource = db.Column(db.String(20), nullable=False)
+    row_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class ArchiveRun(db.Model):
+    # One `archive.py archive` run: rows closed before `before` left the
+    # database, so the weekly rollups up to then are kept as they are
+    __tablename__ = 'archive_runs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    before = db.Column(db.Date, nullable=False)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class IdempotencyKey(db.Model):
+    # A client's Idempotency-Key and the response it got, for replaying retries
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        db.Index('uq_idempotency_keys_user_id_key', 'user_id', 'key', unique=True),
+        db.Index('ix_idempotency_keys_created_at', 'created_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    # Null until the request that claimed the key has finished
+    status_code = db.Column(db.Integer)
+    response = db.Column(db.Text)
+    headers = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
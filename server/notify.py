@@ -0,0 +1,199 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+
+# Live change notifications for the dashboard.
+#
+# Write handlers call notifier.publish(user_id, *resources) once their
+# transaction has committed. The broker carries that to every node: straight
+# into this process's hub for a single node, or through a redis channel when
+# app.py, asgi.py and the job workers run as separate processes. Each node's
+# hub fans it out to the user's open streams, which both apps serve as
+# server-sent events (GET /api/stream). In asgi.py an idle stream is one
+# suspended coroutine; app.py holds a worker thread per stream. A stream waits for the first change, then for
+# LIVE_COALESCE_MS more, and sends everything that arrived meanwhile as one
+# event, so a burst of writes costs the client one refetch.
+
+RESOURCES = ('courses', 'events', 'attendance', 'recommendations', 'insights')
+
+logger = logging.getLogger(__name__)
+
+class Subscription:
+    # One open stream; lives on the event loop that serves it
+
+    def __init__(self, user_id, loop):
+        self.user_id = user_id
+        self.loop = loop
+        self.pending = set()
+        self.ready = asyncio.Event()
+
+    def _notify(self, resources):
+        self.pending.update(resources)
+        self.ready.set()
+
+    def notify(self, resources):
+        # Safe to call from any thread
+        self.loop.call_soon_threadsafe(self._notify, resources)
+
+    async def changes(self, window, timeout):
+        # The next batch of changed resources, or None when `timeout` passes quietly
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        await asyncio.sleep(window)
+        resources = sorted(self.pending)
+        self.pending.clear()
+        self.ready.clear()
+        return resources
+
+class ThreadSubscription:
+    # One open stream served by a WSGI worker thread
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.pending = set()
+        self.ready = threading.Event()
+        self._lock = threading.Lock()
+
+    def notify(self, resources):
+        with self._lock:
+            self.pending.update(resources)
+        self.ready.set()
+
+    def changes(self, window, timeout):
+        if not self.ready.wait(timeout):
+            return None
+        time.sleep(window)
+        with self._lock:
+            resources = sorted(self.pending)
+            self.pending.clear()
+            self.ready.clear()
+        return resources
+
+class Hub:
+    # This node's open streams, by user
+
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id, threaded=False):
+        if threaded:
+            subscription = ThreadSubscription(user_id)
+        else:
+            subscription = Subscription(user_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def count(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def deliver(self, user_id, resources):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(user_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.notify(resources)
+            except RuntimeError:
+                # Its event loop has shut down
+                self.unsubscribe(subscription)
+
+class LocalBroker:
+    # A single node: publishing is delivering
+
+    def __init__(self, hub):
+        self.hub = hub
+
+    def publish(self, user_id, resources):
+        self.hub.deliver(user_id, resources)
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+class RedisBroker:
+    # Several nodes: every change goes through one redis channel, and each
+    # node that serves streams listens on it. Works with any client exposing
+    # the redis-py publish/pubsub API, including cache.FakeRedis.
+
+    def __init__(self, client, hub, channel='learntrack:changes'):
+        self.client = client
+        self.hub = hub
+        self.channel = channel
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def publish(self, user_id, resources):
+        self.client.publish(self.channel, json.dumps({'user': user_id, 'resources': sorted(resources)}))
+
+    def _receive(self, message):
+        data = json.loads(message['data'])
+        self.hub.deliver(data['user'], data['resources'])
+
+    def start(self):
+        with self._lock:
+            if self._worker is None:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(**{self.channel: self._receive})
+                self._worker = pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def stop(self):
+        with self._lock:
+            if self._worker is not None:
+                self._worker.stop()
+                self._worker = None
+
+def create_broker(config, hub):
+    kind = config.get('LIVE_BROKER', 'local')
+    if kind == 'local':
+        return LocalBroker(hub)
+    if kind == 'fakeredis':
+        from cache import FakeRedis
+        return RedisBroker(FakeRedis(), hub)
+    if kind == 'redis':
+        import redis
+        return RedisBroker(redis.Redis.from_url(config['REDIS_URL']), hub)
+    raise ValueError(f"Unknown LIVE_BROKER: {kind}")
+
+class Notifier:
+    def __init__(self):
+        self.hub = Hub()
+        self.broker = None
+        self.configure({})
+
+    def init_app(self, app):
+        self.configure(app.config)
+
+    def configure(self, config):
+        if self.broker is not None:
+            self.broker.stop()
+        self.broker = create_broker(config, self.hub)
+        self.coalesce = config.get('LIVE_COALESCE_MS', 250) / 1000
+        self.heartbeat = config.get('LIVE_HEARTBEAT_SECONDS', 15)
+
+    def publish(self, user_id, *resources):
+        # The write has committed by now; a broker outage must not fail it
+        if user_id is None:
+            return
+        try:
+            self.broker.publish(user_id, resources)
+        except Exception:
+            logger.exception("Could not publish changes for user %s", user_id)
+
+notifier = Notifier()
@@ -0,0 +1,117 @@
+import base64
+import json
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import and_, or_
+from serialization import list_response
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+def parse_limit(args):
+    value = args.get('limit')
+    if value is None:
+        return DEFAULT_LIMIT
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    return min(limit, MAX_LIMIT)
+
+def parse_date(value, name):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a date in YYYY-MM-DD format")
+
+def parse_time(value, name):
+    try:
+        return time.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a time in HH:MM[:SS] format")
+
+def parse_int(value, name):
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
+
+def encode_cursor(sort_value, row_id):
+    if isinstance(sort_value, (date, datetime)):
+        sort_value = sort_value.isoformat()
+    payload = json.dumps([sort_value, row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(token, sort_column):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        if sort_value is not None:
+            python_type = sort_column.type.python_type
+            sort_value = python_type.fromisoformat(sort_value)
+        return sort_value, int(row_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+def filter_query(query, args, date_column, course_column=None, status_column=None, type_column=None,
+                 default_filter=None):
+    # Every filter is pushed down into the WHERE clause. Without a date range,
+    # `default_filter` applies instead, so Postgres skips older partitions.
+    if args.get('from'):
+        query = query.filter(date_column >= parse_date(args['from'], 'from'))
+    elif default_filter is not None and not args.get('to'):
+        query = query.filter(default_filter)
+    if args.get('to'):
+        # Exclusive upper bound on the next day keeps `to` inclusive for both
+        # Date and DateTime columns
+        query = query.filter(date_column < parse_date(args['to'], 'to') + timedelta(days=1))
+    if course_column is not None and args.get('courseId'):
+        query = query.filter(course_column == parse_int(args['courseId'], 'courseId'))
+    if status_column is not None and args.get('status'):
+        query = query.filter(status_column == args['status'])
+    if type_column is not None and args.get('type'):
+        query = query.filter(type_column == args['type'])
+    return query
+
+def keyset_page(query, sort_column, id_column, args):
+    # Keyset pagination over (sort_column, id) with NULLs sorted first, so a
+    # page costs the same no matter how deep into the list it is. Works on
+    # ORM queries and select() statements alike; returns the statement for
+    # one page plus a lookahead row, and the page size.
+    limit = parse_limit(args)
+
+    if args.get('cursor'):
+        sort_value, row_id = decode_cursor(args['cursor'], sort_column)
+        if sort_value is None:
+            query = query.filter(or_(
+                and_(sort_column.is_(None), id_column > row_id),
+                sort_column.isnot(None)
+            ))
+        else:
+            query = query.filter(or_(
+                sort_column > sort_value,
+                and_(sort_column == sort_value, id_column > row_id)
+            ))
+
+    return query.order_by(sort_column.asc().nullsfirst(), id_column.asc()).limit(limit + 1), limit
+
+def split_page(rows, limit, sort_column, id_column):
+    rows = list(rows)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
+    return rows, next_cursor
+
+def paginate(query, sort_column, id_column, args):
+    query, limit = keyset_page(query, sort_column, id_column, args)
+    return split_page(query.all(), limit, sort_column, id_column)
+
+def paginated_response(items, next_cursor):
+    response = list_response(items)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return response
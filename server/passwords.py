@@ -0,0 +1,120 @@
+import argparse
+import time
+from werkzeug.security import generate_password_hash, check_password_hash
+
+try:
+    import argon2
+    import argon2.exceptions
+except ImportError:
+    argon2 = None
+
+# Password hashing policy.
+#
+# PASSWORD_HASHER selects argon2, scrypt or pbkdf2 ('auto' picks argon2 when
+# argon2-cffi is installed, otherwise pbkdf2), each with tunable cost. Hashes
+# from any scheme keep verifying, and needs_rehash() tells the login handlers
+# when a stored hash should be upgraded to the current policy.
+#
+#   python passwords.py calibrate --budget-ms 50
+
+SCHEMES = ('argon2', 'scrypt', 'pbkdf2')
+
+class PasswordPolicy:
+    def __init__(self):
+        self.configure({})
+
+    def configure(self, config):
+        scheme = config.get('PASSWORD_HASHER', 'auto')
+        if scheme == 'auto':
+            scheme = 'argon2' if argon2 is not None else 'pbkdf2'
+        if scheme not in SCHEMES:
+            raise ValueError(f"Unknown PASSWORD_HASHER: {scheme}")
+        if scheme == 'argon2' and argon2 is None:
+            raise ValueError("PASSWORD_HASHER=argon2 needs the argon2-cffi package")
+        self.scheme = scheme
+        self.pbkdf2_iterations = config.get('PASSWORD_PBKDF2_ITERATIONS', 600000)
+        self.scrypt_n = config.get('PASSWORD_SCRYPT_N', 2 ** 15)
+        self.argon2 = argon2.PasswordHasher(
+            time_cost=config.get('PASSWORD_ARGON2_TIME_COST', 2),
+            memory_cost=config.get('PASSWORD_ARGON2_MEMORY_COST', 19456),
+            parallelism=config.get('PASSWORD_ARGON2_PARALLELISM', 1),
+        ) if argon2 is not None else None
+
+    @property
+    def method(self):
+        # werkzeug method string, which is also the prefix of the stored hash
+        if self.scheme == 'scrypt':
+            return f'scrypt:{self.scrypt_n}:8:1'
+        return f'pbkdf2:sha256:{self.pbkdf2_iterations}'
+
+    def hash(self, password):
+        if self.scheme == 'argon2':
+            return self.argon2.hash(password)
+        return generate_password_hash(password, method=self.method)
+
+    def verify(self, stored_hash, password):
+        if stored_hash.startswith('$argon2'):
+            if argon2 is None:
+                raise ValueError("Verifying argon2 hashes needs the argon2-cffi package")
+            try:
+                return self.argon2.verify(stored_hash, password)
+            except (argon2.exceptions.VerificationError, argon2.exceptions.InvalidHashError):
+                return False
+        return check_password_hash(stored_hash, password)
+
+    def needs_rehash(self, stored_hash):
+        if self.scheme == 'argon2':
+            return not stored_hash.startswith('$argon2') or self.argon2.check_needs_rehash(stored_hash)
+        return not stored_hash.startswith(self.method + '$')
+
+passwords = PasswordPolicy()
+
+# Calibration
+
+def _timed(policy, rounds=3):
+    best = None
+    for _ in range(rounds):
+        started = time.perf_counter()
+        policy.hash('calibration-password')
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def calibrate(budget_ms):
+    # Strongest setting per scheme whose hash time stays within the budget
+    results = {}
+    policy = PasswordPolicy()
+
+    policy.configure({'PASSWORD_HASHER': 'pbkdf2', 'PASSWORD_PBKDF2_ITERATIONS': 100000})
+    per_iteration = _timed(policy) / 100000
+    iterations = int(budget_ms / per_iteration // 10000 * 10000)
+    results['pbkdf2'] = ({'PASSWORD_PBKDF2_ITERATIONS': iterations}, iterations * per_iteration)
+
+    for n in (2 ** 17, 2 ** 16, 2 ** 15, 2 ** 14):
+        policy.configure({'PASSWORD_HASHER': 'scrypt', 'PASSWORD_SCRYPT_N': n})
+        elapsed = _timed(policy)
+        if elapsed <= budget_ms:
+            results['scrypt'] = ({'PASSWORD_SCRYPT_N': n}, elapsed)
+            break
+
+    if argon2 is not None:
+        for time_cost in range(6, 0, -1):
+            settings = {'PASSWORD_HASHER': 'argon2', 'PASSWORD_ARGON2_TIME_COST': time_cost,
+                        'PASSWORD_ARGON2_MEMORY_COST': 19456}
+            policy.configure(settings)
+            elapsed = _timed(policy)
+            if elapsed <= budget_ms:
+                del settings['PASSWORD_HASHER']
+                results['argon2'] = (settings, elapsed)
+                break
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pick password hashing parameters for a CPU budget')
+    parser.add_argument('command', choices=['calibrate'])
+    parser.add_argument('--budget-ms', type=float, default=50, help='target hash time per password')
+    args = parser.parse_args()
+
+    for scheme, (settings, elapsed) in calibrate(args.budget_ms).items():
+        values = ' '.join(f'{name}={value}' for name, value in settings.items())
+        print(f"{scheme:<8}{elapsed:>8.1f} ms  PASSWORD_HASHER={scheme} {values}")
@@ -0,0 +1,26 @@
+from werkzeug.http import parse_etags
+
+# Optimistic concurrency for courses and attendance records.
+#
+# Both carry a version column that every update bumps: SQLAlchemy's
+# version_id_col does it for ORM updates (and turns a concurrent change
+# into StaleDataError at flush), SQL-side updates do it explicitly. The
+# version goes out as a strong ETag, and a write sent with If-Match only
+# applies if the row still has that version; otherwise the client gets 412
+# with the current ETag and should refetch. Without If-Match the last
+# write wins, but two writes racing on the same row still cannot both
+# commit.
+
+def etag(version):
+    return f'"{version}"'
+
+def parse_if_match(value):
+    # None when the header is absent
+    return parse_etags(value) if value else None
+
+def matches(if_match, version):
+    return if_match is None or if_match.contains(str(version))
+
+def conflict_status(if_match):
+    # For a row that changed between reading and writing it
+    return 412 if if_match is not None else 409
@@ -0,0 +1,51 @@
+from sqlalchemy import case, func, update
+from models import Course
+
+# Course progress updates.
+#
+# PUT /api/courses/<id> either sets completedSections, a read-modify-write
+# guarded by the course version, or sends completeSections to complete N
+# more sections with one UPDATE ... RETURNING: the increment, the progress
+# percentage and the version bump all happen in SQL, so concurrent
+# increments add up instead of overwriting each other. A course without
+# sections keeps its stored progress rather than dividing by zero.
+
+def progress_percent(completed, total_sections, current):
+    # Integer arithmetic, rounding halves up exactly like the SQL below
+    if not total_sections:
+        return current
+    return (completed * 200 + total_sections) // (total_sections * 2)
+
+def parse_progress_update(data):
+    # (completedSections to set, sections to add); at most one is not None
+    if not isinstance(data, dict):
+        raise ValueError("Request body must be a JSON object")
+    completed, increment = data.get('completedSections'), data.get('completeSections')
+    if completed is not None and increment is not None:
+        raise ValueError("Send either completedSections or completeSections, not both")
+    for name, value, minimum in (('completedSections', completed, 0), ('completeSections', increment, 1)):
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value < minimum):
+            raise ValueError(f"{name} must be an integer of at least {minimum}")
+    return completed, increment
+
+def increment_statement(course_id, user_id, count, if_match=None):
+    # Returns the updated course, or nothing when the course is missing, not
+    # the user's, or (with If-Match) no longer at a matching version
+    completed = func.coalesce(Course.completed_sections, 0) + count
+    statement = (
+        update(Course)
+        .where(Course.id == course_id, Course.user_id == user_id)
+        .values(
+            completed_sections=completed,
+            progress=case(
+                (Course.total_sections > 0, (completed * 200 + Course.total_sections) // (Course.total_sections * 2)),
+                else_=Course.progress,
+            ),
+            version=Course.version + 1,
+        )
+        .returning(Course)
+    )
+    if if_match is not None and not if_match.star_tag:
+        versions = [int(tag) for tag in if_match.as_set() if tag.isdigit()]
+        statement = statement.where(Course.version.in_(versions))
+    return statement
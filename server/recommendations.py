@@ -0,0 +1,265 @@
+import argparse
+from datetime import date, datetime, timedelta
+import numpy as np
+from sqlalchemy import bindparam, case, delete, func, insert, select, update
+from models import db, Course, Event, Attendance, Recommendation
+from insights import DEADLINE_TYPES
+from recurrence import occurrences, parse_rule
+from sync import record_deletions
+from search import reindex_ids, unindex
+
+# Recommendation generator.
+#
+# Every course is scored from its progress, how much of its schedule has
+# elapsed, upcoming deadline-type events and recent attendance. Scoring runs on
+# numpy arrays, so the same code handles one course after a write and a full
+# batch over every course. Results are stored as Recommendation rows with
+# generated=True; the GET endpoint only ever reads them.
+
+DEADLINE_LOOKAHEAD_DAYS = 14
+ATTENDANCE_WINDOW_DAYS = 30
+FINISH_WINDOW_DAYS = 14
+MIN_SCORE = 10
+HIGH_PRIORITY = 60
+MEDIUM_PRIORITY = 30
+BATCH_SIZE = 10000
+
+REASONS = ('pace', 'deadline', 'attendance', 'finish')
+
+def _ordinal(value):
+    return value.toordinal() if value else np.nan
+
+def load_features(connection, criterion, today):
+    # Three grouped queries per batch: courses, upcoming deadlines, attendance
+    courses = connection.execute(
+        select(Course.id, Course.title, Course.progress, Course.total_sections,
+               Course.completed_sections, Course.start_date, Course.end_date)
+        .where(criterion)
+        .order_by(Course.id)
+    ).all()
+    if not courses:
+        return None
+
+    ids = np.array([row.id for row in courses], dtype=np.int64)
+    index = {course_id: i for i, course_id in enumerate(ids.tolist())}
+    features = {
+        'id': ids,
+        'title': [row.title for row in courses],
+        'progress': np.array([row.progress or 0 for row in courses], dtype=float),
+        'total': np.array([row.total_sections or 0 for row in courses], dtype=float),
+        'completed': np.array([row.completed_sections or 0 for row in courses], dtype=float),
+        'start': np.array([_ordinal(row.start_date) for row in courses], dtype=float),
+        'end': np.array([_ordinal(row.end_date) for row in courses], dtype=float),
+        'deadlines': np.zeros(len(ids)),
+        'next_deadline': np.full(len(ids), np.nan),
+        'sessions': np.zeros(len(ids)),
+        'absences': np.zeros(len(ids)),
+    }
+
+    horizon = today + timedelta(days=DEADLINE_LOOKAHEAD_DAYS)
+    deadlines = connection.execute(
+        select(Event.course_id, func.count(), func.min(Event.date))
+        .join(Course, Course.id == Event.course_id)
+        .where(criterion, Event.type.in_(DEADLINE_TYPES), Event.series_end.is_(None),
+               Event.date.between(today, horizon))
+        .group_by(Event.course_id)
+    )
+    for course_id, count, first in deadlines:
+        features['deadlines'][index[course_id]] = count
+        features['next_deadline'][index[course_id]] = first.toordinal()
+
+    # Recurring deadlines are expanded over the lookahead window
+    series = connection.execute(
+        select(Event.course_id, Event.date, Event.recurrence)
+        .join(Course, Course.id == Event.course_id)
+        .where(criterion, Event.type.in_(DEADLINE_TYPES), Event.series_end >= today)
+    )
+    for course_id, start, recurrence in series:
+        days = list(occurrences(start, parse_rule(recurrence), today, horizon))
+        if days:
+            i = index[course_id]
+            features['deadlines'][i] += len(days)
+            features['next_deadline'][i] = np.fmin(features['next_deadline'][i], days[0].toordinal())
+
+    window = today - timedelta(days=ATTENDANCE_WINDOW_DAYS)
+    attendance = connection.execute(
+        select(Attendance.course_id, func.count(),
+               func.sum(case((Attendance.status == 'absent', 1), else_=0)))
+        .join(Course, Course.id == Attendance.course_id)
+        .where(criterion, Attendance.date.between(window, today))
+        .group_by(Attendance.course_id)
+    )
+    for course_id, sessions, absences in attendance:
+        features['sessions'][index[course_id]] = sessions
+        features['absences'][index[course_id]] = absences
+
+    return features
+
+def score(features, today):
+    today = today.toordinal()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        progress = np.where(features['total'] > 0,
+                            features['completed'] / features['total'] * 100,
+                            features['progress'])
+        progress = np.clip(np.nan_to_num(progress), 0, 100)
+
+        span = features['end'] - features['start']
+        elapsed = np.clip((today - features['start']) / span, 0, 1)
+        expected = np.where(span > 0, elapsed * 100, np.nan)
+        behind = np.clip(np.nan_to_num(expected - progress), 0, 100)
+
+        days_to_deadline = features['next_deadline'] - today
+        absent_rate = np.where(features['sessions'] > 0, features['absences'] / features['sessions'], 0)
+        days_left = features['end'] - today
+
+    components = np.vstack([
+        # pace: how far behind schedule the course is
+        behind * 0.6,
+        # deadline: sooner and more deadlines weigh more
+        np.where(features['deadlines'] > 0,
+                 30 * (1 - np.nan_to_num(days_to_deadline) / DEADLINE_LOOKAHEAD_DAYS)
+                 + 5 * np.minimum(features['deadlines'] - 1, 2), 0),
+        # attendance: share of recent sessions missed
+        np.where(features['sessions'] >= 2, absent_rate * 40, 0),
+        # finish: close to the end date with work remaining
+        np.where((days_left >= 0) & (days_left <= FINISH_WINDOW_DAYS) & (progress < 100),
+                 25 * (1 - np.nan_to_num(days_left) / FINISH_WINDOW_DAYS) + (100 - progress) * 0.15, 0),
+    ])
+    components[:, progress >= 100] = 0
+
+    return {
+        'progress': progress,
+        'expected': expected,
+        'days_to_deadline': days_to_deadline,
+        'days_left': days_left,
+        'score': np.round(components.sum(axis=0), 1),
+        'reason': components.argmax(axis=0),
+    }
+
+def _priority(value):
+    if value >= HIGH_PRIORITY:
+        return 'high'
+    if value >= MEDIUM_PRIORITY:
+        return 'medium'
+    return 'low'
+
+def _plural(count, noun):
+    return f"{count} {noun}" if count == 1 else f"{count} {noun}s"
+
+def _describe(reason, features, scored, i):
+    title = features['title'][i]
+    if reason == 'pace':
+        return (f"Catch up on {title}",
+                f"You're at {scored['progress'][i]:.0f}% but should be around "
+                f"{scored['expected'][i]:.0f}% to finish on time.")
+    if reason == 'deadline':
+        days = int(scored['days_to_deadline'][i])
+        when = 'today' if days == 0 else f"in {_plural(days, 'day')}"
+        return (f"Prepare for {title} deadlines",
+                f"{_plural(int(features['deadlines'][i]), 'deadline')} coming up, the first {when}.")
+    if reason == 'attendance':
+        return (f"Attend {title} sessions",
+                f"You missed {int(features['absences'][i])} of the last "
+                f"{_plural(int(features['sessions'][i]), 'session')}.")
+    remaining = int(max(features['total'][i] - features['completed'][i], 0))
+    return (f"Finish {title}",
+            f"{_plural(int(scored['days_left'][i]), 'day')} left and "
+            f"{_plural(remaining, 'section')} to go.")
+
+def build_rows(features, scored, now):
+    rows = []
+    for i in np.flatnonzero(scored['score'] >= MIN_SCORE):
+        value = float(scored['score'][i])
+        title, description = _describe(REASONS[scored['reason'][i]], features, scored, i)
+        rows.append({
+            'course_id': int(features['id'][i]),
+            'title': title[:100],
+            'content': description,
+            'priority': _priority(value),
+            'score': value,
+            'generated': True,
+            'created_at': now,
+            'updated_at': now,
+        })
+    return rows
+
+def _refresh_batch(connection, criterion, today, now):
+    features = load_features(connection, criterion, today)
+    if features is None:
+        return 0
+    rows = build_rows(features, score(features, today), now)
+
+    # Diff against what is stored so unchanged recommendations keep their id
+    # and updated_at, and delta sync only sees real changes
+    current, stale = {}, []
+    for row in connection.execute(
+        select(Recommendation.id, Recommendation.course_id, Recommendation.title, Recommendation.content,
+               Recommendation.priority, Recommendation.score, Course.user_id)
+        .join(Course, Course.id == Recommendation.course_id)
+        .where(criterion, Recommendation.generated.is_(True))
+        .order_by(Recommendation.id)
+    ):
+        if row.course_id in current:
+            stale.append(current[row.course_id])
+        current[row.course_id] = row
+
+    inserts, updates = [], []
+    for values in rows:
+        existing = current.pop(values['course_id'], None)
+        if existing is None:
+            inserts.append(values)
+        elif (existing.title, existing.content, existing.priority, existing.score) != \
+                (values['title'], values['content'], values['priority'], values['score']):
+            updates.append({'recommendation_id': existing.id, 'title': values['title'],
+                            'content': values['content'], 'priority': values['priority'],
+                            'score': values['score'], 'updated_at': now})
+    stale.extend(current.values())
+
+    if stale:
+        connection.execute(delete(Recommendation).where(Recommendation.id.in_([row.id for row in stale])))
+        record_deletions(connection, 'recommendations', [(row.id, row.user_id) for row in stale], now)
+        unindex(connection, 'recommendations', [row.id for row in stale])
+    if updates:
+        connection.execute(
+            update(Recommendation).where(Recommendation.id == bindparam('recommendation_id')), updates
+        )
+    changed = [values['recommendation_id'] for values in updates]
+    if inserts:
+        changed += connection.scalars(insert(Recommendation).returning(Recommendation.id), inserts).all()
+    reindex_ids(connection, 'recommendations', changed)
+    return len(rows)
+
+def refresh(connection, course_ids=None, batch_size=BATCH_SIZE, today=None):
+    # With course_ids (ids or a select of ids), recompute only those courses;
+    # otherwise every course, in id-range batches
+    today = today or date.today()
+    now = datetime.utcnow()
+    if course_ids is not None:
+        return _refresh_batch(connection, Course.id.in_(course_ids), today, now)
+
+    written = 0
+    bounds = connection.execute(select(func.min(Course.id), func.max(Course.id))).one()
+    if bounds[0] is None:
+        return 0
+    for low in range(bounds[0], bounds[1] + 1, batch_size):
+        written += _refresh_batch(connection, Course.id.between(low, low + batch_size - 1), today, now)
+    return written
+
+def refresh_courses(course_ids, session=None):
+    # Incremental recompute inside the current request's transaction
+    session = session or db.session
+    session.flush()
+    refresh(session.connection(), course_ids)
+
+if __name__ == '__main__':
+    from app import create_app
+
+    app = create_app()
+
+    parser = argparse.ArgumentParser(description='Regenerate recommendations for every course')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    with app.app_context():
+        with db.engine.begin() as connection:
+            print(f"Wrote {refresh(connection, batch_size=args.batch_size)} recommendations")
@@ -0,0 +1,227 @@
+import heapq
+from datetime import date, time, timedelta
+from sqlalchemy import select
+from models import Event
+from pagination import parse_date, parse_int
+from serialization import RESOURCES, event_row
+
+# Recurring events and calendar expansion.
+#
+# A recurring event is stored once, with an iCalendar-style rule in
+# `recurrence` (FREQ=DAILY|WEEKLY|MONTHLY plus optional INTERVAL, BYDAY,
+# COUNT, UNTIL) and the date of its last occurrence in `series_end`
+# (SERIES_OPEN when it never ends). One-off events have no rule and a NULL
+# series_end. A calendar window [start, end] is then two index range scans:
+# one-offs by (course_id, date) and series by (course_id, series_end).
+# Occurrences are generated lazily and merged in date order, so a long
+# window streams instead of being built up in memory.
+
+FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY')
+WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+MAX_INTERVAL = 52
+MAX_COUNT = 1000
+SERIES_OPEN = date(9999, 12, 31)
+DEFAULT_WINDOW_DAYS = 30
+MAX_WINDOW_DAYS = 5 * 366
+CALENDAR_BATCH_SIZE = 500
+
+class Rule:
+    def __init__(self, freq, interval=1, days=None, count=None, until=None):
+        self.freq = freq
+        self.interval = interval
+        self.days = days
+        self.count = count
+        self.until = until
+
+    def __str__(self):
+        parts = [f'FREQ={self.freq}']
+        if self.interval != 1:
+            parts.append(f'INTERVAL={self.interval}')
+        if self.days:
+            parts.append('BYDAY=' + ','.join(WEEKDAYS[day] for day in self.days))
+        if self.count is not None:
+            parts.append(f'COUNT={self.count}')
+        if self.until is not None:
+            parts.append(f"UNTIL={self.until.strftime('%Y%m%d')}")
+        return ';'.join(parts)
+
+def _positive(value, name, limit):
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"recurrence {name} must be an integer")
+    if not 1 <= number <= limit:
+        raise ValueError(f"recurrence {name} must be between 1 and {limit}")
+    return number
+
+def parse_rule(text):
+    # "FREQ=WEEKLY;BYDAY=MO,WE;UNTIL=20261220", with or without an RRULE: prefix
+    text = text.strip()
+    if text.upper().startswith('RRULE:'):
+        text = text[6:]
+    try:
+        parts = dict(part.split('=', 1) for part in text.upper().split(';') if part)
+    except ValueError:
+        raise ValueError("recurrence must look like FREQ=WEEKLY;BYDAY=MO,WE")
+
+    unknown = set(parts) - {'FREQ', 'INTERVAL', 'BYDAY', 'COUNT', 'UNTIL'}
+    if unknown:
+        raise ValueError(f"recurrence does not support: {', '.join(sorted(unknown))}")
+    if parts.get('FREQ') not in FREQUENCIES:
+        raise ValueError(f"recurrence FREQ must be one of: {', '.join(FREQUENCIES)}")
+
+    rule = Rule(parts['FREQ'])
+    if 'INTERVAL' in parts:
+        rule.interval = _positive(parts['INTERVAL'], 'INTERVAL', MAX_INTERVAL)
+    if 'BYDAY' in parts:
+        if rule.freq != 'WEEKLY':
+            raise ValueError("recurrence BYDAY is only supported with FREQ=WEEKLY")
+        days = parts['BYDAY'].split(',')
+        if any(day not in WEEKDAYS for day in days):
+            raise ValueError(f"recurrence BYDAY must list days from: {','.join(WEEKDAYS)}")
+        rule.days = sorted({WEEKDAYS.index(day) for day in days})
+    if 'COUNT' in parts and 'UNTIL' in parts:
+        raise ValueError("recurrence takes COUNT or UNTIL, not both")
+    if 'COUNT' in parts:
+        rule.count = _positive(parts['COUNT'], 'COUNT', MAX_COUNT)
+    if 'UNTIL' in parts:
+        value = parts['UNTIL'][:8]
+        try:
+            rule.until = date(int(value[:4]), int(value[4:6]), int(value[6:8]))
+        except ValueError:
+            raise ValueError("recurrence UNTIL must be a date in YYYYMMDD format")
+    return rule
+
+# Expansion
+
+def _period_dates(start, rule, period):
+    # Candidate dates of the period-th repetition, in order
+    if rule.freq == 'DAILY':
+        return [start + timedelta(days=period * rule.interval)]
+    if rule.freq == 'WEEKLY':
+        monday = start - timedelta(days=start.weekday()) + timedelta(weeks=period * rule.interval)
+        return [monday + timedelta(days=day) for day in rule.days or (start.weekday(),)]
+    month = start.month - 1 + period * rule.interval
+    try:
+        return [start.replace(year=start.year + month // 12, month=month % 12 + 1)]
+    except ValueError:
+        # Months without this day (the 31st, Feb 29th) are skipped
+        return []
+
+def _first_period(start, rule, window_start):
+    # Earliest period that can reach window_start; COUNT rules always start
+    # from the beginning since every occurrence counts towards the limit
+    if window_start is None or window_start <= start or rule.count is not None:
+        return 0
+    if rule.freq == 'MONTHLY':
+        months = (window_start.year - start.year) * 12 + window_start.month - start.month
+        return months // rule.interval
+    if rule.freq == 'WEEKLY':
+        anchor = start - timedelta(days=start.weekday())
+        return (window_start - anchor).days // (7 * rule.interval)
+    return (window_start - start).days // rule.interval
+
+def occurrences(start, rule, window_start=None, window_end=None):
+    # Lazily yields the series' dates that fall inside the window. Without a
+    # window_end an open-ended rule yields forever.
+    period = _first_period(start, rule, window_start)
+    emitted = 0
+    while True:
+        for day in _period_dates(start, rule, period):
+            if day < start:
+                continue
+            if (rule.until is not None and day > rule.until) or (window_end is not None and day > window_end):
+                return
+            if rule.count is not None:
+                if emitted == rule.count:
+                    return
+                emitted += 1
+            if window_start is None or day >= window_start:
+                yield day
+        period += 1
+
+def series_end(start, recurrence):
+    # Value for Event.series_end: None for one-off events, SERIES_OPEN for
+    # series without COUNT or UNTIL, otherwise the last occurrence
+    if recurrence is None:
+        return None
+    if start is None:
+        raise ValueError("a recurring event needs a date")
+    rule = parse_rule(recurrence)
+    if rule.count is None and rule.until is None:
+        return SERIES_OPEN
+    if rule.until is not None and rule.until < start:
+        raise ValueError("recurrence UNTIL is before the event's date")
+    last = None
+    window_start = rule.until - timedelta(days=62 * rule.interval) if rule.count is None else None
+    for last in occurrences(start, rule, window_start):
+        pass
+    if last is None:
+        last = max(occurrences(start, rule), default=None)
+    if last is None:
+        raise ValueError("recurrence has no occurrences")
+    return last
+
+def normalize_rule(recurrence):
+    # Canonical rule text for storage, or None for a one-off event
+    if recurrence is None or str(recurrence).strip() == '':
+        return None
+    return str(parse_rule(str(recurrence)))
+
+# Calendar queries
+
+def parse_window(args, today=None):
+    today = today or date.today()
+    window_start = parse_date(args['from'], 'from') if args.get('from') else today
+    if args.get('to'):
+        window_end = parse_date(args['to'], 'to')
+    else:
+        days = parse_int(args['days'], 'days') if args.get('days') else DEFAULT_WINDOW_DAYS
+        if not 0 <= days <= MAX_WINDOW_DAYS:
+            raise ValueError(f"days must be between 0 and {MAX_WINDOW_DAYS}")
+        window_end = window_start + timedelta(days=days)
+    if window_end < window_start:
+        raise ValueError("to must not be before from")
+    if (window_end - window_start).days > MAX_WINDOW_DAYS:
+        raise ValueError(f"The window can span at most {MAX_WINDOW_DAYS} days")
+    return window_start, window_end
+
+def _calendar_select(course_ids, course_id, event_type):
+    columns, _ = RESOURCES['events']
+    query = select(*columns).where(Event.course_id.in_(course_ids))
+    if course_id is not None:
+        query = query.where(Event.course_id == course_id)
+    if event_type:
+        query = query.where(Event.type == event_type)
+    return query
+
+def calendar_selects(course_ids, window_start, window_end, course_id=None, event_type=None):
+    # (one-off events in the window, series still running at its start).
+    # The first is ordered the way expand() merges, so it can be streamed.
+    # The second deliberately has no condition on `date`, which would tempt
+    # the planner into scanning every past event by (course_id, date);
+    # series that start after the window simply expand to nothing.
+    single = _calendar_select(course_ids, course_id, event_type).where(
+        Event.series_end.is_(None), Event.date.between(window_start, window_end)
+    ).order_by(Event.date, Event.time.asc().nullsfirst(), Event.id)
+    series = _calendar_select(course_ids, course_id, event_type).where(Event.series_end >= window_start)
+    return single, series
+
+def _series(row, window_start, window_end):
+    rule = parse_rule(row.recurrence)
+    for day in occurrences(row.date, rule, window_start, window_end):
+        yield day, row
+
+def _sort_key(item):
+    day, row = item
+    return day, row.time or time.min, row.id
+
+def expand(single_rows, series_rows, window_start, window_end):
+    # Occurrences in date order: the one-off rows pass straight through and
+    # each series contributes its own generator
+    singles = ((row.date, row) for row in single_rows)
+    series = [_series(row, window_start, window_end) for row in series_rows]
+    for day, row in heapq.merge(singles, *series, key=_sort_key):
+        item = event_row(row)
+        item['date'] = day.isoformat()
+        yield item
@@ -0,0 +1,200 @@
+import argparse
+import re
+from sqlalchemy import BigInteger, Column, Integer, MetaData, String, Table, Text, bindparam, cast, delete, \
+    func, insert, literal, null, select, text
+from models import Course, Event, Attendance, Recommendation
+
+# Full-text search over course titles and platforms, event titles and
+# descriptions, attendance notes and recommendation text.
+#
+# Everything searchable is copied into one search_index table: an FTS5
+# virtual table on SQLite, a table with a weighted tsvector column and a GIN
+# index on Postgres. Each document also carries its owner as a token
+# ('u42'), so scoping a search to a user is part of the index lookup rather
+# than a filter over every user's matches. Documents are keyed by
+# row id * 4 + resource code, which makes replacing one a primary-key
+# delete and insert. Write paths call reindex()/unindex() in their own
+# transaction; `python search.py rebuild` recreates everything.
+
+SUPPORTED_DIALECTS = ('sqlite', 'postgresql')
+MAX_TERMS = 8
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 50
+# Ids per statement when (re)indexing by id, well under bind parameter limits
+ID_CHUNK = 1000
+
+search_index = Table(
+    'search_index', MetaData(),
+    Column('rowid', BigInteger, primary_key=True),
+    Column('owner', String(20)),
+    Column('title', Text),
+    Column('body', Text),
+    Column('resource', String(20)),
+    Column('row_id', Integer),
+    Column('course_id', Integer),
+)
+
+def _owner(user_id):
+    return literal('u') + cast(user_id, String)
+
+def _document(code, row_id, user_id, title, body, resource, course_id):
+    return (
+        row_id * 4 + code, _owner(user_id), title, body, literal(resource), row_id, course_id
+    )
+
+# resource: (select of search_index rows, model whose ids key the documents)
+SOURCES = {
+    'courses': (lambda: select(*_document(
+        0, Course.id, Course.user_id, Course.title, Course.platform, 'courses', Course.id
+    )), Course),
+    'events': (lambda: select(*_document(
+        1, Event.id, Course.user_id, Event.title, Event.description, 'events', Event.course_id
+    )).join(Course, Course.id == Event.course_id), Event),
+    'attendance': (lambda: select(*_document(
+        2, Attendance.id, Course.user_id, null(), Attendance.notes, 'attendance', Attendance.course_id
+    )).join(Course, Course.id == Attendance.course_id)
+      .where(Attendance.notes.isnot(None), Attendance.notes != ''), Attendance),
+    'recommendations': (lambda: select(*_document(
+        3, Recommendation.id, Course.user_id, Recommendation.title, Recommendation.content,
+        'recommendations', Recommendation.course_id
+    )).join(Course, Course.id == Recommendation.course_id), Recommendation),
+}
+CODES = {resource: code for code, resource in enumerate(SOURCES)}
+
+def supported(dialect_name):
+    return dialect_name in SUPPORTED_DIALECTS
+
+# Index maintenance
+
+def create_index(connection):
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+            "owner, title, body, resource UNINDEXED, row_id UNINDEXED, course_id UNINDEXED, "
+            "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        ))
+    elif connection.dialect.name == 'postgresql':
+        connection.execute(text(
+            "CREATE TABLE IF NOT EXISTS search_index ("
+            "rowid BIGINT PRIMARY KEY, owner VARCHAR(20) NOT NULL, title TEXT, body TEXT, "
+            "resource VARCHAR(20) NOT NULL, row_id INTEGER NOT NULL, course_id INTEGER, "
+            "document tsvector GENERATED ALWAYS AS ("
+            "to_tsvector('simple', owner) || "
+            "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(body, '')), 'B')) STORED)"
+        ))
+        connection.execute(text(
+            'CREATE INDEX IF NOT EXISTS ix_search_index_document ON search_index USING GIN (document)'
+        ))
+
+def _insert_documents(connection, resource, criterion=None):
+    source, _ = SOURCES[resource]
+    query = source() if criterion is None else source().where(criterion)
+    connection.execute(insert(search_index).from_select(list(search_index.c.keys()), query))
+
+def reindex(connection, resource, criterion):
+    # Replaces the documents of the `resource` rows matching `criterion`,
+    # which may only refer to that resource's own columns
+    if not supported(connection.dialect.name):
+        return
+    _, model = SOURCES[resource]
+    keys = select(model.id * 4 + CODES[resource]).where(criterion)
+    connection.execute(delete(search_index).where(search_index.c.rowid.in_(keys)))
+    _insert_documents(connection, resource, criterion)
+
+def reindex_ids(connection, resource, ids):
+    ids = list(ids)
+    _, model = SOURCES[resource]
+    for start in range(0, len(ids), ID_CHUNK):
+        reindex(connection, resource, model.id.in_(ids[start:start + ID_CHUNK]))
+
+def unindex(connection, resource, ids):
+    ids = list(ids)
+    if not supported(connection.dialect.name):
+        return
+    for start in range(0, len(ids), ID_CHUNK):
+        keys = [row_id * 4 + CODES[resource] for row_id in ids[start:start + ID_CHUNK]]
+        connection.execute(delete(search_index).where(search_index.c.rowid.in_(keys)))
+
+def rebuild(connection):
+    if not supported(connection.dialect.name):
+        return 0
+    connection.execute(delete(search_index))
+    for resource in SOURCES:
+        _insert_documents(connection, resource)
+    return connection.scalar(select(func.count()).select_from(search_index))
+
+# Queries
+
+def parse_terms(query):
+    # Words of the query; all but single characters are matched as prefixes
+    terms = re.findall(r'\w+', (query or '').lower())
+    if not terms:
+        raise ValueError("q must contain at least one word")
+    return terms[:MAX_TERMS]
+
+def parse_types(value):
+    if not value:
+        return None
+    types = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = set(types) - set(SOURCES)
+    if unknown:
+        raise ValueError(f"Unknown types: {', '.join(sorted(unknown))}")
+    return types
+
+def search_statement(dialect_name, user_id, terms, types=None, limit=DEFAULT_LIMIT):
+    # Best matches first. Titles weigh more than bodies.
+    if dialect_name == 'sqlite':
+        match = f'owner:u{int(user_id)} AND {{title body}}:(' + ' AND '.join(f'"{term}"' + ('*' if len(term) > 1 else '') for term in terms) + ')'
+        sql = ("SELECT resource, row_id, course_id, title, snippet(search_index, 2, '', '', '…', 12) AS snippet "
+               "FROM search_index WHERE search_index MATCH :match")
+        if types:
+            sql += " AND resource IN :types"
+        sql += " ORDER BY bm25(search_index, 0, 10, 1) LIMIT :limit"
+    elif dialect_name == 'postgresql':
+        match = f'u{int(user_id)} & (' + ' & '.join(term + (':*' if len(term) > 1 else '') for term in terms) + ')'
+        sql = ("SELECT resource, row_id, course_id, title, "
+               "ts_headline('simple', coalesce(body, ''), query, 'StartSel=\"\",StopSel=\"\",MaxWords=12,MinWords=4') "
+               "AS snippet FROM search_index, to_tsquery('simple', :match) AS query WHERE document @@ query")
+        if types:
+            sql += " AND resource IN :types"
+        sql += " ORDER BY ts_rank_cd(document, query) DESC, rowid LIMIT :limit"
+    else:
+        raise NotImplementedError(f"Search is not supported on {dialect_name}")
+
+    statement = text(sql).bindparams(match=match, limit=limit)
+    if types:
+        statement = statement.bindparams(bindparam('types', value=types, expanding=True))
+    return statement
+
+def assemble_results(rows):
+    return [{
+        'type': row.resource,
+        'id': row.row_id,
+        'courseId': row.course_id,
+        'title': row.title,
+        'snippet': row.snippet or None,
+    } for row in rows]
+
+def parse_search(args):
+    # (terms, types, limit) from the query string
+    terms = parse_terms(args.get('q'))
+    types = parse_types(args.get('types'))
+    try:
+        limit = int(args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    return terms, types, min(max(limit, 1), MAX_LIMIT)
+
+if __name__ == '__main__':
+    from app import create_app, db
+
+    app = create_app()
+
+    parser = argparse.ArgumentParser(description='Search index maintenance')
+    parser.add_argument('command', choices=['rebuild'])
+    parser.parse_args()
+
+    with app.app_context():
+        with db.engine.begin() as connection:
+            print(f"Indexed {rebuild(connection)} documents")
@@ -1,5 +1,8 @@
-from app import app, db
+from app import create_app, db
+from migrations import upgrade
 from models import Course, Event, Attendance, Recommendation, Insight
+from insights import rebuild
+from recommendations import refresh
 from datetime import datetime, timedelta
 import json
 
@@ -7,8 +10,10 @@ def format_date(days_from_now):
     date = datetime.now() + timedelta(days=days_from_now)
     return date.strftime('%Y-%m-%d')
 
-def seed_database():
+def seed_database(app):
     with app.app_context():
+        upgrade(db.engine)
+        
         # Clear existing data
         db.session.query(Insight).delete()
         db.session.query(Recommendation).delete()
@@ -189,42 +194,12 @@ def seed_database():
         db.session.add_all(recommendations)
         db.session.commit()
         '''
-        # Seed insights
-        insights = [
-            Insight(
-                week_starting=format_date(-7),
-                hours_studied=18,
-                courses_progressed=3,
-                attendance_rate=85,
-                upcoming_deadlines=2,
-            ),
-            Insight(
-                week_starting=format_date(-14),
-                hours_studied=15,
-                courses_progressed=2,
-                attendance_rate=75,
-                upcoming_deadlines=1,
-            ),
-            Insight(
-                week_starting=format_date(-21),
-                hours_studied=20,
-                courses_progressed=4,
-                attendance_rate=90,
-                upcoming_deadlines=3,
-            ),
-            Insight(
-                week_starting=format_date(-28),
-                hours_studied=12,
-                courses_progressed=2,
-                attendance_rate=80,
-                upcoming_deadlines=2,
-            ),
-        ]
-        
-        db.session.add_all(insights)
-        db.session.commit()
+        # Insights and recommendations are derived from activity, so recompute them
+        with db.engine.begin() as connection:
+            rebuild(connection)
+            refresh(connection)
         
         print("Database seeded successfully!")
 
 if __name__ == '__main__':
-    seed_database()
\ No newline at end of file
+    seed_database(create_app())
\ No newline at end of file
@@ -0,0 +1,181 @@
+import json
+import time
+from itertools import islice
+from flask import Response, current_app, jsonify, stream_with_context
+from sqlalchemy import select
+from models import db, Course, Event, Attendance, Recommendation
+from metrics import record_serialization
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Fast serialization path for the list endpoints.
+#
+# Rows are selected as plain column tuples (no ORM identity map) and encoded
+# straight to bytes. The output is byte-for-byte what jsonify() produces for
+# the models' to_dict() shapes: sorted keys, compact separators, ASCII-only
+# and a trailing newline.
+
+STREAM_THRESHOLD = 500
+STREAM_CHUNK_SIZE = 100
+
+def isoformat(value):
+    return value.isoformat() if value else None
+
+def time_string(value):
+    return str(value) if value else None
+
+def course_row(row):
+    return {
+        'id': row.id,
+        'title': row.title,
+        'platform': row.platform,
+        'url': row.url,
+        'progress': row.progress,
+        'totalSections': row.total_sections,
+        'completedSections': row.completed_sections,
+        'startDate': isoformat(row.start_date),
+        'endDate': isoformat(row.end_date),
+        'imageUrl': row.image_url,
+        'version': row.version
+    }
+
+def event_row(row):
+    return {
+        'id': row.id,
+        'courseId': row.course_id,
+        'title': row.title,
+        'date': isoformat(row.date),
+        'time': time_string(row.time),
+        'type': row.type,
+        'description': row.description,
+        'recurrence': row.recurrence
+    }
+
+def attendance_row(row):
+    return {
+        'id': row.id,
+        'courseId': row.course_id,
+        'date': isoformat(row.date),
+        'status': row.status,
+        'notes': row.notes,
+        'version': row.version
+    }
+
+def recommendation_row(row):
+    return {
+        'id': row.id,
+        'courseId': row.course_id,
+        'title': row.title,
+        'description': row.content,
+        'priority': row.priority
+    }
+
+# Columns each resource needs: everything to_dict() reads, plus the sort key
+# used for pagination
+RESOURCES = {
+    'courses': ((
+        Course.id, Course.title, Course.platform, Course.url, Course.progress,
+        Course.total_sections, Course.completed_sections, Course.start_date,
+        Course.end_date, Course.image_url, Course.version, Course.created_at,
+    ), course_row),
+    'events': ((
+        Event.id, Event.course_id, Event.title, Event.date, Event.time,
+        Event.type, Event.description, Event.recurrence,
+    ), event_row),
+    'attendance': ((
+        Attendance.id, Attendance.course_id, Attendance.date, Attendance.status,
+        Attendance.notes, Attendance.version,
+    ), attendance_row),
+    'recommendations': ((
+        Recommendation.id, Recommendation.course_id, Recommendation.title,
+        Recommendation.content, Recommendation.priority, Recommendation.created_at,
+    ), recommendation_row),
+}
+
+def row_query(resource):
+    columns, _ = RESOURCES[resource]
+    return db.session.query(*columns)
+
+def row_select(resource):
+    columns, _ = RESOURCES[resource]
+    return select(*columns)
+
+def serialize_rows(resource, rows):
+    started = time.perf_counter()
+    _, serializer = RESOURCES[resource]
+    items = [serializer(row) for row in rows]
+    record_serialization(started)
+    return items
+
+# JSON backends
+
+def _stdlib_dumps(obj):
+    return json.dumps(obj, ensure_ascii=True, sort_keys=True, separators=(',', ':')).encode()
+
+def _orjson_dumps(obj):
+    data = orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+    # orjson writes non-ASCII as raw UTF-8 where the stdlib escapes it, so
+    # anything outside printable ASCII goes through the stdlib instead
+    if not data.isascii() or b'\x7f' in data:
+        return _stdlib_dumps(obj)
+    return data
+
+BACKENDS = {'json': _stdlib_dumps}
+if orjson is not None:
+    BACKENDS['orjson'] = _orjson_dumps
+
+_dumps = BACKENDS.get('orjson', _stdlib_dumps)
+
+def set_backend(name):
+    global _dumps
+    if name == 'auto':
+        _dumps = BACKENDS.get('orjson', _stdlib_dumps)
+        return
+    if name not in BACKENDS:
+        raise ValueError(f"JSON backend not available: {name}")
+    _dumps = BACKENDS[name]
+
+def dumps(obj):
+    return _dumps(obj)
+
+def _compact():
+    # Mirrors the default JSON provider: indented output in debug mode
+    compact = current_app.json.compact
+    return not ((compact is None and current_app.debug) or compact is False)
+
+def json_response(obj):
+    started = time.perf_counter()
+    if not _compact():
+        response = jsonify(obj)
+    else:
+        response = Response(_dumps(obj) + b'\n', mimetype=current_app.json.mimetype)
+    record_serialization(started)
+    return response
+
+def stream_list(items, dumps=dumps):
+    # Encodes any iterable as a JSON array, STREAM_CHUNK_SIZE items at a time
+    items = iter(items)
+    yield b'['
+    separator = b''
+    while True:
+        chunk = list(islice(items, STREAM_CHUNK_SIZE))
+        if not chunk:
+            break
+        yield separator + b','.join(dumps(item) for item in chunk)
+        separator = b','
+    yield b']\n'
+
+def list_response(items):
+    # Large arrays are encoded incrementally and sent chunked
+    if len(items) < STREAM_THRESHOLD or not _compact():
+        return json_response(items)
+    return Response(stream_list(items, _dumps), mimetype=current_app.json.mimetype)
+
+def stream_response(items):
+    # For generators: nothing is materialized unless debug output is on
+    if not _compact():
+        return jsonify(list(items))
+    return Response(stream_with_context(stream_list(items, _dumps)), mimetype=current_app.json.mimetype)
@@ -0,0 +1,159 @@
+import json
+import os
+import sys
+import threading
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import load_config
+
+# Shared fixtures. `api` is parametrized over the servers in APPS, so every
+# test using it runs against each of them with the same requests and the
+# same assertions. Each test gets its own SQLite file, upgraded to the
+# latest schema by the testing profile.
+
+APPS = ('flask', 'asgi')
+
+COURSE = {
+    'title': 'Linear Algebra', 'platform': 'Coursera', 'url': 'https://example.com/la',
+    'progress': 0, 'totalSections': 10, 'completedSections': 0,
+    'startDate': '2026-01-05', 'endDate': '2026-06-30', 'imageUrl': 'https://example.com/la.jpg',
+}
+
+class Result:
+    # A response from either server: status_code, headers, body and json
+    def __init__(self, status_code, headers, body):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+
+    @property
+    def json(self):
+        return json.loads(self.body) if self.body else None
+
+class FlaskClient:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, json=None, headers=None, params=None):
+        response = self.client.open(path, method=method, json=json, headers=headers, query_string=params)
+        return Result(response.status_code, response.headers, response.get_data())
+
+class AsgiClient:
+    # All clients share one TestClient, so the app's lifespan runs once; each
+    # keeps its own cookies and swaps them in around its requests
+    def __init__(self, test_client):
+        self.test_client = test_client
+        self.cookies = httpx.Cookies()
+
+    def request(self, method, path, json=None, headers=None, params=None):
+        self.test_client.cookies = self.cookies
+        try:
+            response = self.test_client.request(method, path, json=json, headers=headers, params=params)
+        finally:
+            self.cookies = self.test_client.cookies
+        return Result(response.status_code, response.headers, response.content)
+
+class Api:
+    # One server under test. `client()` returns a new cookie jar, so several
+    # users can be signed in at once; `engine` is a synchronous engine on the
+    # same database for arranging and checking rows. Background jobs run on
+    # `flask_app`, as `python jobs.py` would.
+    def __init__(self, kind, app, make_client, engine, flask_app):
+        self.kind = kind
+        self.app = app
+        self._make_client = make_client
+        self.engine = engine
+        self.flask_app = flask_app
+        self._counter = 0
+
+    def run_jobs(self):
+        from jobs import work
+
+        work(self.flask_app, 'test-worker', threading.Event(), burst=True)
+
+    def client(self):
+        return ApiClient(self._make_client())
+
+    def user(self, name=None):
+        # A registered, signed-in client
+        self._counter += 1
+        name = name or f'user{self._counter}'
+        client = self.client()
+        response = client.post('/api/auth/register', json={'username': name, 'email': f'{name}@example.com',
+                                                            'password': 'secret-password'})
+        assert response.status_code == 201, response.body
+        client.user_id = response.json['id']
+        return client
+
+class ApiClient:
+    def __init__(self, client):
+        self.client = client
+        self.user_id = None
+
+    def request(self, method, path, **kwargs):
+        return self.client.request(method, path, **kwargs)
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request('PUT', path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request('DELETE', path, **kwargs)
+
+    def add_course(self, **fields):
+        response = self.post('/api/courses', json={**COURSE, **fields})
+        assert response.status_code == 201, response.body
+        return response.json
+
+    def add_event(self, course_id, **fields):
+        event = {'courseId': course_id, 'title': 'Lecture', 'date': '2026-03-02', 'time': '10:00',
+                 'type': 'class', 'description': '', **fields}
+        response = self.post('/api/events', json=event)
+        assert response.status_code == 201, response.body
+        return response.json
+
+@pytest.fixture
+def settings(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setenv('ARCHIVE_DIR', str(tmp_path / 'archive'))
+    monkeypatch.setenv('IMAGE_CACHE_DIR', str(tmp_path / 'image-cache'))
+    # Lists default to the latest terms; keep the fixed dates below in them
+    monkeypatch.setenv('ARCHIVE_HOT_TERMS', '100')
+    return load_config('testing')
+
+def _flask_api(settings):
+    from app import create_app
+    from engines import dispose_engines
+    from models import db
+
+    app = create_app(settings)
+    with app.app_context():
+        engine = db.engine
+    yield Api('flask', app, lambda: FlaskClient(app), engine, app)
+    with app.app_context():
+        dispose_engines(db)
+
+def _asgi_api(settings):
+    from starlette.testclient import TestClient
+    import asgi
+
+    # The Flask app only runs background jobs and lends its engine
+    for flask_api in _flask_api(settings):
+        with TestClient(asgi.create_app(settings), follow_redirects=False) as test_client:
+            yield Api('asgi', test_client.app, lambda: AsgiClient(test_client), flask_api.engine, flask_api.app)
+
+@pytest.fixture(params=APPS)
+def api(request, settings):
+    yield from {'flask': _flask_api, 'asgi': _asgi_api}[request.param](settings)
+
+@pytest.fixture
+def client(api):
+    return api.user()
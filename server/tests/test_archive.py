@@ -0,0 +1,90 @@
+from datetime import date, timedelta
+import pytest
+from sqlalchemy import select
+from archive import archive, archive_cutoff
+from insights import rebuild, verify, week_of
+from models import WeeklyInsight
+
+@pytest.fixture
+def settings(settings):
+    return {**settings, 'ARCHIVE_HOT_TERMS': 2}
+
+def _dates():
+    cutoff = archive_cutoff(date.today(), 2)
+    return (cutoff - timedelta(days=1)).isoformat(), date.today().isoformat()
+
+def _mark(client, course_id, day, status='present'):
+    response = client.post('/api/attendance', json={'courseId': course_id, 'date': day, 'status': status})
+    assert response.status_code == 201, response.body
+    return response.json
+
+def test_lists_default_to_the_hot_terms(client):
+    old, recent = _dates()
+    course = client.add_course()
+    _mark(client, course['id'], old)
+    _mark(client, course['id'], recent)
+    client.add_event(course['id'], date=old)
+    client.add_event(course['id'], date=recent)
+
+    assert [row['date'] for row in client.get('/api/attendance').json] == [recent]
+    assert [row['date'] for row in client.get('/api/events').json] == [recent]
+    snapshot = client.get('/api/dashboard', params={'sections': 'events,attendance'}).json
+    assert [row['date'] for row in snapshot['attendance']] == [recent]
+    assert [row['date'] for row in snapshot['events']] == [recent]
+
+    # An explicit range reaches back into older terms
+    assert [row['date'] for row in client.get('/api/attendance', params={'from': old}).json] == [old, recent]
+    assert [row['date'] for row in client.get('/api/events', params={'to': old}).json] == [old]
+
+def test_running_series_stay_in_the_lists(client):
+    cutoff = archive_cutoff(date.today(), 2)
+    start = cutoff - timedelta(weeks=17)
+    course = client.add_course()
+    running = client.add_event(course['id'], title='Running', date=start.isoformat(),
+                               recurrence=f"FREQ=WEEKLY;UNTIL={date.today() + timedelta(days=60):%Y%m%d}")
+    client.add_event(course['id'], title='Ended', date=start.isoformat(),
+                     recurrence=f"FREQ=WEEKLY;UNTIL={cutoff - timedelta(days=10):%Y%m%d}")
+
+    assert [event['id'] for event in client.get('/api/events').json] == [running['id']]
+    snapshot = client.get('/api/dashboard', params={'sections': 'events'}).json
+    assert [event['id'] for event in snapshot['events']] == [running['id']]
+
+def test_archived_rows_move_to_files(api, client, settings):
+    old, recent = _dates()
+    course = client.add_course()
+    archived = _mark(client, course['id'], old, 'absent')
+    _mark(client, course['id'], recent)
+    token = client.get('/api/sync').json['token']
+
+    with api.engine.begin() as connection:
+        result = archive(connection, settings['ARCHIVE_DIR'], archive_cutoff(date.today(), 2))
+    assert result['attendance'] == [(archived['id'], client.user_id)]
+
+    assert [row['date'] for row in client.get('/api/attendance', params={'from': old}).json] == [recent]
+    items = client.get('/api/attendance/archive').json
+    assert [(item['id'], item['status']) for item in items] == [(archived['id'], 'absent')]
+    assert client.get('/api/attendance/archive', params={'from': recent}).json == []
+    assert client.get('/api/sync', params={'since': token}).json['attendance']['deleted'] == [archived['id']]
+    # Other users read nothing from the files
+    assert api.user().get('/api/attendance/archive').json == []
+
+def test_archived_weeks_keep_their_rollups(api, client, settings):
+    old, recent = _dates()
+    course = client.add_course()
+    _mark(client, course['id'], old, 'absent')
+    _mark(client, course['id'], recent)
+    week = week_of(date.fromisoformat(old))
+    stored = select(WeeklyInsight.attendance_total).where(WeeklyInsight.user_id == client.user_id,
+                                                         WeeklyInsight.week_starting == week)
+
+    with api.engine.begin() as connection:
+        archive(connection, settings['ARCHIVE_DIR'], archive_cutoff(date.today(), 2))
+        assert verify(connection) == []
+        rebuild(connection)
+        assert verify(connection) == []
+        assert connection.scalar(stored) == 1
+
+def test_archive_endpoint(client):
+    assert client.get('/api/events/archive').json == []
+    assert client.get('/api/attendance/archive', params={'from': '2026-02-01', 'to': '2026-01-01'}).status_code == 400
+    assert client.get('/api/courses/archive').status_code == 404
@@ -0,0 +1,75 @@
+import json
+import bulk
+from conftest import COURSE
+from insights import verify
+
+def test_import_then_export(client):
+    response = client.post('/api/courses/import', json=[COURSE, {**COURSE, 'title': 'Calculus'}])
+    assert response.status_code == 201, response.body
+    assert response.json == {'imported': 2, 'errors': []}
+
+    response = client.get('/api/courses/export')
+    assert response.status_code == 200
+    assert response.headers['Content-Type'].startswith('application/x-ndjson')
+    assert [json.loads(line)['title'] for line in response.body.splitlines()] == ['Linear Algebra', 'Calculus']
+
+    response = client.get('/api/courses/export', params={'format': 'csv'})
+    lines = response.body.decode().splitlines()
+    assert lines[0].startswith('id,') and len(lines) == 3
+
+def test_rejected_import_writes_nothing(client):
+    response = client.post('/api/courses/import', json=[COURSE, {**COURSE, 'title': ''}])
+    assert response.status_code == 422
+    assert response.json['errors'] == [{'row': 1, 'errors': ['title is required']}]
+    assert client.get('/api/courses').json == []
+
+def test_export_format_and_resource(client):
+    assert client.get('/api/courses/export', params={'format': 'xml'}).status_code == 400
+    assert client.get('/api/users/export').status_code == 404
+
+def test_marks_are_upserted(client):
+    course = client.add_course()
+    marks = [{'courseId': course['id'], 'date': '2026-03-02', 'status': 'present'}]
+    response = client.post('/api/attendance/mark', json={'marks': marks})
+    assert response.status_code == 200, response.body
+    assert len(response.json['created']) == 1
+
+    assert client.post('/api/attendance/mark', json=marks).json == {'created': [], 'updated': [], 'unchanged': 1}
+    response = client.post('/api/attendance/mark', json=[{**marks[0], 'status': 'absent'}])
+    assert response.json['updated'][0]['previousStatus'] == 'present'
+
+def test_marks_raced_by_an_insert_are_updates(api, client, monkeypatch):
+    course = client.add_course()
+    mark = {'courseId': course['id'], 'date': '2026-03-02', 'status': 'present'}
+    first = client.post('/api/attendance/mark', json=[mark]).json['created'][0]
+
+    # Another request's insert lands between the read and this one's insert
+    read, calls = bulk._locked_marks, []
+    def late(session, keys):
+        calls.append(keys)
+        return {} if len(calls) == 1 else read(session, keys)
+    monkeypatch.setattr(bulk, '_locked_marks', late)
+
+    response = client.post('/api/attendance/mark', json=[{**mark, 'status': 'absent'}])
+    assert response.json['created'] == []
+    assert [(item['id'], item['previousStatus']) for item in response.json['updated']] == [(first['id'], 'present')]
+    with api.engine.connect() as connection:
+        assert verify(connection) == []
+
+def test_marks_for_other_users_courses_are_rejected(api, client):
+    course = api.user().add_course()
+    response = client.post('/api/attendance/mark', json=[{'courseId': course['id'], 'date': '2026-03-02',
+                                                          'status': 'present'}])
+    assert response.status_code == 422
+
+def test_jobs_are_queued_and_polled(api, client):
+    for path in ('/api/recommendations/refresh', '/api/insights/rebuild'):
+        response = client.post(path)
+        assert response.status_code == 202, response.body
+        assert response.headers['Location'] == f"/api/jobs/{response.json['id']}"
+    api.run_jobs()
+
+    jobs = client.get('/api/jobs').json
+    assert [job['status'] for job in jobs] == ['succeeded', 'succeeded']
+    assert client.get(f"/api/jobs/{jobs[0]['id']}").status_code == 200
+    assert api.user().get(f"/api/jobs/{jobs[0]['id']}").status_code == 403
@@ -0,0 +1,66 @@
+import pytest
+from sqlalchemy import text
+from werkzeug.datastructures import MultiDict
+from cache import ResponseCache
+
+@pytest.fixture(params=['memory', 'fakeredis'])
+def settings(request, settings):
+    return {**settings, 'CACHE_ENABLED': True, 'CACHE_BACKEND': request.param}
+
+def _titles(client):
+    return [course['title'] for course in client.get('/api/courses').json]
+
+def test_writes_invalidate_the_users_entries(api, client):
+    course = client.add_course(title='First')
+    assert _titles(client) == ['First']
+    client.add_course(title='Second')
+    assert _titles(client) == ['First', 'Second']
+
+    def completed():
+        snapshot = client.get('/api/dashboard', params={'sections': 'courses'}).json
+        return {item['id']: item['completedSections'] for item in snapshot['courses']}[course['id']]
+
+    assert completed() == 0
+    client.put(f"/api/courses/{course['id']}", json={'completedSections': 5})
+    assert completed() == 5
+
+    event = client.add_event(course['id'])
+    assert [item['id'] for item in client.get('/api/events').json] == [event['id']]
+    client.delete(f"/api/events/{event['id']}")
+    assert client.get('/api/events').json == []
+
+def test_entries_are_served_until_a_write(api, client):
+    course = client.add_course(title='First')
+    assert _titles(client) == ['First']
+    # Changed behind the app's back, so nothing invalidates
+    with api.engine.begin() as connection:
+        connection.execute(text("UPDATE courses SET title = 'Renamed'"))
+    assert _titles(client) == ['First']
+    client.put(f"/api/courses/{course['id']}", json={'completedSections': 1})
+    assert _titles(client) == ['Renamed']
+
+def test_entries_are_per_user_and_query(api):
+    alice, bob = api.user('alice'), api.user('bob')
+    alice.add_course(title='Alice')
+    assert _titles(bob) == []
+    bob.add_course(title='Bob')
+    assert _titles(alice) == ['Alice']
+    assert [item['title'] for item in alice.get('/api/courses', params={'limit': 1}).json] == ['Alice']
+
+def test_cached_responses_are_conditional(client):
+    client.add_course()
+    first = client.get('/api/courses')
+    etag = first.headers['ETag']
+    assert client.get('/api/courses', headers={'If-None-Match': etag}).status_code == 304
+    modified = first.headers['Last-Modified']
+    assert client.get('/api/courses', headers={'If-Modified-Since': modified}).status_code == 304
+    client.add_course(title='Second')
+    assert client.get('/api/courses', headers={'If-None-Match': etag}).status_code == 200
+
+def test_invalidation_bumps_one_generation(settings):
+    cache = ResponseCache()
+    cache.configure(settings)
+    before = cache.key(1, 'courses', MultiDict()), cache.key(2, 'courses', MultiDict())
+    cache.invalidate_user(1)
+    assert cache.key(1, 'courses', MultiDict()) != before[0]
+    assert cache.key(2, 'courses', MultiDict()) == before[1]
@@ -0,0 +1,35 @@
+import pytest
+from config import check_shared_backends, load_config
+
+def test_production_shares_the_cache_and_broker(monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', 'postgresql://db/learntrack')
+    monkeypatch.setenv('REDIS_URL', 'redis://cache:6379/0')
+    monkeypatch.setenv('SECRET_KEY', 'not-so-secret')
+    settings = load_config('production')
+    assert (settings['CACHE_BACKEND'], settings['LIVE_BROKER']) == ('redis', 'redis')
+    check_shared_backends(settings, 9)
+
+def test_production_needs_redis_url(monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', 'postgresql://db/learntrack')
+    monkeypatch.delenv('REDIS_URL', raising=False)
+    with pytest.raises(ValueError, match='REDIS_URL'):
+        load_config('production')
+
+def test_production_needs_secret_key(monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', 'postgresql://db/learntrack')
+    monkeypatch.setenv('REDIS_URL', 'redis://cache:6379/0')
+    monkeypatch.delenv('SECRET_KEY', raising=False)
+    with pytest.raises(ValueError, match='SECRET_KEY'):
+        load_config('production')
+    # Other profiles fall back to a random key
+    assert load_config('development')['SECRET_KEY']
+
+def test_process_local_backends_need_one_worker(monkeypatch):
+    monkeypatch.delenv('CACHE_BACKEND', raising=False)
+    monkeypatch.delenv('LIVE_BROKER', raising=False)
+    settings = load_config('development')
+    check_shared_backends(settings, 1)
+    with pytest.raises(ValueError, match='CACHE_BACKEND=memory'):
+        check_shared_backends(settings, 4)
+    with pytest.raises(ValueError, match='LIVE_BROKER=local'):
+        check_shared_backends({**settings, 'CACHE_ENABLED': False}, 4)
@@ -0,0 +1,16 @@
+from datetime import date
+from sqlalchemy import text
+from datagen import Scale, generate
+
+def test_generated_rows_leave_room_for_new_ones(api):
+    scale = Scale(users=3, courses_per_user=2, events_per_course=2, attendance_per_course=2, progress_per_course=1)
+    counts = generate(api.engine, scale, today=date(2026, 3, 1), log=None)
+    assert counts['courses'] == 6
+
+    client = api.user()
+    course = client.add_course()
+    event = client.add_event(course['id'])
+    with api.engine.connect() as connection:
+        assert course['id'] > connection.scalar(text("SELECT MAX(id) FROM courses WHERE title <> 'Linear Algebra'"))
+        assert connection.scalar(text('SELECT COUNT(*) FROM events')) == 13
+    assert event['courseId'] == course['id']
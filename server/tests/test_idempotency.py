@@ -0,0 +1,105 @@
+from sqlalchemy import text
+from conftest import COURSE, FlaskClient, ApiClient
+
+def _post_course(client, key, **fields):
+    return client.post('/api/courses', json={**COURSE, **fields}, headers={'Idempotency-Key': key})
+
+def _count(api, table):
+    with api.engine.connect() as connection:
+        return connection.scalar(text(f'SELECT COUNT(*) FROM {table}'))
+
+def test_retry_replays_the_first_response(client, api):
+    first = _post_course(client, 'key-1')
+    retry = _post_course(client, 'key-1')
+    assert first.status_code == retry.status_code == 201
+    assert retry.json == first.json
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert retry.headers['ETag'] == first.headers['ETag']
+    assert _count(api, 'courses') == 1
+
+def test_key_reused_for_another_request(client):
+    assert _post_course(client, 'key-1').status_code == 201
+    assert _post_course(client, 'key-1', title='Other').status_code == 422
+
+def test_keys_are_per_user(api):
+    alice, bob = api.user('alice'), api.user('bob')
+    assert _post_course(alice, 'shared').status_code == 201
+    response = _post_course(bob, 'shared')
+    assert response.status_code == 201
+    assert 'Idempotent-Replayed' not in response.headers
+
+def test_uncommitted_failure_can_be_retried(client):
+    # The course does not exist yet, so the first attempt fails without writing
+    record = {'courseId': 1, 'date': '2026-03-02', 'status': 'present'}
+    headers = {'Idempotency-Key': 'mark'}
+    assert client.post('/api/attendance', json=record, headers=headers).status_code == 404
+
+    assert client.add_course()['id'] == 1
+    response = client.post('/api/attendance', json=record, headers=headers)
+    assert response.status_code == 201
+    assert 'Idempotent-Replayed' not in response.headers
+
+def test_committed_failure_is_replayed(settings):
+    from flask import g, jsonify
+    from app import create_app
+    from auth import login_required
+    from idempotency import idempotency
+    from models import db, Course
+
+    app = create_app(settings)
+
+    @login_required
+    @idempotency.idempotent
+    def commit_then_fail():
+        db.session.add(Course(user_id=g.user_id, title='Saved'))
+        db.session.commit()
+        return jsonify({"error": "Failed after saving"}), 502
+
+    app.add_url_rule('/api/commit-then-fail', view_func=commit_then_fail, methods=['POST'])
+    client = ApiClient(FlaskClient(app))
+    client.post('/api/auth/register', json={'username': 'u', 'email': 'u@example.com', 'password': 'secret-password'})
+
+    headers = {'Idempotency-Key': 'once'}
+    assert client.post('/api/commit-then-fail', headers=headers).status_code == 502
+    retry = client.post('/api/commit-then-fail', headers=headers)
+    assert retry.status_code == 502
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    with app.app_context():
+        assert Course.query.count() == 1
+
+def test_invalid_key(client):
+    assert _post_course(client, ' ').status_code == 400
+
+def test_if_match(client):
+    course = client.add_course()
+    etag = client.get('/api/courses').json[0]['version']
+    response = client.put(f"/api/courses/{course['id']}", json={'completedSections': 3},
+                          headers={'If-Match': f'"{etag}"'})
+    assert response.status_code == 200
+    assert response.headers['ETag'] == f'"{etag + 1}"'
+
+    stale = client.put(f"/api/courses/{course['id']}", json={'completedSections': 4},
+                       headers={'If-Match': f'"{etag}"'})
+    assert stale.status_code == 412
+    assert stale.headers['ETag'] == f'"{etag + 1}"'
+
+def test_increments_add_up(client):
+    course = client.add_course()
+    for _ in range(3):
+        assert client.put(f"/api/courses/{course['id']}", json={'completeSections': 2}).status_code == 200
+    assert client.get('/api/courses').json[0]['completedSections'] == 6
+
+def test_attendance_if_match(client):
+    course = client.add_course()
+    record = client.post('/api/attendance', json={'courseId': course['id'], 'date': '2026-03-02',
+                                                  'status': 'present'}).json
+    path = f"/api/attendance/{record['id']}"
+    response = client.put(path, json={'status': 'absent'}, headers={'If-Match': f'"{record["version"]}"'})
+    assert response.status_code == 200
+    assert response.json['version'] == record['version'] + 1
+
+    stale = client.put(path, json={'status': 'excused'}, headers={'If-Match': f'"{record["version"]}"'})
+    assert stale.status_code == 412
+    assert client.get('/api/attendance').json[0]['status'] == 'absent'
+    # Without If-Match the write goes through
+    assert client.put(path, json={'status': 'excused'}).json['version'] == record['version'] + 2
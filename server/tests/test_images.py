@@ -0,0 +1,66 @@
+import pytest
+import images
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\0' * 64
+
+@pytest.fixture
+def settings(settings, tmp_path):
+    (tmp_path / 'la.png').write_bytes(PNG)
+    return {**settings, 'IMAGE_FETCHER': 'directory', 'IMAGE_FETCH_ROOT': str(tmp_path)}
+
+def test_image_redirects_to_a_cacheable_variant(api, client):
+    course = client.add_course(imageUrl='https://example.com/la.png')
+    response = client.get(f"/api/images/{course['id']}", params={'w': '320'})
+    assert response.status_code == 302
+    assert 'private' in response.headers['Cache-Control']
+    location = response.headers['Location']
+
+    # Variants are public: no session needed
+    response = api.client().get(location)
+    assert response.status_code == 200
+    assert response.body == PNG
+    assert 'immutable' in response.headers['Cache-Control']
+    response = api.client().get(location, headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
+
+def test_image_errors(api, client):
+    course = client.add_course(imageUrl='https://example.com/missing.png')
+    assert client.get(f"/api/images/{course['id']}").status_code == 502
+    assert client.get(f"/api/images/{course['id']}", params={'w': 'wide'}).status_code == 400
+    assert api.user().get(f"/api/images/{course['id']}").status_code == 403
+    assert client.get(f"/api/images/{'0' * 64}/source.png").status_code == 404
+
+def _resolving_to(monkeypatch, *answers):
+    # Each lookup returns the next address, as a rebinding DNS server would
+    answers = iter(answers)
+    monkeypatch.setattr(images.socket, 'getaddrinfo', lambda host, port, **kwargs: [
+        (images.socket.AF_INET, images.socket.SOCK_STREAM, 6, '', (next(answers), port))])
+    connected = []
+
+    def create_connection(address, *args):
+        connected.append(address)
+        raise ConnectionRefusedError('test')
+
+    monkeypatch.setattr(images.socket, 'create_connection', create_connection)
+    return connected
+
+def test_fetches_connect_to_the_checked_address(monkeypatch):
+    connected = _resolving_to(monkeypatch, '93.184.216.34', '127.0.0.1')
+    with pytest.raises(images.FetchError, match='Fetching the image failed'):
+        images.HttpFetcher()('https://rebind.example.com/la.png')
+    assert connected == [('93.184.216.34', 443)]
+
+def test_private_addresses_are_refused(monkeypatch):
+    connected = _resolving_to(monkeypatch, '10.0.0.5')
+    with pytest.raises(images.FetchError, match='not a public address'):
+        images.HttpFetcher()('http://internal.example.com/la.png')
+    assert connected == []
+    with pytest.raises(images.FetchError, match='http or https'):
+        images.HttpFetcher()('file:///etc/passwd')
+
+def test_host_header_keeps_the_url_host(monkeypatch):
+    _resolving_to(monkeypatch, '93.184.216.34')
+    connection = images._PublicHTTPSConnection('cdn.example.com', 443)
+    with pytest.raises(ConnectionRefusedError):
+        connection.connect()
+    assert connection.host == 'cdn.example.com'
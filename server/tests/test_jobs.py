@@ -0,0 +1,56 @@
+import pytest
+from sqlalchemy import text
+from conftest import COURSE
+
+@pytest.fixture(params=['in-process', 'shared'])
+def settings(request, settings):
+    backends = {'CACHE_BACKEND': 'memory', 'LIVE_BROKER': 'local'} if request.param == 'in-process' else \
+        {'CACHE_BACKEND': 'fakeredis', 'LIVE_BROKER': 'fakeredis'}
+    return {**settings, 'CACHE_ENABLED': True, **backends}
+
+def _import_course(client, title):
+    response = client.post('/api/courses/import', params={'async': '1'}, json=[{**COURSE, 'title': title}])
+    assert response.status_code == 202, response.body
+    return response.headers['Location']
+
+def _titles(client):
+    return [course['title'] for course in client.get('/api/courses').json]
+
+def test_finished_job_reaches_the_web_cache(api, settings):
+    client = api.user()
+    client.add_course(title='First')
+    assert _titles(client) == ['First']
+
+    location = _import_course(client, 'Imported')
+    api.run_jobs()
+    if settings['CACHE_BACKEND'] == 'fakeredis':
+        # The worker invalidated the shared cache itself
+        assert sorted(_titles(client)) == ['First', 'Imported']
+    else:
+        # An in-process cache is left to the web process, until the job is read
+        assert _titles(client) == ['First']
+
+    job = client.get(location).json
+    assert job['status'] == 'succeeded'
+    assert sorted(_titles(client)) == ['First', 'Imported']
+
+def test_side_effects_are_delivered_once(api):
+    client = api.user()
+    location = _import_course(client, 'Imported')
+    api.run_jobs()
+    client.get(location)
+    client.get('/api/jobs')
+    with api.engine.connect() as connection:
+        assert connection.scalar(text('SELECT COUNT(*) FROM jobs WHERE delivered_at IS NULL')) == 0
+
+def test_failed_job_is_reported(api):
+    client = api.user()
+    response = client.post('/api/courses/import', params={'async': '1'}, json=[{'platform': 'x'}])
+    api.run_jobs()
+    job = client.get(response.headers['Location']).json
+    assert job['status'] == 'failed'
+    assert job['result']['errors']
+
+def test_jobs_are_private(api):
+    location = _import_course(api.user('alice'), 'Mine')
+    assert api.user('bob').get(location).status_code == 403
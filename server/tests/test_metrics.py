@@ -0,0 +1,22 @@
+import re
+
+def _queries(response):
+    return int(re.search(r'desc="(\d+) queries"', response.headers['Server-Timing']).group(1))
+
+def test_responses_carry_server_timing(client):
+    client.add_course()
+    response = client.get('/api/courses')
+    assert response.status_code == 200
+    assert _queries(response) >= 1
+    assert 'app;dur=' in response.headers['Server-Timing']
+
+def test_requests_are_exported(api, client):
+    client.get('/api/courses')
+    client.get('/api/courses')
+    response = api.client().get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+    text = response.body.decode()
+    count = re.search(r'learntrack_request_duration_seconds_count\{route="/api/courses",method="GET"\} (\d+)', text)
+    assert int(count.group(1)) >= 2
+    assert 'learntrack_request_queries_bucket{route="/api/courses",method="GET",le="+Inf"}' in text
@@ -0,0 +1,108 @@
+from sqlalchemy import create_engine
+from migrations import MIGRATIONS, queued_rebuilds, upgrade
+
+def _engine(tmp_path):
+    return create_engine(f"sqlite:///{tmp_path / 'migrate.db'}")
+
+def test_rebuilds_wait_for_the_last_migration(tmp_path):
+    engine = _engine(tmp_path)
+    assert upgrade(engine, target=5) == [1, 2, 3, 4, 5]
+    with engine.connect() as connection:
+        assert queued_rebuilds(connection) == ['insights', 'recommendations']
+
+    applied = upgrade(engine)
+    assert applied == [version for version, _, _ in MIGRATIONS][5:]
+    with engine.connect() as connection:
+        assert queued_rebuilds(connection) == []
+
+def test_upgrade_is_idempotent(tmp_path):
+    engine = _engine(tmp_path)
+    upgrade(engine)
+    assert upgrade(engine) == []
+
+def test_status_lists_queued_rebuilds(tmp_path, monkeypatch):
+    from app import create_app
+    from config import load_config
+
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'migrate.db'}")
+    settings = {**load_config('testing'), 'SCHEMA_AUTO_UPGRADE': False}
+    app = create_app(settings)
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['schema', 'upgrade', '--target', '4'])
+    assert 'Rebuilds queued until the last migration: insights' in result.output
+
+    result = runner.invoke(args=['schema', 'status'])
+    assert result.exit_code == 1
+    assert 'Queued rebuild: insights' in result.output
+
+    runner.invoke(args=['schema', 'upgrade'])
+    result = runner.invoke(args=['schema', 'status'])
+    assert result.exit_code == 0, result.output
+
+# The schema `db.create_all()` produced before migrations existed, frozen
+# here so later model changes cannot hide a migration that depends on them
+BASELINE = '''
+CREATE TABLE insights (id INTEGER NOT NULL, content TEXT, created_at DATETIME, PRIMARY KEY (id));
+CREATE TABLE users (
+    id INTEGER NOT NULL, username VARCHAR(50) NOT NULL, email VARCHAR(120) NOT NULL,
+    password_hash VARCHAR(255) NOT NULL, created_at DATETIME,
+    PRIMARY KEY (id), UNIQUE (username), UNIQUE (email));
+CREATE TABLE courses (
+    id INTEGER NOT NULL, user_id INTEGER NOT NULL, title VARCHAR(100) NOT NULL, platform VARCHAR(50),
+    url VARCHAR(255), progress INTEGER, total_sections INTEGER, completed_sections INTEGER,
+    start_date DATE, end_date DATE, image_url VARCHAR(255), created_at DATETIME,
+    PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES users (id));
+CREATE TABLE attendance (
+    id INTEGER NOT NULL, course_id INTEGER NOT NULL, date DATE, status VARCHAR(50), notes TEXT,
+    created_at DATETIME, PRIMARY KEY (id), FOREIGN KEY(course_id) REFERENCES courses (id));
+CREATE TABLE events (
+    id INTEGER NOT NULL, course_id INTEGER NOT NULL, title VARCHAR(100) NOT NULL, date DATE, time TIME,
+    type VARCHAR(50), description TEXT, created_at DATETIME,
+    PRIMARY KEY (id), FOREIGN KEY(course_id) REFERENCES courses (id));
+CREATE TABLE recommendations (
+    id INTEGER NOT NULL, course_id INTEGER NOT NULL, content TEXT, created_at DATETIME,
+    PRIMARY KEY (id), FOREIGN KEY(course_id) REFERENCES courses (id));
+INSERT INTO users VALUES (1, 'ada', 'ada@example.com', 'x', '2025-09-01 08:00:00');
+INSERT INTO courses VALUES (1, 1, 'Compilers', 'edX', NULL, 20, 10, 2, '2025-09-01', '2025-12-01', NULL,
+                            '2025-09-01 08:00:00');
+INSERT INTO events VALUES (1, 1, 'Parser deadline', '2025-10-01', '23:59:00.000000', 'deadline', 'LR tables',
+                           '2025-09-02 08:00:00');
+INSERT INTO events VALUES (2, 1, 'Office hours', NULL, NULL, 'class', NULL, '2025-09-03 08:00:00');
+INSERT INTO attendance VALUES (1, 1, '2025-09-08', 'present', 'first', '2025-09-08 10:00:00');
+INSERT INTO attendance VALUES (2, 1, '2025-09-08', 'absent', 'entered twice', '2025-09-08 11:00:00');
+INSERT INTO attendance VALUES (3, 1, '2025-09-15', 'present', NULL, '2025-09-15 10:00:00');
+INSERT INTO recommendations VALUES (1, 1, 'Review chapter 2', '2025-09-03 08:00:00');
+'''
+
+def test_upgrade_from_the_baseline_schema(tmp_path):
+    from sqlalchemy import text
+    from sqlalchemy.orm import Session
+    from search import search_statement
+    from sync import changes
+
+    engine = _engine(tmp_path)
+    with engine.begin() as connection:
+        for statement in BASELINE.split(';'):
+            if statement.strip():
+                connection.execute(text(statement))
+
+    assert upgrade(engine) == [version for version, _, _ in MIGRATIONS]
+    with engine.connect() as connection:
+        assert queued_rebuilds(connection) == []
+        # The later of two records for a day is kept
+        assert connection.execute(text('SELECT id, status FROM attendance ORDER BY id')).all() == \
+            [(2, 'absent'), (3, 'present')]
+        assert connection.execute(text('SELECT id, status, notes FROM attendance_duplicates')).all() == \
+            [(1, 'present', 'first')]
+        assert connection.scalar(text('SELECT COUNT(*) FROM weekly_insights')) > 0
+        assert connection.scalar(text('SELECT COUNT(*) FROM recommendations WHERE generated')) > 0
+        assert connection.scalar(text('SELECT COUNT(*) FROM recommendations WHERE updated_at IS NULL')) == 0
+        assert connection.execute(search_statement('sqlite', 1, ['parser'])).all()
+        # Undated events take the day they were created
+        assert connection.scalar(text('SELECT date FROM events WHERE id = 2')) == '2025-09-03'
+
+    with Session(engine) as session:
+        snapshot = changes(session, 1)
+    assert snapshot['full']
+    assert [item['title'] for item in snapshot['courses']['updated']] == ['Compilers']
+    assert len(snapshot['attendance']['updated']) == 2
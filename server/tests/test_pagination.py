@@ -0,0 +1,60 @@
+from pagination import decode_cursor, encode_cursor
+from models import Event
+
+def _pages(client, path, **params):
+    items, cursor = [], None
+    while True:
+        response = client.get(path, params={**params, **({'cursor': cursor} if cursor else {})})
+        assert response.status_code == 200, response.body
+        items.extend(response.json)
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            return items
+
+def test_cursor_round_trip():
+    token = encode_cursor(Event.date.type.python_type(2026, 3, 2), 17)
+    assert decode_cursor(token, Event.date) == (Event.date.type.python_type(2026, 3, 2), 17)
+
+def test_invalid_cursor(client):
+    response = client.get('/api/courses', params={'cursor': 'not-a-cursor'})
+    assert response.status_code == 400
+
+def test_invalid_limit(client):
+    assert client.get('/api/courses', params={'limit': '0'}).status_code == 400
+    assert client.get('/api/courses', params={'limit': 'ten'}).status_code == 400
+
+def test_courses_pages_cover_every_row_once(client):
+    ids = [client.add_course(title=f'Course {n}')['id'] for n in range(7)]
+    items = _pages(client, '/api/courses', limit=3)
+    assert sorted(item['id'] for item in items) == sorted(ids)
+
+def test_events_pages_follow_date_then_id(client):
+    course = client.add_course()
+    # Several events share a date, so the id breaks ties between pages
+    for day in ('2026-03-04', '2026-03-02', '2026-03-02', '2026-03-03', '2026-03-02'):
+        client.add_event(course['id'], date=day)
+    items = _pages(client, '/api/events', limit=2)
+    assert [(item['date'], item['id']) for item in items] == sorted((item['date'], item['id']) for item in items)
+    assert len(items) == 5
+
+def test_last_page_has_no_cursor(client):
+    client.add_course()
+    response = client.get('/api/courses', params={'limit': 5})
+    assert response.status_code == 200
+    assert 'X-Next-Cursor' not in response.headers
+
+def test_pages_only_show_own_rows(api):
+    alice, bob = api.user('alice'), api.user('bob')
+    alice.add_course(title='Alice')
+    bob.add_course(title='Bob')
+    assert [item['title'] for item in _pages(alice, '/api/courses', limit=1)] == ['Alice']
+
+def test_rows_added_while_paging_are_not_repeated(client):
+    course = client.add_course()
+    for day in ('2026-03-02', '2026-03-03', '2026-03-04'):
+        client.add_event(course['id'], date=day)
+    first = client.get('/api/events', params={'limit': 2})
+    # A row sorting before the cursor does not shift the next page
+    client.add_event(course['id'], date='2026-03-01')
+    rest = client.get('/api/events', params={'limit': 2, 'cursor': first.headers['X-Next-Cursor']}).json
+    assert [item['date'] for item in first.json + rest] == ['2026-03-02', '2026-03-03', '2026-03-04']
@@ -0,0 +1,18 @@
+from models import Recommendation
+
+KEYS = {'id', 'courseId', 'title', 'description', 'priority'}
+
+def test_payloads_match_across_endpoints(api, client):
+    client.add_course(endDate='2026-01-10')
+    client.post('/api/recommendations/refresh')
+    api.run_jobs()
+
+    listed = client.get('/api/recommendations').json
+    assert listed and all(set(item) == KEYS for item in listed)
+    snapshot = client.get('/api/dashboard', params={'sections': 'recommendations'}).json
+    assert snapshot['recommendations'] == listed
+
+def test_model_payload():
+    row = Recommendation(id=1, course_id=2, title='Review', content='Chapter 2', priority='high')
+    assert row.to_dict() == {'id': 1, 'courseId': 2, 'title': 'Review', 'description': 'Chapter 2',
+                             'priority': 'high'}
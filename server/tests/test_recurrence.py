@@ -0,0 +1,77 @@
+from datetime import date
+import pytest
+from sqlalchemy import select
+from insights import rebuild, verify
+from models import WeeklyInsight
+from recurrence import SERIES_OPEN, normalize_rule, occurrences, parse_rule, series_end
+
+def test_weekly_by_day_inside_a_window():
+    rule = parse_rule('RRULE:FREQ=WEEKLY;BYDAY=MO,WE')
+    days = list(occurrences(date(2026, 3, 2), rule, date(2026, 3, 9), date(2026, 3, 18)))
+    assert days == [date(2026, 3, 9), date(2026, 3, 11), date(2026, 3, 16), date(2026, 3, 18)]
+
+def test_count_limits_from_the_first_occurrence():
+    rule = parse_rule('FREQ=DAILY;INTERVAL=2;COUNT=3')
+    assert list(occurrences(date(2026, 1, 1), rule, date(2026, 1, 4))) == [date(2026, 1, 5)]
+
+def test_monthly_skips_short_months():
+    rule = parse_rule('FREQ=MONTHLY;COUNT=3')
+    assert list(occurrences(date(2026, 1, 31), rule)) == [date(2026, 1, 31), date(2026, 3, 31), date(2026, 5, 31)]
+
+def test_series_end():
+    assert series_end(date(2026, 3, 2), None) is None
+    assert series_end(date(2026, 3, 2), 'FREQ=WEEKLY') == SERIES_OPEN
+    assert series_end(date(2026, 3, 2), 'FREQ=WEEKLY;UNTIL=20260320') == date(2026, 3, 16)
+    assert series_end(date(2026, 3, 2), 'FREQ=DAILY;COUNT=5') == date(2026, 3, 6)
+
+@pytest.mark.parametrize('text', ['FREQ=YEARLY', 'FREQ=DAILY;BYDAY=MO', 'FREQ=DAILY;COUNT=2;UNTIL=20260101',
+                                  'FREQ=WEEKLY;INTERVAL=0', 'FREQ=WEEKLY;BYSETPOS=1'])
+def test_invalid_rules(text):
+    with pytest.raises(ValueError):
+        parse_rule(text)
+
+def test_normalize_rule():
+    assert normalize_rule(' ') is None
+    assert normalize_rule('rrule:freq=weekly;byday=we,mo;interval=1') == 'FREQ=WEEKLY;BYDAY=MO,WE'
+
+def test_calendar_merges_series_and_one_off_events(client):
+    course = client.add_course()
+    client.add_event(course['id'], title='Seminar', date='2026-03-02', time='09:00', recurrence='FREQ=WEEKLY;COUNT=3')
+    client.add_event(course['id'], title='Exam', date='2026-03-09', time='08:00')
+    client.add_event(course['id'], title='Outside', date='2026-04-20')
+
+    response = client.get('/api/calendar', params={'from': '2026-03-03', 'to': '2026-03-31'})
+    assert response.status_code == 200
+    assert [(item['date'], item['title']) for item in response.json] == [
+        ('2026-03-09', 'Exam'), ('2026-03-09', 'Seminar'), ('2026-03-16', 'Seminar'),
+    ]
+
+def test_calendar_rejects_inverted_window(client):
+    response = client.get('/api/calendar', params={'from': '2026-03-31', 'to': '2026-03-01'})
+    assert response.status_code == 400
+
+def test_event_with_invalid_recurrence(client):
+    course = client.add_course()
+    response = client.post('/api/events', json={'courseId': course['id'], 'title': 'x', 'date': '2026-03-02',
+                                                'time': '10:00', 'type': 'class', 'recurrence': 'FREQ=HOURLY'})
+    assert response.status_code == 400
+
+def test_recurring_deadlines_count_every_occurrence(api, client):
+    course = client.add_course()
+    series = client.add_event(course['id'], title='Problem set', date='2026-03-02', type='assignment',
+                              recurrence='FREQ=WEEKLY;COUNT=3')
+    client.add_event(course['id'], title='Midterm', date='2026-03-04', type='exam')
+    deadlines = select(WeeklyInsight.week_starting, WeeklyInsight.deadlines) \
+        .where(WeeklyInsight.user_id == client.user_id).order_by(WeeklyInsight.week_starting)
+
+    expected = [(date(2026, 3, 2), 2), (date(2026, 3, 9), 1), (date(2026, 3, 16), 1)]
+    with api.engine.begin() as connection:
+        assert [tuple(row) for row in connection.execute(deadlines)] == expected
+        assert verify(connection) == []
+        rebuild(connection)
+        assert [tuple(row) for row in connection.execute(deadlines)] == expected
+
+    client.delete(f"/api/events/{series['id']}")
+    with api.engine.connect() as connection:
+        assert [tuple(row) for row in connection.execute(deadlines) if row.deadlines] == [(date(2026, 3, 2), 1)]
+        assert verify(connection) == []
@@ -0,0 +1,25 @@
+import pytest
+from app import create_app
+from conftest import COURSE
+
+@pytest.fixture
+def flask_app(settings):
+    return create_app({**settings, 'LIVE_COALESCE_MS': 0, 'LIVE_HEARTBEAT_SECONDS': 0.05})
+
+def test_stream_names_changed_resources(flask_app):
+    client = flask_app.test_client()
+    client.post('/api/auth/register', json={'username': 'ada', 'email': 'ada@example.com',
+                                            'password': 'secret-password'})
+    response = client.get('/api/stream', buffered=False)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    chunks = response.iter_encoded()
+    assert next(chunks) == b'retry: 5000\n\n'
+    assert next(chunks) == b': keep-alive\n\n'
+
+    client.post('/api/courses', json=COURSE)
+    assert next(chunks) == b'event: change\ndata: {"resources":["courses","recommendations"]}\n\n'
+    response.close()
+
+def test_stream_requires_login(flask_app):
+    assert flask_app.test_client().get('/api/stream').status_code == 401
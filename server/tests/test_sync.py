@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta
+from sync import TOMBSTONE_RETENTION, encode_token
+
+def test_first_sync_is_a_full_snapshot(client):
+    course = client.add_course()
+    response = client.get('/api/sync')
+    assert response.status_code == 200
+    assert response.json['full']
+    assert [item['id'] for item in response.json['courses']['updated']] == [course['id']]
+    assert response.json['courses']['deleted'] == []
+
+def test_deletions_come_back_as_tombstones(client):
+    course = client.add_course()
+    event = client.add_event(course['id'])
+    token = client.get('/api/sync').json['token']
+
+    assert client.delete(f"/api/events/{event['id']}").status_code == 204
+    delta = client.get('/api/sync', params={'since': token}).json
+    assert not delta['full']
+    assert delta['events'] == {'updated': [], 'deleted': [event['id']]}
+
+def test_tombstones_are_per_user(api):
+    alice, bob = api.user('alice'), api.user('bob')
+    token = bob.get('/api/sync').json['token']
+    course = alice.add_course()
+    alice.delete(f"/api/courses/{course['id']}")
+    delta = bob.get('/api/sync', params={'since': token}).json
+    assert delta['courses'] == {'updated': [], 'deleted': []}
+
+def test_expired_token_gets_a_snapshot(client):
+    token = encode_token(datetime.utcnow() - TOMBSTONE_RETENTION - timedelta(days=1))
+    assert client.get('/api/sync', params={'since': token}).json['full']
+
+def test_invalid_token(client):
+    assert client.get('/api/sync', params={'since': 'nonsense'}).status_code == 400
+
+def test_changed_rows_come_back_as_updates(client):
+    course = client.add_course()
+    token = client.get('/api/sync').json['token']
+    client.put(f"/api/courses/{course['id']}", json={'completedSections': 4})
+    delta = client.get('/api/sync', params={'since': token}).json
+    assert [(item['id'], item['completedSections']) for item in delta['courses']['updated']] == [(course['id'], 4)]
+    assert delta['events'] == {'updated': [], 'deleted': []}
@@ -0,0 +1,5 @@
+from app import create_app
+
+# The app gunicorn serves (wsgi:app)
+
+app = create_app()
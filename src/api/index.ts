@@ -11,6 +11,42 @@ const api = axios.create({
   withCredentials: true, // Important for session cookies
 });
 
+// Paginated list endpoints return the cursor for the next page in a header
+export interface ListParams {
+  limit?: number;
+  cursor?: string;
+  from?: string;
+  to?: string;
+  courseId?: string;
+  status?: string;
+  type?: string;
+}
+
+export interface Page<T> {
+  items: T[];
+  nextCursor: string | null;
+}
+
+const fetchPage = async <T>(url: string, params?: ListParams): Promise<Page<T>> => {
+  const response = await api.get(url, { params });
+  return {
+    items: response.data,
+    nextCursor: response.headers['x-next-cursor'] ?? null,
+  };
+};
+
+// Every page of a list, following the cursors
+const fetchAll = async <T>(url: string, params?: ListParams): Promise<T[]> => {
+  const items: T[] = [];
+  let cursor = params?.cursor;
+  do {
+    const page = await fetchPage<T>(url, { ...params, cursor });
+    items.push(...page.items);
+    cursor = page.nextCursor ?? undefined;
+  } while (cursor);
+  return items;
+};
+
 // Auth API
 export const login = async (email: string, password: string) => {
   const response = await api.post('/auth/login', { email, password });
@@ -32,60 +68,202 @@ export const getCurrentUser = async () => {
   return response.data;
 };
 
-// Courses API
-export const fetchCourses = async (): Promise<Course[]> => {
-  const response = await api.get('/courses');
-  return response.data;
+// A POST retried with the same Idempotency-Key is applied once; the server replays the
+// first response. The key is minted once per operation and reused for each of its retries,
+// which cover lost responses and a first attempt that is still in progress (409 with
+// Retry-After; other conflicts are final).
+const RETRY_DELAYS_MS = [250, 1000, 4000];
+
+const retryable = (error: unknown) =>
+  axios.isAxiosError(error) &&
+  (error.response === undefined ||
+    (error.response.status === 409 && error.response.headers['retry-after'] !== undefined));
+
+const postIdempotent = async <T>(url: string, body: unknown, key: string = crypto.randomUUID()): Promise<T> => {
+  const config = { headers: { 'Idempotency-Key': key } };
+  for (let attempt = 0; ; attempt++) {
+    try {
+      const response = await api.post(url, body, config);
+      return response.data;
+    } catch (error) {
+      if (attempt >= RETRY_DELAYS_MS.length || !retryable(error)) throw error;
+      await new Promise((resolve) => setTimeout(resolve, RETRY_DELAYS_MS[attempt]));
+    }
+  }
 };
 
-export const addCourse = async (course: Omit<Course, 'id'>): Promise<Course> => {
-  const response = await api.post('/courses', course);
+// Only apply an update if the record is still at the version we last saw
+const ifMatch = (version?: number) => (version === undefined ? {} : { headers: { 'If-Match': `"${version}"` } });
+
+// Courses API
+export const fetchCourses = (params?: ListParams): Promise<Course[]> => fetchAll<Course>('/courses', params);
+
+export const addCourse = (course: Omit<Course, 'id'>, key?: string): Promise<Course> =>
+  postIdempotent<Course>('/courses', course, key);
+
+export const updateCourseProgress = async (
+  courseId: string,
+  completedSections: number,
+  version?: number
+): Promise<Course> => {
+  const response = await api.put(`/courses/${courseId}`, { completedSections }, ifMatch(version));
   return response.data;
 };
 
-export const updateCourseProgress = async (courseId: string, completedSections: number): Promise<Course> => {
-  const response = await api.put(`/courses/${courseId}`, { completedSections });
+// Completes `count` more sections; concurrent increments add up
+export const completeSections = async (courseId: string, count = 1): Promise<Course> => {
+  const response = await api.put(`/courses/${courseId}`, { completeSections: count });
   return response.data;
 };
 
+// Resized cover image, served from the server's thumbnail cache
+export const COURSE_IMAGE_WIDTHS = [160, 320, 640];
+
+export const courseImageUrl = (courseId: string, width: number) => `${API_URL}/images/${courseId}?w=${width}`;
+
+export const courseImageSrcSet = (courseId: string) =>
+  COURSE_IMAGE_WIDTHS.map((width) => `${courseImageUrl(courseId, width)} ${width}w`).join(', ');
+
 // Events API
-export const fetchEvents = async (): Promise<CalendarEvent[]> => {
-  const response = await api.get('/events');
+export const fetchEvents = (params?: ListParams): Promise<CalendarEvent[]> =>
+  fetchAll<CalendarEvent>('/events', params);
+
+export const fetchEventsPage = (params?: ListParams) => fetchPage<CalendarEvent>('/events', params);
+
+// Events expanded into one entry per occurrence between `from` and `to`
+export interface CalendarParams {
+  from?: string;
+  to?: string;
+  days?: number;
+  courseId?: string;
+  type?: CalendarEvent['type'];
+}
+
+export const fetchCalendar = async (params?: CalendarParams): Promise<CalendarEvent[]> => {
+  const response = await api.get('/calendar', { params });
   return response.data;
 };
 
-export const addEvent = async (event: Omit<CalendarEvent, 'id'>): Promise<CalendarEvent> => {
-  const response = await api.post('/events', event);
+// Events and attendance from closed terms, moved out of the database by archive.py
+export interface ArchiveParams {
+  from?: string;
+  to?: string;
+  courseId?: string;
+}
+
+export const fetchArchivedEvents = async (params?: ArchiveParams): Promise<CalendarEvent[]> => {
+  const response = await api.get('/events/archive', { params });
   return response.data;
 };
 
+export const addEvent = (event: Omit<CalendarEvent, 'id'>, key?: string): Promise<CalendarEvent> =>
+  postIdempotent<CalendarEvent>('/events', event, key);
+
 export const removeEvent = async (eventId: string): Promise<void> => {
   await api.delete(`/events/${eventId}`);
 };
 
 // Attendance API
-export const fetchAttendance = async (): Promise<AttendanceRecord[]> => {
-  const response = await api.get('/attendance');
-  return response.data;
-};
+export const fetchAttendance = (params?: ListParams): Promise<AttendanceRecord[]> =>
+  fetchAll<AttendanceRecord>('/attendance', params);
+
+export const fetchAttendancePage = (params?: ListParams) => fetchPage<AttendanceRecord>('/attendance', params);
 
-export const addAttendanceRecord = async (record: Omit<AttendanceRecord, 'id'>): Promise<AttendanceRecord> => {
-  const response = await api.post('/attendance', record);
+export const fetchArchivedAttendance = async (params?: ArchiveParams): Promise<AttendanceRecord[]> => {
+  const response = await api.get('/attendance/archive', { params });
   return response.data;
 };
 
+export const addAttendanceRecord = (record: Omit<AttendanceRecord, 'id'>, key?: string): Promise<AttendanceRecord> =>
+  postIdempotent<AttendanceRecord>('/attendance', record, key);
+
 export const updateAttendanceRecord = async (
   recordId: string, 
   status: AttendanceRecord['status'], 
-  notes?: string
+  notes?: string,
+  version?: number
 ): Promise<AttendanceRecord> => {
-  const response = await api.put(`/attendance/${recordId}`, { status, notes });
+  const response = await api.put(`/attendance/${recordId}`, { status, notes }, ifMatch(version));
+  return response.data;
+};
+
+export interface AttendanceMarkResult {
+  created: AttendanceRecord[];
+  updated: (AttendanceRecord & { previousStatus: AttendanceRecord['status'] })[];
+  unchanged: number;
+}
+
+export const markAttendance = async (
+  marks: Omit<AttendanceRecord, 'id'>[]
+): Promise<AttendanceMarkResult> => {
+  const response = await api.post('/attendance/mark', { marks });
   return response.data;
 };
 
 // Recommendations API
-export const fetchRecommendations = async (): Promise<StudyRecommendation[]> => {
-  const response = await api.get('/recommendations');
+export const fetchRecommendations = (params?: ListParams): Promise<StudyRecommendation[]> =>
+  fetchAll<StudyRecommendation>('/recommendations', params);
+
+// Dashboard API: every collection in a single request
+export interface DashboardSnapshot {
+  courses: Course[];
+  events: CalendarEvent[];
+  attendance: AttendanceRecord[];
+  recommendations: StudyRecommendation[];
+  insights: WeeklyInsight[];
+}
+
+export const fetchDashboard = async (sections?: (keyof DashboardSnapshot)[]): Promise<DashboardSnapshot> => {
+  const params = sections ? { sections: sections.join(',') } : undefined;
+  const response = await api.get('/dashboard', { params });
+  return response.data;
+};
+
+// Sync API: rows changed or deleted since the token of the previous sync
+export interface SyncDelta<T> {
+  updated: T[];
+  deleted: number[];
+}
+
+export interface SyncChanges {
+  token: string;
+  full: boolean;
+  courses: SyncDelta<Course>;
+  events: SyncDelta<CalendarEvent>;
+  attendance: SyncDelta<AttendanceRecord>;
+  recommendations: SyncDelta<StudyRecommendation>;
+}
+
+export const syncChanges = async (since?: string): Promise<SyncChanges> => {
+  const response = await api.get('/sync', { params: since ? { since } : undefined });
+  return response.data;
+};
+
+// Live updates: names of the collections that changed, pushed over SSE.
+// Returns a function that closes the stream.
+export type ChangedResource = 'courses' | 'events' | 'attendance' | 'recommendations' | 'insights';
+
+export const subscribeChanges = (onChange: (resources: ChangedResource[]) => void): (() => void) => {
+  const source = new EventSource(`${API_URL}/stream`, { withCredentials: true });
+  source.addEventListener('change', (event) => {
+    onChange(JSON.parse((event as MessageEvent).data).resources);
+  });
+  return () => source.close();
+};
+
+// Search across courses, events, attendance notes and recommendations
+export type SearchType = 'courses' | 'events' | 'attendance' | 'recommendations';
+
+export interface SearchResult {
+  type: SearchType;
+  id: number;
+  courseId: number;
+  title: string | null;
+  snippet: string | null;
+}
+
+export const searchAll = async (q: string, types?: SearchType[], limit?: number): Promise<SearchResult[]> => {
+  const response = await api.get('/search', { params: { q, types: types?.join(','), limit } });
   return response.data;
 };
 
@@ -95,6 +273,73 @@ export const fetchInsights = async (): Promise<WeeklyInsight[]> => {
   return response.data;
 };
 
+// Analytics: aggregates computed on the server, one entry per bucket
+export interface CourseAttendanceRate {
+  courseId: number;
+  title: string;
+  present: number;
+  total: number;
+  rate: number | null;
+}
+
+export interface WeeklyAttendanceRate {
+  weekStarting: string;
+  present: number;
+  total: number;
+  rate: number | null;
+  runningRate: number | null;
+}
+
+export interface ProgressDistribution {
+  buckets: { from: number; to: number; courses: number }[];
+  courses: number;
+  averageProgress: number | null;
+  completedSections: number;
+  totalSections: number;
+  overallProgress: number;
+}
+
+export interface WeeklyDeadlines {
+  weekStarting: string;
+  total: number;
+  deadline: number;
+  exam: number;
+  assignment: number;
+}
+
+export interface StudyStreak {
+  current: number;
+  currentSince: string | null;
+  longest: number;
+  activeDays: number;
+  lastActive: string | null;
+}
+
+export const fetchAttendanceByCourse = async (): Promise<CourseAttendanceRate[]> => {
+  const response = await api.get('/analytics/attendance', { params: { by: 'course' } });
+  return response.data;
+};
+
+export const fetchAttendanceByWeek = async (weeks?: number): Promise<WeeklyAttendanceRate[]> => {
+  const response = await api.get('/analytics/attendance', { params: { by: 'week', weeks } });
+  return response.data;
+};
+
+export const fetchProgressDistribution = async (): Promise<ProgressDistribution> => {
+  const response = await api.get('/analytics/progress');
+  return response.data;
+};
+
+export const fetchDeadlinesByWeek = async (from?: string, weeks?: number): Promise<WeeklyDeadlines[]> => {
+  const response = await api.get('/analytics/deadlines', { params: { from, weeks } });
+  return response.data;
+};
+
+export const fetchStreak = async (): Promise<StudyStreak> => {
+  const response = await api.get('/analytics/streak');
+  return response.data;
+};
+
 export default {
   login,
   register,
@@ -103,12 +348,26 @@ export default {
   fetchCourses,
   addCourse,
   updateCourseProgress,
+  completeSections,
   fetchEvents,
+  fetchEventsPage,
+  fetchCalendar,
   addEvent,
   removeEvent,
   fetchAttendance,
+  fetchAttendancePage,
   addAttendanceRecord,
   updateAttendanceRecord,
+  markAttendance,
   fetchRecommendations,
   fetchInsights,
+  fetchDashboard,
+  syncChanges,
+  subscribeChanges,
+  searchAll,
+  fetchAttendanceByCourse,
+  fetchAttendanceByWeek,
+  fetchProgressDistribution,
+  fetchDeadlinesByWeek,
+  fetchStreak,
 };
\ No newline at end of file
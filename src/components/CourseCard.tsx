@@ -2,6 +2,7 @@ import React from 'react';
 import { ExternalLink, BookOpen } from 'lucide-react';
 import { Course } from '../types';
 import { useDashboard } from '../context/DashboardContext';
+import { courseImageUrl, courseImageSrcSet } from '../api';
 
 interface CourseCardProps {
   course: Course;
@@ -36,7 +37,10 @@ const CourseCard: React.FC<CourseCardProps> = ({ course }) => {
     <div className="bg-white rounded-lg shadow-md overflow-hidden">
       <div className="h-40 overflow-hidden relative">
         <img 
-          src={course.imageUrl} 
+          src={course.imageUrl ? courseImageUrl(course.id, 320) : undefined}
+          srcSet={course.imageUrl ? courseImageSrcSet(course.id) : undefined}
+          sizes="(min-width: 1024px) 33vw, (min-width: 768px) 50vw, 100vw"
+          loading="lazy"
           alt={course.title} 
           className="w-full h-full object-cover"
         />
@@ -37,12 +37,12 @@ const InsightsChart: React.FC = () => {
     new Date(insight.weekStarting).toLocaleDateString(undefined, { month: 'short', day: 'numeric' })
   );
   
-  const studyHoursData: ChartData<'line'> = {
+  const sectionsData: ChartData<'line'> = {
     labels,
     datasets: [
       {
-        label: 'Hours Studied',
-        data: sortedInsights.map(insight => insight.hoursStudied),
+        label: 'Sections Completed',
+        data: sortedInsights.map(insight => insight.sectionsCompleted),
         borderColor: 'rgb(99, 102, 241)',
         backgroundColor: 'rgba(99, 102, 241, 0.5)',
         tension: 0.3,
@@ -80,9 +80,9 @@ const InsightsChart: React.FC = () => {
   return (
     <div className="grid grid-cols-1 lg:grid-cols-2 gap-6">
       <div className="bg-white p-4 rounded-lg shadow-md">
-        <h3 className="text-lg font-medium mb-4">Weekly Study Hours</h3>
+        <h3 className="text-lg font-medium mb-4">Weekly Sections Completed</h3>
         <Line 
-          data={studyHoursData} 
+          data={sectionsData} 
           options={{
             responsive: true,
             scales: {
@@ -90,7 +90,7 @@ const InsightsChart: React.FC = () => {
                 beginAtZero: true,
                 title: {
                   display: true,
-                  text: 'Hours'
+                  text: 'Sections'
                 }
               }
             }
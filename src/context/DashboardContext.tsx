@@ -60,25 +60,13 @@ export const DashboardProvider: React.FC<DashboardProviderProps> = ({ children }
       
       try {
         setLoading(true);
-        const [
-          coursesData,
-          eventsData,
-          attendanceData,
-          recommendationsData,
-          insightsData
-        ] = await Promise.all([
-          api.fetchCourses(),
-          api.fetchEvents(),
-          api.fetchAttendance(),
-          api.fetchRecommendations(),
-          api.fetchInsights()
-        ]);
-
-        setCourses(coursesData);
-        setEvents(eventsData);
-        setAttendance(attendanceData);
-        setRecommendations(recommendationsData);
-        setInsights(insightsData);
+        const snapshot = await api.fetchDashboard();
+
+        setCourses(snapshot.courses);
+        setEvents(snapshot.events);
+        setAttendance(snapshot.attendance);
+        setRecommendations(snapshot.recommendations);
+        setInsights(snapshot.insights);
         setError(null);
       } catch (err) {
         console.error('Error fetching data:', err);
@@ -91,6 +79,27 @@ export const DashboardProvider: React.FC<DashboardProviderProps> = ({ children }
     fetchData();
   }, [isAuthenticated]);
 
+  // Refetch the collections another tab, device or background job changed
+  useEffect(() => {
+    if (!isAuthenticated) {
+      return;
+    }
+
+    return api.subscribeChanges(async (resources) => {
+      try {
+        const snapshot = await api.fetchDashboard(resources);
+
+        if (resources.includes('courses')) setCourses(snapshot.courses);
+        if (resources.includes('events')) setEvents(snapshot.events);
+        if (resources.includes('attendance')) setAttendance(snapshot.attendance);
+        if (resources.includes('recommendations')) setRecommendations(snapshot.recommendations);
+        if (resources.includes('insights')) setInsights(snapshot.insights);
+      } catch (err) {
+        console.error('Error refreshing data:', err);
+      }
+    });
+  }, [isAuthenticated]);
+
   const addCourse = async (course: Omit<Course, 'id'>) => {
     try {
       const newCourse = await api.addCourse(course);
@@ -103,7 +112,8 @@ export const DashboardProvider: React.FC<DashboardProviderProps> = ({ children }
 
   const updateCourseProgress = async (courseId: string, completedSections: number) => {
     try {
-      const updatedCourse = await api.updateCourseProgress(courseId, completedSections);
+      const current = courses.find((course) => course.id === courseId);
+      const updatedCourse = await api.updateCourseProgress(courseId, completedSections, current?.version);
       setCourses(
         courses.map((course) => {
           if (course.id === courseId) {
@@ -150,7 +160,8 @@ export const DashboardProvider: React.FC<DashboardProviderProps> = ({ children }
 
   const updateAttendanceRecord = async (recordId: string, status: AttendanceRecord['status'], notes?: string) => {
     try {
-      const updatedRecord = await api.updateAttendanceRecord(recordId, status, notes);
+      const current = attendance.find((record) => record.id === recordId);
+      const updatedRecord = await api.updateAttendanceRecord(recordId, status, notes, current?.version);
       setAttendance(
         attendance.map((record) => {
           if (record.id === recordId) {
@@ -184,28 +184,28 @@ export const mockRecommendations: StudyRecommendation[] = [
 export const mockInsights: WeeklyInsight[] = [
   {
     weekStarting: getRelativeDate(-7),
-    hoursStudied: 18,
+    sectionsCompleted: 6,
     coursesProgressed: 3,
     attendanceRate: 85,
     upcomingDeadlines: 2,
   },
   {
     weekStarting: getRelativeDate(-14),
-    hoursStudied: 15,
+    sectionsCompleted: 5,
     coursesProgressed: 2,
     attendanceRate: 75,
     upcomingDeadlines: 1,
   },
   {
     weekStarting: getRelativeDate(-21),
-    hoursStudied: 20,
+    sectionsCompleted: 6,
     coursesProgressed: 4,
     attendanceRate: 90,
     upcomingDeadlines: 3,
   },
   {
     weekStarting: getRelativeDate(-28),
-    hoursStudied: 12,
+    sectionsCompleted: 4,
     coursesProgressed: 2,
     attendanceRate: 80,
     upcomingDeadlines: 2,
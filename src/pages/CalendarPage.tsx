@@ -1,5 +1,7 @@
-import React, { useState } from 'react';
+import React, { useEffect, useState } from 'react';
 import { useDashboard } from '../context/DashboardContext';
+import { CalendarEvent } from '../types';
+import api from '../api';
 import EventCard from '../components/EventCard';
 import AddEventForm from '../components/AddEventForm';
 import LoadingSpinner from '../components/LoadingSpinner';
@@ -12,13 +14,42 @@ const CalendarPage: React.FC = () => {
   const [showAddForm, setShowAddForm] = useState(false);
   const [currentMonth, setCurrentMonth] = useState(new Date());
   const [selectedDate, setSelectedDate] = useState(new Date());
+  const [occurrences, setOccurrences] = useState<CalendarEvent[]>([]);
+  const [calendarError, setCalendarError] = useState<string | null>(null);
+  
+  // One entry per occurrence in the month, so recurring events show on every
+  // day they fall on; refetched whenever the dashboard's events change
+  useEffect(() => {
+    let cancelled = false;
+    api
+      .fetchCalendar({
+        from: format(startOfMonth(currentMonth), 'yyyy-MM-dd'),
+        to: format(endOfMonth(currentMonth), 'yyyy-MM-dd'),
+      })
+      .then((items) => {
+        if (!cancelled) {
+          setOccurrences(items);
+          setCalendarError(null);
+        }
+      })
+      .catch((err) => {
+        console.error('Error fetching calendar:', err);
+        if (!cancelled) {
+          setCalendarError('Failed to load the calendar. Please try again later.');
+        }
+      });
+    return () => {
+      cancelled = true;
+    };
+  }, [currentMonth, events]);
   
   if (loading) {
     return <LoadingSpinner />;
   }
   
-  if (error) {
-    return <ErrorMessage message={error} />;
+  const failure = error || calendarError;
+  if (failure) {
+    return <ErrorMessage message={failure} />;
   }
   
   const monthStart = startOfMonth(currentMonth);
@@ -28,12 +59,12 @@ const CalendarPage: React.FC = () => {
   const nextMonth = () => setCurrentMonth(addMonths(currentMonth, 1));
   const prevMonth = () => setCurrentMonth(subMonths(currentMonth, 1));
   
-  const eventsForSelectedDate = events.filter(event => 
+  const eventsForSelectedDate = occurrences.filter(event => 
     isSameDay(new Date(event.date), selectedDate)
   );
   
   const getEventsForDay = (day: Date) => {
-    return events.filter(event => isSameDay(new Date(event.date), day));
+    return occurrences.filter(event => isSameDay(new Date(event.date), day));
   };
 
   return (
@@ -114,7 +145,7 @@ const CalendarPage: React.FC = () => {
                       <div className="mt-1">
                         {dayEvents.slice(0, 2).map((event, index) => (
                           <div
-                            key={event.id}
+                            key={`${event.id}-${event.date}`}
                             className={`text-xs truncate px-1 py-0.5 rounded mt-0.5 ${
                               event.type === 'deadline'
                                 ? 'bg-red-100 text-red-800'
@@ -158,7 +189,7 @@ const CalendarPage: React.FC = () => {
             <div className="space-y-4">
               {eventsForSelectedDate.length > 0 ? (
                 eventsForSelectedDate.map((event) => (
-                  <EventCard key={event.id} event={event} />
+                  <EventCard key={`${event.id}-${event.date}`} event={event} />
                 ))
               ) : (
                 <p className="text-gray-500 text-sm">No events scheduled for this day.</p>
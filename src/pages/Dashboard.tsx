@@ -90,10 +90,10 @@ const Dashboard: React.FC = () => {
         
         <div className="bg-white rounded-lg shadow-md p-6">
           <div className="flex items-center justify-between mb-4">
-            <h3 className="text-lg font-medium text-gray-700">Study Time</h3>
+            <h3 className="text-lg font-medium text-gray-700">Sections Completed</h3>
             <Lightbulb className="text-yellow-600" size={24} />
           </div>
-          <p className="text-3xl font-bold text-gray-800">{latestInsight?.hoursStudied || 0}h</p>
+          <p className="text-3xl font-bold text-gray-800">{latestInsight?.sectionsCompleted || 0}</p>
           <p className="text-sm text-gray-500 mt-1">This week</p>
         </div>
       </div>
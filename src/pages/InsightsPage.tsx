@@ -1,12 +1,21 @@
-import React from 'react';
+import React, { useEffect, useState } from 'react';
 import InsightsChart from '../components/InsightsChart';
 import { useDashboard } from '../context/DashboardContext';
 import LoadingSpinner from '../components/LoadingSpinner';
 import ErrorMessage from '../components/ErrorMessage';
 import { Clock, BookOpen, CheckCircle, Calendar } from 'lucide-react';
+import api, { CourseAttendanceRate } from '../api';
 
 const InsightsPage: React.FC = () => {
   const { insights, courses, attendance, loading, error } = useDashboard();
+  const [attendanceRates, setAttendanceRates] = useState<CourseAttendanceRate[]>([]);
+  
+  // Per-course counts from the server; refetched when the records change
+  useEffect(() => {
+    api.fetchAttendanceByCourse()
+      .then(setAttendanceRates)
+      .catch((err) => console.error('Error fetching attendance rates:', err));
+  }, [attendance]);
   
   if (loading) {
     return <LoadingSpinner />;
@@ -22,8 +31,8 @@ const InsightsPage: React.FC = () => {
   )[0];
   
   // Calculate overall attendance rate
-  const totalAttendance = attendance.length;
-  const presentAttendance = attendance.filter(record => record.status === 'present').length;
+  const totalAttendance = attendanceRates.reduce((sum, rate) => sum + rate.total, 0);
+  const presentAttendance = attendanceRates.reduce((sum, rate) => sum + rate.present, 0);
   const attendanceRate = totalAttendance > 0 
     ? Math.round((presentAttendance / totalAttendance) * 100) 
     : 0;
@@ -66,10 +75,10 @@ const InsightsPage: React.FC = () => {
       <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-4 gap-6 mb-8">
         <div className="bg-white rounded-lg shadow-md p-6">
           <div className="flex items-center justify-between mb-4">
-            <h3 className="text-lg font-medium text-gray-700">Study Time</h3>
+            <h3 className="text-lg font-medium text-gray-700">Sections Completed</h3>
             <Clock className="text-indigo-600" size={24} />
           </div>
-          <p className="text-3xl font-bold text-gray-800">{latestInsight?.hoursStudied || 0}h</p>
+          <p className="text-3xl font-bold text-gray-800">{latestInsight?.sectionsCompleted || 0}</p>
           <p className="text-sm text-gray-500 mt-1">This week</p>
         </div>
         
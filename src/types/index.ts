@@ -17,6 +17,7 @@ export interface Course {
   endDate: string;
   imageUrl: string;
   userId?: number;
+  version?: number; // sent back as If-Match on updates
 }
 
 export interface CalendarEvent {
@@ -27,6 +28,7 @@ export interface CalendarEvent {
   type: 'deadline' | 'lecture' | 'exam' | 'assignment';
   courseId: string;
   description?: string;
+  recurrence?: string | null; // e.g. FREQ=WEEKLY;BYDAY=MO,WE;UNTIL=20261220
 }
 
 export interface AttendanceRecord {
@@ -35,6 +37,7 @@ export interface AttendanceRecord {
   date: string;
   status: 'present' | 'absent' | 'excused';
   notes?: string;
+  version?: number;
 }
 
 export interface StudyRecommendation {
@@ -47,8 +50,8 @@ export interface StudyRecommendation {
 
 export interface WeeklyInsight {
   weekStarting: string;
-  hoursStudied: number;
+  sectionsCompleted: number;
   coursesProgressed: number;
-  attendanceRate: number;
+  attendanceRate: number | null;
   upcomingDeadlines: number;
 }
\ No newline at end of file